@@ -0,0 +1,37 @@
+"""add file manifest table and documents.source
+
+Revision ID: 0002_file_manifest
+Revises: 0001_initial
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0002_file_manifest"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("documents") as batch:
+        batch.add_column(sa.Column("source", sa.String, nullable=True))
+        batch.create_index("ix_documents_source", ["source"])
+    op.create_table(
+        "files",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("path", sa.String, nullable=False, unique=True, index=True),
+        sa.Column("size", sa.Integer),
+        sa.Column("mtime", sa.Float),
+        sa.Column("content_hash", sa.String),
+        sa.Column("n_chunks", sa.Integer),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("files")
+    with op.batch_alter_table("documents") as batch:
+        batch.drop_index("ix_documents_source")
+        batch.drop_column("source")
@@ -0,0 +1,34 @@
+"""add doc_fields inverted index for metadata filters
+
+Existing rows are not backfilled here; run
+`python cli.py index --reindex-fields` after upgrading.
+
+Revision ID: 0003_doc_fields
+Revises: 0002_file_manifest
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0003_doc_fields"
+down_revision = "0002_file_manifest"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "doc_fields",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("faiss_id", sa.Integer, index=True),
+        sa.Column("key", sa.String),
+        sa.Column("value", sa.String),
+    )
+    op.create_index("ix_doc_fields_key_value", "doc_fields", ["key", "value"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_doc_fields_key_value", table_name="doc_fields")
+    op.drop_table("doc_fields")
@@ -0,0 +1,43 @@
+"""add BM25 postings and stats tables for hybrid retrieval
+
+Existing chunks are not indexed here; run
+`python cli.py index --reindex-lexical` after upgrading.
+
+Revision ID: 0004_bm25
+Revises: 0003_doc_fields
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0004_bm25"
+down_revision = "0003_doc_fields"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "bm25_postings",
+        sa.Column("term", sa.String, primary_key=True),
+        sa.Column("first_id", sa.Integer, primary_key=True),
+        sa.Column("last_id", sa.Integer),
+        sa.Column("n", sa.Integer),
+        sa.Column("max_tf", sa.Integer),
+        sa.Column("width", sa.Integer),
+        sa.Column("ids", sa.LargeBinary),
+        sa.Column("tfs", sa.LargeBinary),
+        sa.Column("lens", sa.LargeBinary),
+    )
+    op.create_table(
+        "bm25_stats",
+        sa.Column("key", sa.String, primary_key=True),
+        sa.Column("value", sa.Integer),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("bm25_stats")
+    op.drop_table("bm25_postings")
@@ -0,0 +1,44 @@
+"""add documents.vec_row and the BM25 docno mapping for stable chunk ids
+
+Existing chunks keep their positional faiss_ids (the index is converted to
+explicit ids on first load), so both are backfilled from faiss_id.
+
+Revision ID: 0005_stable_ids
+Revises: 0004_bm25
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0005_stable_ids"
+down_revision = "0004_bm25"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("documents") as batch:
+        batch.add_column(sa.Column("vec_row", sa.Integer, nullable=True))
+    # the mmap sidecar was laid out with row == faiss_id
+    op.execute("UPDATE documents SET vec_row = faiss_id")
+    op.create_table(
+        "bm25_docs",
+        sa.Column("docno", sa.Integer, primary_key=True),
+        sa.Column("faiss_id", sa.Integer),
+    )
+    op.create_index("ix_bm25_docs_faiss_id", "bm25_docs", ["faiss_id"], unique=True)
+    # postings written so far use the faiss_id as document number
+    op.execute(
+        "INSERT INTO bm25_docs (docno, faiss_id) SELECT faiss_id, faiss_id "
+        "FROM documents WHERE EXISTS "
+        "(SELECT 1 FROM bm25_stats WHERE key = 'docs' AND value > 0)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_bm25_docs_faiss_id", table_name="bm25_docs")
+    op.drop_table("bm25_docs")
+    with op.batch_alter_table("documents") as batch:
+        batch.drop_column("vec_row")
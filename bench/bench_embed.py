@@ -0,0 +1,101 @@
+"""Encoding throughput of the Embedder backends: startup time and texts/sec.
+
+Each backend runs in a fresh process, so startup includes its imports (torch
+for "sbert", onnxruntime + tokenizers only for "onnx"). The embedding cache
+is bypassed. Texts have mixed lengths, like chunk_text output with short
+trailing chunks; "fixed" encodes them in arrival order in batches of
+`batch_size`, "bucketed" sorts them into token-budget batches and, with
+`--workers`, spreads those over encoder processes.
+
+    python -m bench.bench_embed --n 2000 --backends sbert onnx --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+
+def _texts(n: int, words: int) -> List[str]:
+    rng = np.random.default_rng(0)
+    # a third are short trailing chunks
+    sizes = np.where(rng.random(n) < 0.3, rng.integers(3, 20, n), words)
+    return [
+        " ".join(f"w{(i * 31 + j) % 5000}" for j in range(int(size)))
+        for i, size in enumerate(sizes)
+    ]
+
+
+def _worker(backend: str, model: str | None, n: int, words: int, workers: int, out):
+    t0 = time.perf_counter()
+    from embed.encoder import Embedder
+
+    name = "onnx" if backend.startswith("onnx") else backend
+    emb = Embedder(model_name=model, backend=name, workers=workers)
+    if backend == "onnx-fp32" and emb._backend == "onnx":
+        emb.onnx_quantize = False
+        emb._init_onnx()
+    emb.encode(["warm up"])
+    row = {"backend": emb._backend, "startup_s": time.perf_counter() - t0}
+    texts = _texts(n, words)
+    if emb._backend != "tfidf":
+        t0 = time.perf_counter()
+        for start in range(0, n, emb.batch_size):
+            emb._encode_model(texts[start : start + emb.batch_size])
+        row["fixed"] = n / (time.perf_counter() - t0)
+    emb._encode(texts[: 2 * emb.batch_size])  # start the worker processes
+    t0 = time.perf_counter()
+    emb._encode(texts)
+    row["bucketed"] = n / (time.perf_counter() - t0)
+    emb.close()
+    out.put(row)
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench_embed", description=__doc__)
+    parser.add_argument("--n", type=int, default=2000, help="texts")
+    parser.add_argument("--words", type=int, default=120, help="words per full text")
+    parser.add_argument("--model", default=None, help="default: embeddings.model")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=["sbert", "onnx", "onnx-fp32"],
+        choices=["sbert", "onnx", "onnx-fp32", "tfidf"],
+    )
+    parser.add_argument("--workers", type=int, default=0, help="encoder processes")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    ctx = mp.get_context("spawn")
+    results: Dict[str, Dict] = {}
+    for backend in args.backends:
+        out = ctx.Queue()
+        proc = ctx.Process(
+            target=_worker,
+            args=(backend, args.model, args.n, args.words, args.workers, out),
+        )
+        proc.start()
+        results[backend] = out.get()
+        proc.join()
+
+    print(f"{args.n} texts of up to {args.words} words, {args.workers} workers")
+    for name, row in results.items():
+        fixed = f"fixed {row['fixed']:>9,.1f}" if "fixed" in row else " " * 15
+        print(
+            f"{name:<10} ran as {row['backend']:<6} startup {row['startup_s']:6.2f}s"
+            f"  {fixed}  bucketed {row['bucketed']:>9,.1f} texts/s"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Index load time and memory: load_mode "memory" versus "mmap".
+
+Builds a synthetic index, then starts `--workers` fresh processes per mode
+that each load it and run one query. Reports load time, first-query
+latency, resident memory (RSS) and proportional memory (PSS: shared pages
+are split between the processes mapping them) while all workers are up.
+
+    python -m bench.bench_load --n 200000 --dim 384 --workers 4
+
+The page cache is warm after the build; drop it (as root) for cold starts.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from index.store import Indexer
+
+
+def _mem_mb() -> Dict[str, float]:
+    """RSS and PSS of this process in MB (PSS needs Linux smaps_rollup)."""
+    out = {"rss_mb": float("nan"), "pss_mb": float("nan")}
+    for path, key, field in (
+        ("/proc/self/status", "VmRSS:", "rss_mb"),
+        ("/proc/self/smaps_rollup", "Pss:", "pss_mb"),
+    ):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(key):
+                        out[field] = int(line.split()[1]) / 1024
+                        break
+        except OSError:
+            pass
+    return out
+
+
+def build(root: str, n: int, dim: int, index_type: str, seed: int = 0) -> str:
+    """Write an index of `n` random unit vectors under `root`."""
+    rng = np.random.default_rng(seed)
+    idx = Indexer(
+        faiss_path=os.path.join(root, "faiss.index"),
+        sqlite_path=os.path.join(root, "meta.db"),
+        index_type=index_type,
+    )
+    idx.dim = dim
+    idx.index = idx._make_index()
+    for start in range(0, n, 50000):
+        x = rng.standard_normal((min(50000, n - start), dim)).astype(np.float32)
+        x /= np.linalg.norm(x, axis=1, keepdims=True)
+        if not idx.index.is_trained:
+            idx.index.train(x)
+        idx.index.add_with_ids(x, np.arange(start, start + len(x), dtype=np.int64))
+    idx.flush()
+    return idx.faiss_path
+
+
+def _worker(root, index_type, mode, dim, barrier, results):
+    before = _mem_mb()
+    t0 = time.perf_counter()
+    idx = Indexer(
+        faiss_path=os.path.join(root, "faiss.index"),
+        sqlite_path=os.path.join(root, "meta.db"),
+        index_type=index_type,
+        load_mode=mode,
+    )
+    idx.load()
+    load_s = time.perf_counter() - t0
+    query = np.random.default_rng(1).standard_normal((1, dim)).astype(np.float32)
+    t0 = time.perf_counter()
+    idx.search_batch(query, top_k=10)
+    query_ms = (time.perf_counter() - t0) * 1000
+    # measure while every worker holds the index
+    barrier.wait()
+    after = _mem_mb()
+    barrier.wait()
+    results.put(
+        {
+            "load_s": load_s,
+            "first_query_ms": query_ms,
+            "rss_mb": after["rss_mb"] - before["rss_mb"],
+            "pss_mb": after["pss_mb"] - before["pss_mb"],
+        }
+    )
+
+
+def run_mode(root: str, index_type: str, mode: str, dim: int, workers: int) -> Dict:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(
+            target=_worker, args=(root, index_type, mode, dim, barrier, results)
+        )
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    rows: List[Dict] = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    summary = {
+        key: statistics.median(r[key] for r in rows)
+        for key in ("load_s", "first_query_ms", "rss_mb")
+    }
+    summary["pss_mb_total"] = sum(r["pss_mb"] for r in rows)
+    return summary
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench_load", description=__doc__)
+    parser.add_argument("--n", type=int, default=200000, help="vectors")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--index-type", default="FlatIP")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dir", help="reuse/keep the index here")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.dir or tmp
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, "faiss.index")
+        if not os.path.exists(path):
+            build(root, args.n, args.dim, args.index_type)
+        size_mb = os.path.getsize(path) / 2**20
+        results = {
+            "n": args.n,
+            "dim": args.dim,
+            "index_type": args.index_type,
+            "workers": args.workers,
+            "index_mb": size_mb,
+            "modes": {
+                mode: run_mode(root, args.index_type, mode, args.dim, args.workers)
+                for mode in ("memory", "mmap")
+            },
+        }
+
+    print(
+        f"{args.index_type}, {args.n} x {args.dim} ({size_mb:.0f} MB), "
+        f"{args.workers} workers"
+    )
+    print(f"{'mode':<8}{'load s':>10}{'query ms':>10}{'RSS MB':>10}{'PSS MB':>12}")
+    for mode, r in results["modes"].items():
+        print(
+            f"{mode:<8}{r['load_s']:>10.3f}{r['first_query_ms']:>10.1f}"
+            f"{r['rss_mb']:>10.0f}{r['pss_mb_total']:>12.0f}"
+        )
+    print("RSS: median per worker; PSS: total over all workers")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
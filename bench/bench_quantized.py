@@ -0,0 +1,126 @@
+"""Size, scan speed and recall of scalar-quantized indexes versus FlatIP.
+
+For each index type: bytes on disk, scan latency per query for one query at
+a time (the query server / CLI case, bound by memory bandwidth) and for one
+batched search (FlatIP turns that into a BLAS matrix product), recall@k
+against exact FlatIP results, and recall@k after re-scoring the top
+k * multiplier candidates with float16 / int8 vectors as stored by
+`storage.vector_dtype`.
+
+    python -m bench.bench_quantized --n 200000 --dim 768
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from index.store import decode_vectors, encode_vectors
+
+TYPES = ["Flat", "SQfp16", "SQ8"]
+
+
+def _unit(rng, n: int, dim: int) -> np.ndarray:
+    x = rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(
+        np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)])
+    )
+
+
+def _rescored(cand: np.ndarray, queries: np.ndarray, stored: np.ndarray, k: int):
+    """Top k of each candidate row by dot product with the decoded vectors."""
+    vecs = decode_vectors(stored[cand])  # (nq, n_cand, dim)
+    scores = np.einsum("qnd,qd->qn", vecs, queries)
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(cand, order, axis=1)
+
+
+def run(n: int, dim: int, nq: int, k: int, multiplier: int, root: str) -> Dict:
+    single = min(nq, 20)
+    rng = np.random.default_rng(0)
+    # clustered data, so neighbours are meaningful
+    centers = _unit(rng, max(1, n // 100), dim)
+    xb = centers[rng.integers(0, len(centers), n)] + 0.3 * _unit(rng, n, dim)
+    xb /= np.linalg.norm(xb, axis=1, keepdims=True)
+    xq = xb[rng.choice(n, nq, replace=False)] + 0.1 * _unit(rng, nq, dim)
+    xq /= np.linalg.norm(xq, axis=1, keepdims=True)
+    codes = {d: encode_vectors(xb, d) for d in ("float32", "float16", "int8")}
+
+    results: Dict[str, Dict] = {}
+    truth = None
+    for name in TYPES:
+        idx = faiss.index_factory(dim, name, faiss.METRIC_INNER_PRODUCT)
+        if not idx.is_trained:
+            idx.train(xb[: min(n, 50000)])
+        idx.add(xb)
+        path = os.path.join(root, f"{name}.index")
+        faiss.write_index(idx, path)
+        idx.search(xq[:1], k)  # warm up
+        t0 = time.perf_counter()
+        for q in xq[:single]:
+            idx.search(q[None], k * multiplier)
+        single_ms = (time.perf_counter() - t0) * 1000 / single
+        t0 = time.perf_counter()
+        _, cand = idx.search(xq, k * multiplier)
+        batch_ms = (time.perf_counter() - t0) * 1000 / nq
+        if truth is None:
+            truth = cand[:, :k]
+        row = {
+            "bytes": os.path.getsize(path),
+            "ms_single": single_ms,
+            "ms_batched": batch_ms,
+            f"recall@{k}": _recall(cand, truth),
+        }
+        for dtype in ("float16", "int8"):
+            row[f"recall@{k} rescored {dtype}"] = _recall(
+                _rescored(cand, xq, codes[dtype], k), truth
+            )
+        results[name] = row
+    vector_bytes = {d: c.nbytes for d, c in codes.items()}
+    return {"indexes": results, "stored_vector_bytes": vector_bytes}
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench_quantized", description=__doc__)
+    parser.add_argument("--n", type=int, default=200000, help="vectors")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidate-multiplier", type=int, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as root:
+        out = run(
+            args.n, args.dim, args.queries, args.k, args.candidate_multiplier, root
+        )
+    print(f"{args.n} vectors, dim {args.dim}, {args.queries} queries")
+    for name, row in out["indexes"].items():
+        cols = "  ".join(
+            f"{key} {val:.3f}" if isinstance(val, float) else f"{key} {val:,}"
+            for key, val in row.items()
+        )
+        print(f"{name:<7} {cols}")
+    for dtype, size in out["stored_vector_bytes"].items():
+        print(f"stored vectors {dtype:<7} {size:>14,} bytes")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), **out}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Metadata write throughput of Indexer.add: rows/sec before and after.
+
+Two tables:
+
+- metadata inserts alone (documents + embeddings rows): per-row ORM objects
+  versus Core executemany, under the old SQLite defaults (rollback journal,
+  synchronous=FULL) and under WAL + synchronous=NORMAL, committing per batch
+  or once per run;
+- end-to-end Indexer.add() (FAISS flat index, append log, BM25 postings,
+  metadata) with the old and the new settings. Building BM25 postings
+  dominates here; `--no-lexical` leaves them out.
+
+    python -m bench.bench_sqlite --n 50000 --batch 256
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from typing import Dict, List
+
+import numpy as np
+
+from index.store import DocumentMeta, Embedding, Indexer
+
+
+def _docs(start: int, n: int, words: int = 80) -> List[Dict]:
+    return [
+        {
+            "id": f"doc{i // 20}.md::chunk::{i % 20}",
+            "text": " ".join(f"w{(i * 31 + j) % 5000}" for j in range(words)),
+            "metadata": {"chunk_index": i % 20, "name": f"doc{i // 20}.md"},
+            "source": f"/bench/doc{i // 20}.md",
+        }
+        for i in range(start, start + n)
+    ]
+
+
+def _rows(start: int, n: int, dim: int) -> List[Dict]:
+    vec = np.zeros(dim, dtype=np.float32).tobytes()
+    return [
+        {
+            "faiss_id": i,
+            "doc_id": d["id"],
+            "chunk_index": d["metadata"]["chunk_index"],
+            "text": d["text"],
+            "meta": json.dumps(d["metadata"]),
+            "source": d["source"],
+            "vector": vec,
+        }
+        for i, d in zip(range(start, start + n), _docs(start, n))
+    ]
+
+
+def _indexer(root: str, journal: str, sync: str) -> Indexer:
+    return Indexer(
+        faiss_path=os.path.join(root, "faiss.index"),
+        sqlite_path=os.path.join(root, "meta.db"),
+        index_type="FlatIP",
+        sqlite_journal_mode=journal,
+        sqlite_synchronous=sync,
+    )
+
+
+def insert_rows(root, n, batch, dim, style, journal, sync, one_tx) -> float:
+    """rows/sec of writing `n` metadata rows in batches of `batch`."""
+    idx = _indexer(root, journal, sync)
+    batches = [_rows(s, min(batch, n - s), dim) for s in range(0, n, batch)]
+    t0 = time.perf_counter()
+    with idx.bulk() if one_tx else nullcontext():
+        for rows in batches:
+            session = idx.Session()
+            try:
+                if style == "orm":
+                    for r in rows:
+                        vector = r.pop("vector")
+                        session.add(DocumentMeta(**r))
+                        session.add(Embedding(faiss_id=r["faiss_id"], vector=vector))
+                else:
+                    session.execute(
+                        DocumentMeta.__table__.insert(),
+                        [{k: v for k, v in r.items() if k != "vector"} for r in rows],
+                    )
+                    session.execute(
+                        Embedding.__table__.insert(),
+                        [
+                            {"faiss_id": r["faiss_id"], "vector": r["vector"]}
+                            for r in rows
+                        ],
+                    )
+                session.commit()
+            finally:
+                session.close()
+    return n / (time.perf_counter() - t0)
+
+
+def add_chunks(root, n, batch, dim, journal, sync, one_tx, lexical=True) -> float:
+    """rows/sec of Indexer.add() end to end, checkpointing once at the end."""
+    idx = _indexer(root, journal, sync)
+    if not lexical:
+        idx.lexical = None
+    idx.rebuild()
+    rng = np.random.default_rng(0)
+    batches = []
+    for s in range(0, n, batch):
+        docs = _docs(s, min(batch, n - s))
+        batches.append((rng.standard_normal((len(docs), dim)).astype(np.float32), docs))
+    t0 = time.perf_counter()
+    with idx.bulk() if one_tx else nullcontext():
+        for vecs, docs in batches:
+            idx.add(vecs, docs)
+        idx.flush()
+    return n / (time.perf_counter() - t0)
+
+
+INSERT_CASES = [
+    # name, style, journal, synchronous, one transaction
+    ("orm, delete/full, commit per batch (before)", "orm", "delete", "full", False),
+    ("core, delete/full, commit per batch", "core", "delete", "full", False),
+    ("core, wal/normal, commit per batch", "core", "wal", "normal", False),
+    ("core, wal/normal, one transaction (after)", "core", "wal", "normal", True),
+]
+ADD_CASES = [
+    ("Indexer.add, delete/full, commit per batch", "delete", "full", False),
+    ("Indexer.add, wal/normal, one transaction", "wal", "normal", True),
+]
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench_sqlite", description=__doc__)
+    parser.add_argument("--n", type=int, default=50000, help="chunks")
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--no-lexical", action="store_true", help="skip BM25")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, float] = {}
+    for name, style, journal, sync, one_tx in INSERT_CASES:
+        with tempfile.TemporaryDirectory() as root:
+            results[name] = insert_rows(
+                root, args.n, args.batch, args.dim, style, journal, sync, one_tx
+            )
+    for name, journal, sync, one_tx in ADD_CASES:
+        with tempfile.TemporaryDirectory() as root:
+            results[name] = add_chunks(
+                root,
+                args.n,
+                args.batch,
+                args.dim,
+                journal,
+                sync,
+                one_tx,
+                lexical=not args.no_lexical,
+            )
+
+    print(f"{args.n} chunks in batches of {args.batch}, dim {args.dim}")
+    width = max(len(name) for name in results)
+    for name, rate in results.items():
+        print(f"{name:<{width}}  {rate:>10,.0f} rows/s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "rows_per_s": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+"""End-to-end benchmark suite on a synthetic corpus, with a regression report.
+
+`run` generates a corpus (bench/synthetic.py) in a temporary directory and
+times each stage of ingestion and querying:
+
+- ingest: Ingestor.ingest_folder over the generated files (docs/s)
+- chunk: chunk_text over the raw document texts (chunks/s)
+- encode: Embedder.encode of every chunk, or the deterministic FakeEmbedder
+  with `--backend fake` (chunks/s; the embedding cache is off)
+- index_add: Indexer.add in `--batch` sized batches in one bulk() run,
+  training first if the index type needs it, plus flush (chunks/s)
+- search: Indexer.search, one query at a time (p50 ms)
+- search_batch: Indexer.search_batch of all queries at once (ms per query)
+- fetch_metadata / fetch_embeddings: hydration of each query's top k / its
+  k * multiplier candidates with the hydrate cache emptied (p50 ms)
+- mmr: MMR selection of k among the candidates (p50 ms)
+- answer: Reasoner.answer end to end, answer cache off (p50 ms)
+
+Every stage keeps the best of `--repeat` runs. Results go to a JSON
+file, by default bench/results/<commit>.json, and `compare` reports the
+stages that got slower than a threshold (exit status 1 if any did):
+
+    python -m bench.suite run --docs 200
+    python -m bench.suite compare bench/results/<old>.json bench/results/<new>.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from bench.synthetic import FORMATS, FakeEmbedder, make_corpus
+from embed.encoder import Embedder
+from index.store import Indexer
+from ingest.chunker import chunk_text
+from ingest.loader import Ingestor
+from reasoner.cache import QueryCache
+from reasoner.reasoner import Reasoner
+from retrieve.retriever import mmr
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _git(*args: str) -> str:
+    try:
+        out = subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=30
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return out.stdout.strip() if out.returncode == 0 else ""
+
+
+def environment() -> Dict:
+    """Commit and machine the results were measured on."""
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    return {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _throughput(fn: Callable[[], object], n: int, unit: str, repeat: int) -> Dict:
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return {
+        "metric": f"{unit}/s",
+        "value": n / best,
+        "better": "higher",
+        "n": n,
+        "seconds": best,
+    }
+
+
+def _latency(fn: Callable[[object], object], inputs: Sequence, repeat: int) -> Dict:
+    """Per-call latency over `inputs`; the round with the lowest median of
+    `repeat` rounds, since sub-millisecond calls are noisy."""
+    fn(inputs[0])  # warm up
+    best: List[float] = []
+    for _ in range(max(1, repeat)):
+        ms = []
+        for x in inputs:
+            t0 = time.perf_counter()
+            fn(x)
+            ms.append((time.perf_counter() - t0) * 1000)
+        if not best or np.median(ms) < np.median(best):
+            best = ms
+    return {
+        "metric": "p50_ms",
+        "value": float(np.percentile(best, 50)),
+        "better": "lower",
+        "p95_ms": float(np.percentile(best, 95)),
+        "mean_ms": float(np.mean(best)),
+        "calls": len(best),
+    }
+
+
+def _embedder(args):
+    if args.backend == "fake":
+        return FakeEmbedder(dim=args.dim, seed=args.seed)
+    emb = Embedder(model_name=args.model, backend=args.backend)
+    emb._cache_enabled = False  # time the model, not SQLite lookups
+    return emb
+
+
+def run(args: argparse.Namespace, root: str) -> Dict[str, Dict]:
+    """Time every stage on a corpus generated under `root`."""
+    corpus = make_corpus(
+        os.path.join(root, "corpus"),
+        docs=args.docs,
+        doc_words=args.doc_words,
+        formats=args.formats,
+        queries=args.queries,
+        seed=args.seed,
+    )
+    k, n_cand = args.k, args.k * args.candidate_multiplier
+    stages: Dict[str, Dict] = {}
+
+    ingestor = Ingestor()
+    stages["ingest"] = _throughput(
+        lambda: ingestor.ingest_folder(Path(root) / "corpus"),
+        len(corpus.paths),
+        "docs",
+        args.repeat,
+    )
+
+    chunks: List[str] = []
+    docs: List[Dict] = []
+
+    def _chunk():
+        chunks.clear()
+        docs.clear()
+        for path, text in zip(corpus.paths, corpus.texts):
+            name = os.path.basename(path)
+            for i, chunk in enumerate(chunk_text(text, args.chunk_size, args.overlap)):
+                chunks.append(chunk)
+                docs.append(
+                    {
+                        "id": f"{name}::chunk::{i}",
+                        "text": chunk,
+                        "metadata": {"name": name, "chunk_index": i},
+                        "source": path,
+                    }
+                )
+
+    _chunk()  # warm up, and count the chunks
+    stages["chunk"] = _throughput(_chunk, len(chunks), "chunks", args.repeat)
+
+    embedder = _embedder(args)
+    if getattr(embedder, "needs_fit", lambda: False)():
+        embedder.fit(chunks[: embedder.fit_size])
+    vecs: List[np.ndarray] = []
+
+    def _encode():
+        vecs[:] = [np.asarray(embedder.encode(chunks), dtype=np.float32)]
+
+    stages["encode"] = _throughput(_encode, len(chunks), "chunks", args.repeat)
+    stages["encode"]["backend"] = getattr(embedder, "_backend", "fake")
+    emb = vecs[0]
+
+    indexers: List[Indexer] = []
+
+    def _add():
+        path = os.path.join(root, f"index{len(indexers)}")
+        indexer = Indexer(
+            faiss_path=os.path.join(path, "faiss.index"),
+            sqlite_path=os.path.join(path, "meta.db"),
+            index_type=args.index_type,
+            vector_dtype=args.vector_dtype,
+        )
+        indexers.append(indexer)
+        if indexer.needs_training():
+            indexer.train(emb[: indexer.train_size])
+        with indexer.bulk():
+            for start in range(0, len(docs), args.batch):
+                end = start + args.batch
+                indexer.add(emb[start:end], docs[start:end])
+        indexer.flush()
+
+    stages["index_add"] = _throughput(_add, len(docs), "chunks", args.repeat)
+    indexer = indexers[-1]
+
+    qvecs = np.asarray(embedder.encode(corpus.queries), dtype=np.float32)
+    stages["search"] = _latency(
+        lambda q: indexer.search(q, top_k=k), qvecs, args.repeat
+    )
+    batch = _throughput(
+        lambda: indexer.search_batch(qvecs, top_k=k), len(qvecs), "q", args.repeat
+    )
+    stages["search_batch"] = {
+        "metric": "ms/query",
+        "value": 1000 / batch["value"],
+        "better": "lower",
+        "queries": len(qvecs),
+    }
+
+    cands = [[i for i, _ in hits] for hits in indexer.search_batch(qvecs, n_cand)]
+
+    def _cold(fetch):
+        def call(ids):
+            indexer._chunk_cache.clear()
+            return fetch(ids)
+
+        return call
+
+    stages["fetch_metadata"] = _latency(
+        _cold(indexer.fetch_metadata), [ids[:k] for ids in cands], args.repeat
+    )
+    stages["fetch_embeddings"] = _latency(
+        _cold(indexer.fetch_embeddings), cands, args.repeat
+    )
+
+    pairs = [
+        (np.vstack(indexer.fetch_embeddings(ids)), q)
+        for ids, q in zip(cands, qvecs)
+        if ids
+    ]
+    stages["mmr"] = _latency(
+        lambda pair: mmr(pair[0], pair[1], lambda_param=args.mmr_lambda, k=k),
+        pairs,
+        args.repeat,
+    )
+
+    reasoner = Reasoner(
+        indexer=indexer, embedder=embedder, cache=QueryCache(max_entries=0)
+    )
+    stages["answer"] = _latency(
+        lambda q: reasoner.answer(
+            q,
+            top_k=k,
+            mmr_lambda=args.mmr_lambda,
+            candidate_multiplier=args.candidate_multiplier,
+        ),
+        corpus.queries,
+        args.repeat,
+    )
+    if hasattr(embedder, "close"):
+        embedder.close()
+    return stages
+
+
+def compare(base: Dict, new: Dict, threshold: float = 0.15) -> List[Dict]:
+    """One row per stage: the relative change of its metric and a status,
+    "regression" when it got worse by more than `threshold` (0.15 = 15%),
+    "improvement" when better by more, else "ok"."""
+    rows = []
+    for stage in dict.fromkeys([*base["stages"], *new["stages"]]):
+        old, cur = base["stages"].get(stage), new["stages"].get(stage)
+        row = {"stage": stage, "metric": (cur or old)["metric"]}
+        if old is None or cur is None:
+            row.update(status="added" if old is None else "removed")
+            rows.append(row)
+            continue
+        change = cur["value"] / old["value"] - 1 if old["value"] else 0.0
+        # positive: slower (less throughput or more latency)
+        worse = -change if old["better"] == "higher" else change
+        status = "ok"
+        if worse > threshold:
+            status = "regression"
+        elif worse < -threshold:
+            status = "improvement"
+        row.update(base=old["value"], new=cur["value"], change=change, status=status)
+        rows.append(row)
+    return rows
+
+
+def format_report(rows: List[Dict]) -> str:
+    lines = [f"{'stage':<17}{'metric':<10}{'base':>12}{'new':>12}{'change':>9}  status"]
+    for r in rows:
+        if "change" not in r:
+            lines.append(f"{r['stage']:<17}{r['metric']:<10}{'':>33}  {r['status']}")
+            continue
+        lines.append(
+            f"{r['stage']:<17}{r['metric']:<10}{r['base']:>12,.2f}{r['new']:>12,.2f}"
+            f"{r['change']:>+9.1%}  {r['status']}"
+        )
+    return "\n".join(lines)
+
+
+def _print_stages(stages: Dict[str, Dict]):
+    for name, row in stages.items():
+        print(f"{name:<17}{row['value']:>12,.2f} {row['metric']}")
+
+
+def _run(args) -> int:
+    env = environment()
+    with tempfile.TemporaryDirectory() as root:
+        stages = run(args, root)
+    params = {k: v for k, v in vars(args).items() if k not in ("cmd", "out")}
+    result = {"env": env, "params": params, "stages": stages}
+    out = args.out or os.path.join(
+        ROOT, "bench", "results", f"{env['commit']}{'-dirty' * env['dirty']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    _print_stages(stages)
+    print(f"Wrote {out}")
+    return 0
+
+
+def _compare(args) -> int:
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{base['env']['commit']} -> {new['env']['commit']}")
+    differ = sorted(
+        k for k in base["params"] if base["params"][k] != new["params"].get(k)
+    )
+    if differ:
+        print(f"Warning: runs used different parameters: {', '.join(differ)}")
+    rows = compare(base, new, args.threshold)
+    print(format_report(rows))
+    return 1 if any(r["status"] == "regression" for r in rows) else 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench.suite", description=__doc__)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("run", help="time every stage and write JSON results")
+    p.add_argument("--docs", type=int, default=200)
+    p.add_argument("--doc-words", type=int, default=1500, help="mean words per doc")
+    p.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    p.add_argument("--chunk-size", type=int, default=512, help="characters")
+    p.add_argument("--overlap", type=int, default=128)
+    p.add_argument(
+        "--backend",
+        default="fake",
+        choices=["fake", "auto", "sbert", "onnx", "tfidf"],
+        help="'fake' needs no model and gives the same vectors everywhere",
+    )
+    p.add_argument("--model", default=None, help="default: embeddings.model")
+    p.add_argument("--dim", type=int, default=384, help="fake backend only")
+    p.add_argument("--index-type", default="FlatIP")
+    p.add_argument("--vector-dtype", default="float32")
+    p.add_argument("--batch", type=int, default=256, help="chunks per Indexer.add")
+    p.add_argument("--queries", type=int, default=100)
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--candidate-multiplier", type=int, default=5)
+    p.add_argument("--mmr-lambda", type=float, default=0.7)
+    p.add_argument("--repeat", type=int, default=3, help="runs per stage (best of)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", help="default: bench/results/<commit>.json")
+    c = sub.add_parser("compare", help="regression report of two result files")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument(
+        "--threshold", type=float, default=0.15, help="relative slowdown (0.15 = 15%%)"
+    )
+    args = parser.parse_args(argv)
+    return _run(args) if args.cmd == "run" else _compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
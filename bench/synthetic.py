@@ -0,0 +1,142 @@
+"""Synthetic corpus and a deterministic stand-in embedder for benchmarks.
+
+`make_corpus` writes Markdown (with front matter), plain-text and HTML files
+of Zipf-distributed pseudo-words, so chunking, BM25 postings and dense
+neighbours behave roughly like real prose. `FakeEmbedder` maps texts to
+vectors by summing seeded per-word vectors: no model download, identical
+output on every machine, and texts sharing words land close together.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+FORMATS = ("md", "txt", "html")
+_WORD = re.compile(r"\w+")
+
+
+def _vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    """`size` distinct pseudo-words, shuffled so frequency is not length."""
+    syllables = ["ka", "to", "ri", "men", "sol", "va", "dre", "qu", "lin", "or"]
+    words: Dict[str, None] = {}
+    i = 0
+    while len(words) < size:
+        words["".join(syllables[int(d)] for d in str(i))] = None
+        i += 1
+    return rng.permutation(np.array(list(words)))
+
+
+@dataclass
+class Corpus:
+    """Generated documents: file paths, raw texts and sample queries."""
+
+    paths: List[str]
+    texts: List[str]
+    queries: List[str]
+
+    @property
+    def words(self) -> int:
+        return sum(len(t.split()) for t in self.texts)
+
+
+def make_corpus(
+    root: str,
+    docs: int = 200,
+    doc_words: int = 1500,
+    formats: Iterable[str] = FORMATS,
+    vocab: int = 20000,
+    queries: int = 100,
+    seed: int = 0,
+) -> Corpus:
+    """Write `docs` files of about `doc_words` words each under `root`.
+
+    Document lengths vary from a quarter to twice `doc_words`, so chunk
+    counts per file differ like in a real folder. Queries are short word runs
+    taken from the documents.
+    """
+    formats = list(formats)
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown corpus format {fmt!r}")
+    rng = np.random.default_rng(seed)
+    words = _vocabulary(vocab, rng)
+    # Zipf-like word frequencies, as in natural language
+    p = 1.0 / np.arange(1, vocab + 1)
+    p /= p.sum()
+    os.makedirs(root, exist_ok=True)
+    paths, texts, picked = [], [], []
+    for i in range(docs):
+        n = max(20, int(doc_words * rng.uniform(0.25, 2.0)))
+        tokens = words[rng.choice(vocab, n, p=p)]
+        sentences = np.split(tokens, np.cumsum(rng.integers(8, 20, n // 8 + 1)))
+        paragraphs: List[str] = []
+        para: List[str] = []
+        for s in sentences:
+            if len(s):
+                para.append(" ".join(s).capitalize() + ".")
+            if len(para) >= 5:
+                paragraphs.append(" ".join(para))
+                para = []
+        if para:
+            paragraphs.append(" ".join(para))
+        text = "\n\n".join(paragraphs)
+        start = int(rng.integers(0, max(1, n - 6)))
+        picked.append(" ".join(tokens[start : start + int(rng.integers(3, 7))]))
+        fmt = formats[i % len(formats)]
+        path = os.path.join(root, f"doc{i:05d}.{fmt}")
+        with open(path, "w", encoding="utf8") as f:
+            f.write(_render(fmt, f"Document {i}", text, i))
+        paths.append(path)
+        texts.append(text)
+    order = rng.permutation(len(picked))
+    sample = [picked[j] for j in order[:queries]]
+    while len(sample) < queries:
+        sample.append(picked[len(sample) % len(picked)])
+    return Corpus(paths, texts, sample)
+
+
+def _render(fmt: str, title: str, text: str, i: int) -> str:
+    if fmt == "md":
+        front = f"title: {title}\nauthor: bench\nyear: {2000 + i % 25}"
+        return f"---\n{front}\n---\n\n{text}\n"
+    if fmt == "html":
+        body = "".join(f"<p>{p}</p>" for p in text.split("\n\n"))
+        return (
+            f"<html><head><title>{title}</title><style>p {{}}</style></head>"
+            f"<body><h1>{title}</h1>{body}</body></html>"
+        )
+    return text + "\n"
+
+
+class FakeEmbedder:
+    """Deterministic `encode(texts)` without a model: the normalized sum of
+    hashed per-word random vectors (`buckets` of them, seeded by `seed`)."""
+
+    def __init__(self, dim: int = 384, buckets: int = 1 << 15, seed: int = 0):
+        self.dim = dim
+        self.buckets = buckets
+        rng = np.random.default_rng(seed)
+        self._table = rng.standard_normal((buckets, dim)).astype(np.float32)
+        self._ids: Dict[str, int] = {}
+
+    def _bucket(self, word: str) -> int:
+        b = self._ids.get(word)
+        if b is None:
+            b = self._ids[word] = zlib.crc32(word.encode("utf8")) % self.buckets
+        return b
+
+    def encode(self, texts: Iterable[str]) -> np.ndarray:
+        texts = list(texts)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            ids = [self._bucket(w) for w in _WORD.findall(text.lower())]
+            if ids:
+                out[row] = self._table[ids].sum(axis=0)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.clip(norms, 1e-12, None)
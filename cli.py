@@ -1,6 +1,6 @@
 """Command-line interface for the Deep Researcher Agent.
 
-Provides subcommands: ingest, index, query, export, stats
+Provides subcommands: ingest, index, query, serve, export, export-onnx, stats
 """
 
 from __future__ import annotations
@@ -9,10 +9,8 @@ import argparse
 import logging
 from pathlib import Path
 
-from index.store import Indexer
-from reasoner.reasoner import Reasoner
-from export import Exporter
-from pipeline import Pipeline
+# heavy modules (FAISS, the embedder, WeasyPrint) are imported per command so
+# `query --server` stays a fast thin client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("agent.cli")
@@ -25,9 +23,45 @@ def main(argv: list[str] | None = None) -> int:
     p_ingest = sub.add_parser("ingest")
     p_ingest.add_argument("--folder", required=True)
     p_ingest.add_argument("--recursive", action="store_true")
+    p_ingest.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-ingest files even if the manifest says they are unchanged",
+    )
 
     p_index = sub.add_parser("index")
     p_index.add_argument("--rebuild", action="store_true")
+    p_index.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Fold the append log into the index file",
+    )
+    p_index.add_argument(
+        "--migrate-embeddings",
+        action="store_true",
+        help="Copy vectors from the SQLite embeddings table to the mmap sidecar",
+    )
+    p_index.add_argument(
+        "--purge",
+        action="store_true",
+        help="With --migrate-embeddings, delete the migrated table rows",
+    )
+    p_index.add_argument(
+        "--reindex-fields",
+        action="store_true",
+        help="Rebuild the metadata filter index from stored chunks",
+    )
+    p_index.add_argument(
+        "--reindex-lexical",
+        action="store_true",
+        help="Rebuild the BM25 index from stored chunks",
+    )
+    p_index.add_argument(
+        "--delete",
+        nargs="+",
+        metavar="DOC",
+        help="Remove every chunk of these documents (source paths)",
+    )
 
     p_query = sub.add_parser("query")
     p_query.add_argument("--q", required=True)
@@ -45,50 +79,223 @@ def main(argv: list[str] | None = None) -> int:
         default=5,
         help="Candidate multiplier for retrieval",
     )
+    p_query.add_argument(
+        "--nprobe", type=int, default=None, help="IVF lists to probe per query"
+    )
+    p_query.add_argument(
+        "--ef-search", type=int, default=None, help="HNSW search depth"
+    )
+    p_query.add_argument(
+        "--shards",
+        default=None,
+        help="Comma-separated shards to search (sharded indexes; default all)",
+    )
+    p_query.add_argument(
+        "--filter",
+        default=None,
+        help="Metadata filter, e.g. 'source^=/contracts and tags=nda'",
+    )
+    p_query.add_argument(
+        "--lexical-weight",
+        type=float,
+        default=0.0,
+        help="Weight of BM25 in hybrid retrieval (0 = dense only, 1 = BM25 only)",
+    )
+    p_query.add_argument(
+        "--fusion",
+        choices=["rrf", "weighted"],
+        default="rrf",
+        help="How dense and BM25 results are fused",
+    )
+    p_query.add_argument(
+        "--rescore",
+        action="store_true",
+        help="Re-rank candidates by exact similarity (quantized indexes)",
+    )
+    p_query.add_argument(
+        "--server",
+        default=None,
+        help="Send the query to a running `serve` process at this URL",
+    )
+    p_query.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print how long each stage of the query took",
+    )
+
+    p_serve = sub.add_parser("serve")
+    p_serve.add_argument("--host", default=None)
+    p_serve.add_argument("--port", type=int, default=None)
 
     p_export = sub.add_parser("export")
     p_export.add_argument("--session", default="last")
     p_export.add_argument("--format", choices=["md", "pdf"], default="md")
 
-    sub.add_parser("stats")
+    p_onnx = sub.add_parser("export-onnx")
+    p_onnx.add_argument(
+        "--model", default=None, help="Model to export (default: embeddings.model)"
+    )
+    p_onnx.add_argument(
+        "--out", default=None, help="Export root (default: embeddings.onnx.dir)"
+    )
+    p_onnx.add_argument(
+        "--no-quantize",
+        action="store_true",
+        help="Skip the int8 dynamically quantized copy",
+    )
+
+    p_stats = sub.add_parser("stats")
+    p_stats.add_argument(
+        "--server",
+        default=None,
+        help="Show per-stage query latencies of a running `serve` process instead",
+    )
+    p_stats.add_argument(
+        "--prometheus",
+        action="store_true",
+        help="With --server: print them in Prometheus text format",
+    )
 
     args = parser.parse_args(argv)
+    if args.cmd == "stats" and args.prometheus and not args.server:
+        parser.error("--prometheus needs --server")
 
     if args.cmd == "ingest":
+        from pipeline import Pipeline
+
         pl = Pipeline()
-        n = pl.run_folder(Path(args.folder), recursive=args.recursive)
+        n = pl.run_folder(
+            Path(args.folder), recursive=args.recursive, force=args.force
+        )
         logger.info("Ingested and indexed %d chunks", n)
         return 0
 
     if args.cmd == "index":
-        idx = Indexer()
+        from index.shards import open_indexer
+
+        idx = open_indexer()
         if args.rebuild:
             idx.rebuild()
         else:
             idx.load()
+            if args.checkpoint:
+                idx.flush()
+            if args.migrate_embeddings:
+                # the indexer logs the sidecar file(s) it wrote
+                n = idx.migrate_embeddings_to_mmap(purge=args.purge)
+                logger.info("Migrated %d embeddings in total", n)
+            if args.reindex_fields:
+                idx.reindex_fields()
+            if args.reindex_lexical:
+                idx.reindex_lexical()
+            if args.delete:
+                # ingested files are keyed by their resolved path; anything
+                # else (e.g. an API doc_id) is taken as given
+                manifest = idx.file_manifest()
+                keys = []
+                for d in args.delete:
+                    resolved = str(Path(d).resolve())
+                    known = resolved in manifest or Path(d).exists()
+                    keys.append(resolved if known else d)
+                n = idx.delete(keys)
+                logger.info("Deleted %d chunks", n)
         return 0
 
     if args.cmd == "query":
-        idx = Indexer()
-        idx.load()
-        reasoner = Reasoner(indexer=idx)
-        result = reasoner.answer(
-            args.q,
+        kwargs = dict(
             top_k=args.topk,
             mmr_enabled=bool(args.mmr),
             mmr_lambda=float(args.mmr_lambda),
             candidate_multiplier=int(args.candidate_multiplier),
+            nprobe=args.nprobe,
+            ef_search=args.ef_search,
+            filter_expr=args.filter,
+            lexical_weight=float(args.lexical_weight),
+            fusion=args.fusion,
+            rescore=bool(args.rescore),
         )
+        if args.server:
+            from server import query_remote
+
+            try:
+                result = query_remote(args.server, args.q, **kwargs)
+            except (RuntimeError, OSError) as e:
+                logger.error("Query server at %s failed: %s", args.server, e)
+                return 1
+        else:
+            from index.shards import open_indexer
+            from reasoner.reasoner import Reasoner
+
+            from index import FilterError
+
+            only = args.shards.split(",") if args.shards else None
+            idx = open_indexer(only=only)
+            idx.load()
+            reasoner = Reasoner(indexer=idx)
+            try:
+                result = reasoner.answer(args.q, **kwargs)
+            except FilterError as e:
+                logger.error("Invalid --filter: %s", e)
+                return 2
         print(result["synthesis"])
+        if args.timings and result["traces"]:
+            from metrics import format_spans
+
+            print(format_spans(result["traces"][0].get("spans", [])))
+        return 0
+
+    if args.cmd == "serve":
+        from server import QueryServer
+
+        srv = QueryServer(host=args.host, port=args.port)
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
         return 0
 
     if args.cmd == "export":
+        from export import Exporter
+
         exp = Exporter()
         exp.export_last(format=args.format)
         return 0
 
+    if args.cmd == "export-onnx":
+        import yaml
+
+        from embed.onnx_backend import export_dir, export_onnx
+
+        try:
+            cfg = yaml.safe_load(open("config.yml"))
+        except Exception:
+            cfg = {}
+        ecfg = cfg.get("embeddings", {}) or {}
+        model = args.model or ecfg.get(
+            "model", "sentence-transformers/all-mpnet-base-v2"
+        )
+        root = args.out or (ecfg.get("onnx") or {}).get("dir", "data/onnx")
+        out = export_onnx(
+            model, export_dir(root, model), quantize=not args.no_quantize
+        )
+        logger.info("Exported %s to %s", model, out)
+        return 0
+
     if args.cmd == "stats":
-        idx = Indexer()
+        if args.server:
+            from metrics import format_stages
+            from server import fetch_stats
+
+            try:
+                stats = fetch_stats(args.server, prometheus=args.prometheus)
+            except (RuntimeError, OSError) as e:
+                logger.error("Query server at %s failed: %s", args.server, e)
+                return 1
+            print(stats if args.prometheus else format_stages(stats))
+            return 0
+        from index.shards import open_indexer
+
+        idx = open_indexer()
         idx.load()
         print(idx.stats())
         return 0
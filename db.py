@@ -0,0 +1,8 @@
+"""SQLite helpers shared by the metadata store, BM25 index and embedding cache.
+
+Standard library only, so importing it never pulls in FAISS or the models.
+"""
+
+# ids / keys per `IN (...)` lookup; well below SQLite's bound-parameter limit
+# (999 before SQLite 3.32)
+LOOKUP_CHUNK = 500
@@ -1,5 +1,6 @@
 """Embedding module: sentence-transformers wrapper."""
 
 from .encoder import Embedder
+from .cache import EmbeddingCache
 
-__all__ = ["Embedder"]
+__all__ = ["Embedder", "EmbeddingCache"]
@@ -0,0 +1,148 @@
+"""Persistent on-disk embedding cache keyed by (model, chunk-text hash).
+
+Backed by a small SQLite table with LRU eviction once `max_entries` is
+exceeded. Vectors are stored as raw float32 bytes like the metadata store.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import (
+    Column,
+    Float,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    bindparam,
+    create_engine,
+    func,
+    select,
+    text,
+)
+
+from db import LOOKUP_CHUNK
+
+logger = logging.getLogger("agent.embed.cache")
+
+_metadata = MetaData()
+cache_table = Table(
+    "embedding_cache",
+    _metadata,
+    Column("model", String, primary_key=True),
+    Column("text_hash", String, primary_key=True),
+    Column("vector", LargeBinary),
+    Column("last_used", Float, index=True),
+)
+
+
+def text_hash(chunk: str) -> str:
+    return hashlib.sha1(chunk.encode("utf8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str | None = None, max_entries: int | None = None):
+        import yaml
+
+        try:
+            cfg = yaml.safe_load(open("config.yml"))
+        except Exception:
+            cfg = {}
+        cache_cfg = cfg.get("embeddings", {}).get("cache", {}) or {}
+        self.path = path or cache_cfg.get("path", "data/embed_cache.db")
+        self.max_entries = int(max_entries or cache_cfg.get("max_entries", 200000))
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.engine = create_engine(f"sqlite:///{self.path}")
+        _metadata.create_all(self.engine)
+        with self.engine.connect() as conn:
+            self._count = int(
+                conn.execute(select(func.count()).select_from(cache_table)).scalar()
+                or 0
+            )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Return the cached vector for each text (None on miss) and mark hits
+        as recently used."""
+        keys = [text_hash(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self.engine.begin() as conn:
+            for i in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = list(set(keys[i : i + LOOKUP_CHUNK]))
+                rows = conn.execute(
+                    select(cache_table.c.text_hash, cache_table.c.vector).where(
+                        cache_table.c.model == model,
+                        cache_table.c.text_hash.in_(chunk),
+                    )
+                )
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                conn.execute(
+                    cache_table.update()
+                    .where(
+                        cache_table.c.model == model,
+                        cache_table.c.text_hash == bindparam("h"),
+                    )
+                    .values(last_used=now),
+                    [{"h": h} for h in found],
+                )
+        out = [found.get(k) for k in keys]
+        n_hits = sum(v is not None for v in out)
+        self.hits += n_hits
+        self.misses += len(out) - n_hits
+        return out
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        if not texts:
+            return
+        now = time.time()
+        rows = {
+            text_hash(t): np.ascontiguousarray(v, dtype=np.float32).tobytes()
+            for t, v in zip(texts, vectors)
+        }
+        with self.engine.begin() as conn:
+            conn.execute(
+                cache_table.insert().prefix_with("OR REPLACE"),
+                [
+                    {"model": model, "text_hash": h, "vector": b, "last_used": now}
+                    for h, b in rows.items()
+                ],
+            )
+        self._count += len(rows)
+        if self._count > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used entries down to `max_entries`."""
+        with self.engine.begin() as conn:
+            count = int(
+                conn.execute(select(func.count()).select_from(cache_table)).scalar()
+                or 0
+            )
+            excess = count - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    text(
+                        "DELETE FROM embedding_cache WHERE rowid IN ("
+                        "SELECT rowid FROM embedding_cache "
+                        "ORDER BY last_used LIMIT :n)"
+                    ),
+                    {"n": excess},
+                )
+                count -= excess
+                logger.info("Evicted %d cached embeddings", excess)
+        self._count = count
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,4 +1,4 @@
-"""Local embedding generator using sentence-transformers.
+"""Local embedding generator using sentence-transformers (or its ONNX export).
 
 Supports batching and CPU/GPU device selection. Returns L2-normalized embeddings for cosine similarity.
 """
@@ -6,10 +6,17 @@ Supports batching and CPU/GPU device selection. Returns L2-normalized embeddings
 from __future__ import annotations
 
 import logging
-from typing import Iterable
+import multiprocessing as mp
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List
 
 import numpy as np
 
+from .cache import EmbeddingCache
+
 logger = logging.getLogger("agent.embed")
 
 
@@ -24,6 +31,10 @@ class Embedder:
         model_name: str | None = None,
         device: str | None = None,
         batch_size: int = 32,
+        cache: EmbeddingCache | None = None,
+        backend: str | None = None,
+        workers: int | None = None,
+        threads: int | None = None,
     ):
         import yaml
 
@@ -36,49 +47,334 @@ class Embedder:
         )
         self.batch_size = batch_size or cfg.get("embeddings", {}).get("batch_size", 32)
         self.device = device or cfg.get("embeddings", {}).get("device", "auto")
-        # Try to load SentenceTransformer; if torch or C libs are missing, fall back
-        try:
-            import torch
-            from sentence_transformers import SentenceTransformer
-
-            self._backend = "sbert"
-            self.device = (
-                "cuda"
-                if (self.device in (None, "auto") and torch.cuda.is_available())
-                else "cpu"
-            )
-            logger.info(
-                "Loading SentenceTransformer %s on %s", self.model_name, self.device
-            )
-            self.model = SentenceTransformer(self.model_name, device=self.device)
-        except Exception:
-            logger.warning(
-                "SentenceTransformer unavailable; falling back to TF-IDF embeddings"
-            )
-            from sklearn.feature_extraction.text import TfidfVectorizer
+        # TF-IDF fallback: output dimension and number of texts the IDF is fit on
+        self.tfidf_dim = int(cfg.get("embeddings", {}).get("tfidf_dim", 768))
+        self.fit_size = int(cfg.get("embeddings", {}).get("tfidf_fit_size", 10000))
+        self.state_path: str | None = None
+        # persistent (model, text-hash) -> vector cache, opened on first use
+        self.cache = cache
+        self._cache_enabled = cache is not None or bool(
+            (cfg.get("embeddings", {}).get("cache") or {}).get("enabled", False)
+        )
+        # "auto": SentenceTransformer, else TF-IDF; "onnx": ONNX Runtime on CPU
+        # (no torch import), else the "auto" chain; "sbert" / "tfidf" as named
+        requested = backend or cfg.get("embeddings", {}).get("backend", "auto")
+        if requested not in ("auto", "sbert", "onnx", "tfidf"):
+            raise ValueError(f"Unknown embeddings backend {requested!r}")
+        onnx_cfg = cfg.get("embeddings", {}).get("onnx", {}) or {}
+        self.onnx_dir = onnx_cfg.get("dir", "data/onnx")
+        self.onnx_quantize = bool(onnx_cfg.get("quantize", True))
+        self.onnx_threads = int(threads or onnx_cfg.get("intra_op_threads", 0))
+        # model calls are sized by padded tokens (texts sorted by length), so
+        # short chunks are not padded to the longest one of a fixed-size batch
+        self.max_batch_tokens = int(
+            cfg.get("embeddings", {}).get("max_batch_tokens", 2048)
+        )
+        # > 0: spread model calls over this many processes, each with its own
+        # model copy; 0 encodes in the calling process
+        self.workers = int(
+            workers
+            if workers is not None
+            else cfg.get("embeddings", {}).get("workers", 0)
+        )
+        self._pool: ProcessPoolExecutor | None = None
+        self._backend = None
+        if requested == "onnx":
+            try:
+                self._init_onnx()
+            except Exception:
+                logger.warning(
+                    "ONNX Runtime backend unavailable; trying SentenceTransformer",
+                    exc_info=True,
+                )
+        if self._backend is None and requested != "tfidf":
+            # Try to load SentenceTransformer; if torch or C libs are missing,
+            # fall back
+            try:
+                import torch
+                from sentence_transformers import SentenceTransformer
 
+                if threads:
+                    torch.set_num_threads(int(threads))
+                self._backend = "sbert"
+                self.device = (
+                    "cuda"
+                    if (self.device in (None, "auto") and torch.cuda.is_available())
+                    else "cpu"
+                )
+                logger.info(
+                    "Loading SentenceTransformer %s on %s", self.model_name, self.device
+                )
+                self.model = SentenceTransformer(self.model_name, device=self.device)
+            except Exception:
+                logger.warning(
+                    "SentenceTransformer unavailable; falling back to TF-IDF embeddings"
+                )
+                self._backend = None
+        if self._backend is None:
             self._backend = "tfidf"
-            self._tfidf = TfidfVectorizer(max_features=768)
+            self._init_tfidf()
+
+    def _init_onnx(self):
+        """Load the ONNX export of the model, exporting it first if needed
+        (that step alone needs torch and sentence-transformers)."""
+        import onnxruntime  # noqa: F401  fail before a costly export
+
+        from .onnx_backend import OnnxEncoder, export_dir, export_onnx, model_file
+
+        model_dir = export_dir(self.onnx_dir, self.model_name)
+        if not os.path.exists(model_file(model_dir, self.onnx_quantize)):
+            export_onnx(self.model_name, model_dir, quantize=self.onnx_quantize)
+        self.model = OnnxEncoder(
+            model_dir,
+            quantized=self.onnx_quantize,
+            intra_op_threads=self.onnx_threads,
+            batch_size=self.batch_size,
+        )
+        self._backend = "onnx"
+        self.device = "cpu"
+        logger.info(
+            "Using ONNX Runtime for %s (%s)",
+            self.model_name,
+            "int8" if self.onnx_quantize else "float32",
+        )
+
+    def _init_tfidf(self):
+        """Stateless hashing vectorizer + IDF weights fit once + a fixed sparse
+        random projection, so every batch and query lands in the same space."""
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        n_features = 2**18
+        self._hasher = HashingVectorizer(
+            n_features=n_features, alternate_sign=False, norm=None, dtype=np.float32
+        )
+        self._idf = None  # sklearn TfidfTransformer once fit
+        self._projection = _sparse_projection(n_features, self.tfidf_dim)
+
+    def needs_fit(self) -> bool:
+        return getattr(self, "_backend", "tfidf") == "tfidf" and self._idf is None
+
+    def fit(self, texts: Iterable[str]):
+        """Fit the TF-IDF weights once (no-op for model backends) and persist
+        them to `state_path` when set."""
+        if getattr(self, "_backend", "tfidf") != "tfidf":
+            return
+        from sklearn.feature_extraction.text import TfidfTransformer
+
+        texts = list(texts)
+        self._idf = TfidfTransformer(sublinear_tf=True).fit(
+            self._hasher.transform(texts)
+        )
+        logger.info("Fit TF-IDF weights on %d texts", len(texts))
+        if self.state_path:
+            self.save_state(self.state_path)
+
+    def use_state(self, path: str):
+        """Persist fitted TF-IDF state at `path` and load it if present."""
+        self.state_path = path
+        if getattr(self, "_backend", "tfidf") == "tfidf" and os.path.exists(path):
+            self.load_state(path)
+
+    def save_state(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"idf": self._idf, "projection": self._projection}, f)
+        os.replace(tmp_path, path)
+
+    def load_state(self, path: str):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        self._idf = state["idf"]
+        self._projection = state["projection"]
+        self.tfidf_dim = int(self._projection.shape[1])
+        logger.info("Loaded TF-IDF state from %s", path)
 
     def encode(self, texts: Iterable[str]) -> np.ndarray:
         texts = list(texts)
         if not texts:
             return np.zeros((0, 0), dtype="float32")
-        if getattr(self, "_backend", "tfidf") == "sbert":
-            embeddings = self.model.encode(
-                texts,
-                batch_size=self.batch_size,
-                show_progress_bar=False,
-                convert_to_numpy=True,
+        key = self._cache_key()
+        if key is None:
+            return self._encode(texts)
+        if self.cache is None:
+            self.cache = EmbeddingCache()
+        cached = self.cache.get_many(key, texts)
+        miss = [i for i, v in enumerate(cached) if v is None]
+        if miss:
+            fresh = self._encode([texts[i] for i in miss])
+            self.cache.put_many(key, [texts[i] for i in miss], fresh)
+            for i, vec in zip(miss, fresh):
+                cached[i] = vec
+        return np.vstack(cached).astype("float32")
+
+    def cache_stats(self) -> Dict[str, float]:
+        if self.cache is None:
+            return {"hits": 0, "misses": 0, "hit_ratio": 0.0}
+        return {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "hit_ratio": self.cache.hit_ratio,
+        }
+
+    def _cache_key(self) -> str | None:
+        # TF-IDF vectors are cheap to recompute; only model backends are cached
+        backend = getattr(self, "_backend", "tfidf")
+        if not self._cache_enabled or backend == "tfidf":
+            return None
+        if backend == "onnx":
+            # int8 weights give slightly different vectors than the model
+            suffix = ":int8" if self.onnx_quantize else ""
+            return f"onnx:{self.model_name}{suffix}"
+        return f"sbert:{self.model_name}"
+
+    def close(self):
+        """Stop the encoder worker processes, if any."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _token_lengths(self, texts: List[str]) -> np.ndarray:
+        """Tokens per text as the model will see them (truncated); a word
+        count estimate for models without a tokenizer."""
+        if self._backend == "onnx":
+            return self.model.token_lengths(texts)
+        tokenizer = getattr(self.model, "tokenizer", None)
+        max_len = getattr(self.model, "max_seq_length", None)
+        if tokenizer is None or max_len is None:
+            return np.array([len(t.split()) + 2 for t in texts], dtype=np.int64)
+        ids = tokenizer(texts, truncation=True, max_length=max_len)["input_ids"]
+        return np.array([len(i) for i in ids], dtype=np.int64)
+
+    def _encode_model(self, texts: List[str]) -> np.ndarray:
+        """One model call on `texts`; un-normalized vectors."""
+        if self._backend == "onnx":
+            return self.model.encode(texts, batch_size=len(texts))
+        return self.model.encode(
+            texts,
+            batch_size=len(texts),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+
+    def _worker_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            # spawn: forking a process that already holds torch / ORT threads
+            # is unsafe
+            self._pool = ProcessPoolExecutor(
+                self.workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self._backend, threads),
+            )
+            logger.info(
+                "Started %d encoder processes (%d threads each)", self.workers, threads
             )
+        return self._pool
+
+    def _encode_buckets(self, texts: List[str]) -> np.ndarray:
+        """Encode length-sorted, token-budgeted buckets (in worker processes
+        when configured) and return the vectors in input order."""
+        lengths = self._token_lengths(texts)
+        # with workers, make at least one bucket per worker
+        max_texts = -(-len(texts) // self.workers) if self.workers > 1 else None
+        buckets = plan_batches(lengths, self.max_batch_tokens, max_texts)
+        parts = [[texts[i] for i in b] for b in buckets]
+        vecs = None
+        if self.workers > 0 and len(parts) > 1:
+            try:
+                vecs = list(self._worker_pool().map(_encode_in_worker, parts))
+            except BrokenProcessPool:
+                logger.warning(
+                    "Encoder worker processes failed; encoding in-process",
+                    exc_info=True,
+                )
+                self._pool = None
+                self.workers = 0
+        if vecs is None:
+            vecs = [self._encode_model(p) for p in parts]
+        out = np.empty((len(texts), vecs[0].shape[1]), dtype=np.float32)
+        for bucket, v in zip(buckets, vecs):
+            out[bucket] = v
+        return out
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        backend = getattr(self, "_backend", "tfidf")
+        if backend in ("sbert", "onnx"):
+            embeddings = self._encode_buckets(texts)
             # normalize
             norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
             norms[norms == 0] = 1.0
             embeddings = embeddings / norms
             return embeddings.astype("float32")
         else:
-            X = self._tfidf.fit_transform(texts).toarray()
+            # sparse until the final projection; only transform, never refit
+            X = self._hasher.transform(texts)
+            if self._idf is not None:
+                X = self._idf.transform(X)
+            else:
+                X.data = 1.0 + np.log(X.data)  # sublinear tf without IDF
+            X = (X @ self._projection).toarray()
             norms = np.linalg.norm(X, axis=1, keepdims=True)
             norms[norms == 0] = 1.0
             X = X / norms
             return X.astype("float32")
+
+
+def plan_batches(
+    lengths: np.ndarray, max_tokens: int, max_texts: int | None = None
+) -> List[np.ndarray]:
+    """Group text indices into model calls, shortest texts first.
+
+    A batch grows while its padded size (texts x longest text) stays within
+    `max_tokens` and it holds at most `max_texts` texts; a text longer than
+    the budget gets a batch of its own.
+    """
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    batches: List[np.ndarray] = []
+    current: List[int] = []
+    longest = 0
+    for i in order.tolist():
+        n = max(int(lengths[i]), 1)
+        if current and (
+            (len(current) + 1) * max(longest, n) > max_tokens
+            or len(current) == max_texts
+        ):
+            batches.append(np.array(current, dtype=np.int64))
+            current, longest = [], 0
+        current.append(i)
+        longest = max(longest, n)
+    if current:
+        batches.append(np.array(current, dtype=np.int64))
+    return batches
+
+
+# model held by an encoder worker process, see Embedder._worker_pool
+_worker: Embedder | None = None
+
+
+def _init_worker(model_name: str, backend: str, threads: int):
+    global _worker
+    _worker = Embedder(
+        model_name=model_name, device="cpu", backend=backend, workers=0, threads=threads
+    )
+    if _worker._backend != backend:
+        # a silent TF-IDF fallback would mix vector spaces
+        raise RuntimeError(f"Encoder worker could not load the {backend} backend")
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return _worker._encode_model(texts)
+
+
+def _sparse_projection(n_features: int, dim: int, per_row: int = 4, seed: int = 0):
+    """Fixed (n_features, dim) sparse random projection: each hashed feature
+    maps to `per_row` output dims with random signs."""
+    from scipy import sparse
+
+    rng = np.random.default_rng(seed)
+    rows = np.repeat(np.arange(n_features), per_row)
+    cols = rng.integers(0, dim, size=n_features * per_row)
+    vals = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=rows.size)
+    vals /= np.sqrt(per_row)
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(n_features, dim))
@@ -0,0 +1,185 @@
+"""ONNX Runtime embedding backend: export a model once, encode without torch.
+
+`export_onnx` (needs torch and sentence-transformers, once per model) writes
+the transformer of a SentenceTransformer as `model.onnx`, optionally an int8
+dynamically quantized `model.int8.onnx`, its fast tokenizer and
+`embedder.json` (pooling mode, max sequence length, model inputs).
+`OnnxEncoder` only needs onnxruntime and tokenizers at query time.
+"""
+
+from __future__ import annotations
+
+import inspect
+import json
+import logging
+import os
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger("agent.embed.onnx")
+
+CONFIG_FILE = "embedder.json"
+_POOLING = ("mean", "cls", "max")
+# SentenceTransformer modules the exported graph + pooling reproduce
+_SUPPORTED_MODULES = ("Transformer", "Pooling", "Normalize")
+
+
+def export_dir(root: str, model_name: str) -> str:
+    """Directory of `model_name`'s export under `root`."""
+    return os.path.join(root, model_name.replace("/", "__"))
+
+
+def model_file(model_dir: str, quantized: bool) -> str:
+    return os.path.join(model_dir, "model.int8.onnx" if quantized else "model.onnx")
+
+
+def export_onnx(
+    model_name: str, out_dir: str, quantize: bool = True, opset: int = 17
+) -> str:
+    """Export `model_name` to `out_dir` and return the directory.
+
+    Only Transformer + Pooling (+ Normalize) pipelines are supported; models
+    with extra Dense layers raise ValueError.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    kinds = [type(m).__name__ for m in st]
+    if kinds[:2] != ["Transformer", "Pooling"] or any(
+        k not in _SUPPORTED_MODULES for k in kinds
+    ):
+        raise ValueError(f"Cannot export {model_name} to ONNX: modules {kinds}")
+    transformer, pooling = st[0], st[1]
+    # sentence-transformers < 6 only has get_pooling_mode_str()
+    mode = (
+        pooling.get_pooling_mode_str()
+        if hasattr(pooling, "get_pooling_mode_str")
+        else pooling.pooling_mode
+    )
+    if mode not in _POOLING:
+        raise ValueError(f"Unsupported pooling mode {mode!r} of {model_name}")
+    tokenizer = transformer.tokenizer
+    if not getattr(tokenizer, "is_fast", False):
+        raise ValueError(f"{model_name} has no fast tokenizer (tokenizer.json)")
+
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    names = [
+        n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample
+    ]
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(names, inputs)), return_dict=False)[0]
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = model_file(out_dir, quantized=False)
+    axes = {n: {0: "batch", 1: "seq"} for n in names + ["token_embeddings"]}
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # the TorchScript exporter handles dynamic_axes for every torch 2.x
+        kwargs["dynamo"] = False
+    logger.info("Exporting %s to %s", model_name, path)
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(transformer.auto_model.eval()),
+            tuple(sample[n] for n in names),
+            path,
+            input_names=names,
+            output_names=["token_embeddings"],
+            dynamic_axes=axes,
+            opset_version=opset,
+            **kwargs,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            path, model_file(out_dir, quantized=True), weight_type=QuantType.QInt8
+        )
+    tokenizer.save_pretrained(out_dir)
+    config = {
+        "model": model_name,
+        "pooling": mode,
+        "max_seq_length": int(st.max_seq_length),
+        "inputs": names,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": int(tokenizer.pad_token_id or 0),
+    }
+    with open(os.path.join(out_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+    return out_dir
+
+
+def pool(token_embeddings: np.ndarray, attention_mask: np.ndarray, mode: str):
+    """(batch, dim) sentence vectors from (batch, seq, dim) token vectors,
+    ignoring padding, as sentence-transformers' Pooling module does."""
+    mask = attention_mask[:, :, None].astype(np.float32)
+    if mode == "cls":
+        return token_embeddings[:, 0]
+    if mode == "max":
+        masked = np.where(mask > 0, token_embeddings, -1e9)
+        return masked.max(axis=1)
+    if mode == "mean":
+        summed = (token_embeddings * mask).sum(axis=1)
+        return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    raise ValueError(f"Unknown pooling mode {mode!r}")
+
+
+class OnnxEncoder:
+    """Sentence embeddings from an `export_onnx` directory on ONNX Runtime."""
+
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = True,
+        intra_op_threads: int = 0,
+        batch_size: int = 32,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.batch_size = batch_size
+        opts = ort.SessionOptions()
+        # 0 lets ONNX Runtime use one thread per physical core
+        opts.intra_op_num_threads = int(intra_op_threads)
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        path = model_file(model_dir, quantized)
+        self.session = ort.InferenceSession(
+            path, sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(
+            pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"]
+        )
+        logger.info("Loaded ONNX model %s", path)
+
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """Tokens per text after truncation, special tokens included."""
+        enc = self.tokenizer.encode_batch(texts)
+        return np.array([sum(e.attention_mask) for e in enc], dtype=np.int64)
+
+    def encode(self, texts: List[str], batch_size: int | None = None) -> np.ndarray:
+        """Un-normalized (n, dim) float32 sentence vectors."""
+        batch_size = batch_size or self.batch_size
+        out = []
+        for start in range(0, len(texts), batch_size):
+            enc = self.tokenizer.encode_batch(texts[start : start + batch_size])
+            mask = np.array([e.attention_mask for e in enc], dtype=np.int64)
+            feed = {
+                "input_ids": np.array([e.ids for e in enc], dtype=np.int64),
+                "attention_mask": mask,
+                "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64),
+            }
+            feed = {n: feed[n] for n in self.config["inputs"]}
+            tokens = self.session.run(None, feed)[0]
+            out.append(pool(tokens, mask, self.config["pooling"]))
+        return np.vstack(out).astype(np.float32)
@@ -1,5 +1,7 @@
 """Index package: FAISS store and SQLite metadata mapping."""
 
+from .filters import FilterError
+from .shards import ShardedIndexer, open_indexer
 from .store import Indexer
 
-__all__ = ["Indexer"]
+__all__ = ["FilterError", "Indexer", "ShardedIndexer", "open_indexer"]
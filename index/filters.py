@@ -0,0 +1,203 @@
+"""Metadata filter expressions resolved against the `doc_fields` inverted table.
+
+Grammar (keywords are case-insensitive)::
+
+    expr := term (("and" | "or") term)*      -- "and" binds tighter
+    term := "not" term | "(" expr ")" | FIELD OP VALUE
+    OP   := "=" | "!=" | "^=" (prefix) | "$=" (suffix)
+
+VALUE is a bare word or a single/double-quoted string. List-valued fields
+(e.g. frontmatter `tags`) match if any element matches. Examples::
+
+    source^=/data/contracts
+    ext=md and tags="due diligence"
+    not (author=alice or author=bob)
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Tuple
+
+# chunk metadata keys that are never useful as filters
+_SKIP_KEYS = {"tables", "pii_warnings"}
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<paren>[()])
+      | (?P<op>!=|\^=|\$=|=)
+      | "(?P<dq>(?:[^"\\]|\\.)*)"
+      | '(?P<sq>[^']*)'
+      | (?P<word>[^\s()=!^$"']+)
+    )""",
+    re.VERBOSE,
+)
+_KEYWORDS = {"and", "or", "not"}
+# upper bound for prefix range scans on the (key, value) index
+_MAX_CHAR = "\U0010ffff"
+
+
+class FilterError(ValueError):
+    """Raised for filter expressions that do not parse."""
+
+
+def field_rows(meta: Dict) -> List[Tuple[str, str]]:
+    """(key, value) rows to index for one chunk's metadata.
+
+    Scalars are stored as text, lists get one row per scalar element and
+    nested dicts are flattened with dotted keys. `ext` (the lower-case file
+    extension of `name`) is derived so "only markdown" is `ext=md`.
+    """
+    rows: List[Tuple[str, str]] = []
+
+    def add(key: str, value) -> None:
+        if isinstance(value, dict):
+            for k, v in value.items():
+                add(f"{key}.{k}", v)
+        elif isinstance(value, (list, tuple, set)):
+            for v in value:
+                if not isinstance(v, (dict, list, tuple, set)):
+                    add(key, v)
+        elif isinstance(value, bool):
+            rows.append((key, "true" if value else "false"))
+        elif value is not None:
+            rows.append((key, str(value)))
+
+    for key, value in meta.items():
+        if key not in _SKIP_KEYS:
+            add(str(key), value)
+    name = meta.get("name")
+    if isinstance(name, str) and "." in name and "ext" not in meta:
+        rows.append(("ext", name.rsplit(".", 1)[1].lower()))
+    return rows
+
+
+def _tokenize(expr: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if not m or m.end() == pos:
+            raise FilterError(f"unexpected character at {pos} in {expr!r}")
+        pos = m.end()
+        if m.group("paren"):
+            tokens.append(("paren", m.group("paren")))
+        elif m.group("op"):
+            tokens.append(("op", m.group("op")))
+        elif m.group("dq") is not None:
+            tokens.append(("str", re.sub(r"\\(.)", r"\1", m.group("dq"))))
+        elif m.group("sq") is not None:
+            tokens.append(("str", m.group("sq")))
+        else:
+            word = m.group("word")
+            kind = "kw" if word.lower() in _KEYWORDS else "word"
+            tokens.append((kind, word.lower() if kind == "kw" else word))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, expr: str):
+        self.expr = expr
+        self.tokens = _tokenize(expr)
+        self.pos = 0
+
+    def peek(self) -> Tuple[str, str] | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> Tuple[str, str]:
+        tok = self.peek()
+        if tok is None:
+            raise FilterError(f"unexpected end of filter {self.expr!r}")
+        self.pos += 1
+        return tok
+
+    def parse(self) -> tuple:
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise FilterError(f"unexpected {self.peek()[1]!r} in {self.expr!r}")
+        return node
+
+    def parse_or(self) -> tuple:
+        node = self.parse_and()
+        while self.peek() == ("kw", "or"):
+            self.take()
+            node = ("or", node, self.parse_and())
+        return node
+
+    def parse_and(self) -> tuple:
+        node = self.parse_term()
+        while self.peek() == ("kw", "and"):
+            self.take()
+            node = ("and", node, self.parse_term())
+        return node
+
+    def parse_term(self) -> tuple:
+        kind, value = self.take()
+        if (kind, value) == ("kw", "not"):
+            return ("not", self.parse_term())
+        if (kind, value) == ("paren", "("):
+            node = self.parse_or()
+            if self.take() != ("paren", ")"):
+                raise FilterError(f"missing ')' in {self.expr!r}")
+            return node
+        if kind not in ("word", "str"):
+            raise FilterError(f"expected a field name, got {value!r}")
+        op_kind, op = self.take()
+        if op_kind != "op":
+            raise FilterError(f"expected an operator after {value!r}, got {op!r}")
+        val_kind, val = self.take()
+        if val_kind not in ("word", "str", "kw"):
+            raise FilterError(f"expected a value after {value}{op}")
+        return ("cmp", value, op, val)
+
+
+def parse_filter(expr: str) -> tuple:
+    """Parse `expr` into a nested tuple tree; raises FilterError."""
+    if not expr or not expr.strip():
+        raise FilterError("empty filter expression")
+    return _Parser(expr).parse()
+
+
+def filter_sql(node: tuple) -> Tuple[str, List[str]]:
+    """Compile a parsed filter to a SELECT of matching faiss_ids."""
+    kind = node[0]
+    if kind == "cmp":
+        _, key, op, value = node
+        if op in ("=", "!="):
+            sql = "SELECT faiss_id FROM doc_fields WHERE key = ? AND value = ?"
+            params = [key, value]
+        elif op == "^=":
+            # range scan keeps the (key, value) index usable
+            sql = (
+                "SELECT faiss_id FROM doc_fields "
+                "WHERE key = ? AND value >= ? AND value < ?"
+            )
+            params = [key, value, value + _MAX_CHAR]
+        else:  # "$="
+            # case-sensitive like "=" and "^=", unlike LIKE
+            sql = (
+                "SELECT faiss_id FROM doc_fields WHERE key = ? "
+                "AND substr(value, length(value) - length(?) + 1) = ?"
+            )
+            params = [key, value, value]
+        if op == "!=":
+            return _negate(sql, params)
+        return sql, params
+    if kind == "not":
+        return _negate(*filter_sql(node[1]))
+    left_sql, left_params = filter_sql(node[1])
+    right_sql, right_params = filter_sql(node[2])
+    compound = "INTERSECT" if kind == "and" else "UNION"
+    sql = (
+        f"SELECT faiss_id FROM ({left_sql}) {compound} "
+        f"SELECT faiss_id FROM ({right_sql})"
+    )
+    return sql, left_params + right_params
+
+
+def _negate(sql: str, params: List[str]) -> Tuple[str, List[str]]:
+    return (
+        f"SELECT faiss_id FROM documents EXCEPT SELECT faiss_id FROM ({sql})",
+        params,
+    )
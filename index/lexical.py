@@ -0,0 +1,470 @@
+"""Persistent BM25 inverted index stored next to the chunk metadata in SQLite.
+
+Postings are kept in blocks of delta-encoded ids with their term frequencies
+and document lengths, one row per (term, block). Chunks get dense internal
+document numbers (`bm25_docs` maps them to faiss_ids), so the deltas stay
+small whatever the FAISS ids look like. Each `add` writes one small block per
+term; `compact` merges a term's partial blocks into blocks of up to
+`block_size` postings. `remove` rewrites only the blocks that hold the
+removed chunks. Queries are scored term-at-a-time with MaxScore: once
+the remaining terms cannot lift an unseen chunk into the top k, they only
+update existing candidates and blocks without candidates are never decoded.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import (
+    Column,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    bindparam,
+    func,
+    select,
+    tuple_,
+)
+
+from db import LOOKUP_CHUNK
+
+logger = logging.getLogger("agent.index.lexical")
+
+_metadata = MetaData()
+postings_table = Table(
+    "bm25_postings",
+    _metadata,
+    Column("term", String, primary_key=True),
+    Column("first_id", Integer, primary_key=True),  # ids are docnos
+    Column("last_id", Integer),
+    Column("n", Integer),
+    Column("max_tf", Integer),
+    Column("width", Integer),  # bytes per id delta: 1, 2, 4 or 8
+    Column("ids", LargeBinary),  # deltas after first_id
+    Column("tfs", LargeBinary),  # uint16 term frequencies
+    Column("lens", LargeBinary),  # uint16 document lengths (in tokens)
+)
+docs_table = Table(
+    "bm25_docs",
+    _metadata,
+    Column("docno", Integer, primary_key=True),
+    Column("faiss_id", Integer, unique=True, index=True),
+)
+stats_table = Table(
+    "bm25_stats",
+    _metadata,
+    Column("key", String, primary_key=True),
+    Column("value", Integer),
+)
+
+_WIDTHS = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SPLIT = re.compile(r"[-_./]")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or "
+    "that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens without stopwords.
+
+    Compound tokens such as part numbers (``ab-1234``, ``v2.1``) are kept
+    whole and also split into their parts.
+    """
+    out: List[str] = []
+    for tok in _TOKEN.findall(text.lower()):
+        if tok in _STOPWORDS:
+            continue
+        out.append(tok)
+        if _SPLIT.search(tok):
+            out.extend(p for p in _SPLIT.split(tok) if p and p not in _STOPWORDS)
+    return out
+
+
+def _encode_ids(ids: np.ndarray) -> Tuple[int, bytes]:
+    deltas = np.diff(ids)
+    top = int(deltas.max()) if deltas.size else 0
+    width = 1 if top < 1 << 8 else 2 if top < 1 << 16 else 4 if top < 1 << 32 else 8
+    return width, deltas.astype(_WIDTHS[width]).tobytes()
+
+
+def _decode_ids(first_id: int, width: int, blob: bytes) -> np.ndarray:
+    deltas = np.frombuffer(blob, dtype=_WIDTHS[width]).astype(np.int64)
+    out = np.empty(deltas.size + 1, dtype=np.int64)
+    out[0] = first_id
+    np.cumsum(deltas, out=out[1:])
+    out[1:] += first_id
+    return out
+
+
+def _block_row(term: str, ids: np.ndarray, tfs: np.ndarray, lens: np.ndarray) -> Dict:
+    width, id_blob = _encode_ids(ids)
+    return {
+        "term": term,
+        "first_id": int(ids[0]),
+        "last_id": int(ids[-1]),
+        "n": int(ids.size),
+        "max_tf": int(tfs.max()),
+        "width": width,
+        "ids": id_blob,
+        "tfs": tfs.astype(np.uint16).tobytes(),
+        "lens": lens.astype(np.uint16).tobytes(),
+    }
+
+
+class BM25Index:
+    def __init__(
+        self,
+        engine,
+        k1: float = 1.2,
+        b: float = 0.75,
+        block_size: int = 4096,
+    ):
+        self.engine = engine
+        self.k1 = k1
+        self.b = b
+        self.block_size = block_size
+        _metadata.create_all(engine)
+        # terms with new partial blocks since the last compact()
+        self._dirty: set = set()
+
+    def add(self, conn, ids: Sequence[int], texts: Iterable[str]) -> None:
+        """Index `texts` under faiss_ids `ids` using the caller's connection,
+        so the postings commit together with the chunk metadata."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return
+        last = conn.execute(select(func.max(docs_table.c.docno))).scalar()
+        start = 0 if last is None else int(last) + 1
+        conn.execute(
+            docs_table.insert(),
+            [{"docno": start + j, "faiss_id": fid} for j, fid in enumerate(ids)],
+        )
+        vocab: Dict[str, int] = {}
+        term_ix: List[int] = []
+        post: List[Tuple[int, int, int]] = []  # (docno, tf, doc length)
+        n_docs = 0
+        n_tokens = 0
+        for docno, text in enumerate(texts, start=start):
+            tokens = tokenize(text or "")
+            length = min(len(tokens), 65535)
+            n_docs += 1
+            n_tokens += length
+            for term, tf in Counter(tokens).items():
+                term_ix.append(vocab.setdefault(term, len(vocab)))
+                post.append((docno, min(tf, 65535), length))
+        if post:
+            # group postings by term with one sort instead of per-term lists
+            t = np.array(term_ix, dtype=np.int64)
+            p = np.array(post, dtype=np.int64)
+            order = np.lexsort((p[:, 0], t))
+            t, p = t[order], p[order]
+            bounds = np.flatnonzero(np.diff(t)) + 1
+            terms = list(vocab)
+            rows = [
+                _block_row(terms[int(seg_t[0])], seg[:, 0], seg[:, 1], seg[:, 2])
+                for seg_t, seg in zip(np.split(t, bounds), np.split(p, bounds))
+            ]
+            conn.execute(postings_table.insert(), rows)
+        self._bump_stats(conn, n_docs, n_tokens)
+        self._dirty.update(vocab)
+
+    def remove(self, conn, ids: Sequence[int], texts: Iterable[str]) -> int:
+        """Drop the postings of faiss_ids `ids`, whose stored `texts` name the
+        terms to visit; returns the number of chunks removed."""
+        texts = dict(zip((int(i) for i in ids), texts))
+        fids = list(texts)
+        docnos: Dict[int, int] = {}
+        for s in range(0, len(fids), LOOKUP_CHUNK):
+            chunk = fids[s : s + LOOKUP_CHUNK]
+            docnos.update(
+                (fid, dn)
+                for dn, fid in conn.execute(
+                    select(docs_table.c.docno, docs_table.c.faiss_id).where(
+                        docs_table.c.faiss_id.in_(chunk)
+                    )
+                )
+            )
+        if not docnos:
+            return 0
+        by_term: Dict[str, List[int]] = {}
+        n_tokens = 0
+        for fid, dn in docnos.items():
+            tokens = tokenize(texts[fid] or "")
+            n_tokens += min(len(tokens), 65535)
+            for term in set(tokens):
+                by_term.setdefault(term, []).append(dn)
+        cols = postings_table.c
+        terms = sorted(by_term)
+        for s in range(0, len(terms), LOOKUP_CHUNK):
+            spans = conn.execute(
+                select(cols.term, cols.first_id, cols.last_id).where(
+                    cols.term.in_(terms[s : s + LOOKUP_CHUNK])
+                )
+            ).fetchall()
+            # only blocks whose id range covers a removed chunk are touched
+            keys = [
+                (term, first)
+                for term, first, last in spans
+                if any(first <= dn <= last for dn in by_term[term])
+            ]
+            stale = []
+            fresh = []
+            for k in range(0, len(keys), LOOKUP_CHUNK):
+                blocks = conn.execute(
+                    select(postings_table).where(
+                        tuple_(cols.term, cols.first_id).in_(
+                            keys[k : k + LOOKUP_CHUNK]
+                        )
+                    )
+                ).fetchall()
+                for r in blocks:
+                    ids, tfs, lens = self._decode([r])
+                    keep = ~np.isin(ids, by_term[r.term])
+                    if keep.all():
+                        continue
+                    stale.append({"t": r.term, "f": r.first_id})
+                    if keep.any():
+                        fresh.append(
+                            _block_row(r.term, ids[keep], tfs[keep], lens[keep])
+                        )
+                        self._dirty.add(r.term)
+            if stale:
+                conn.execute(
+                    postings_table.delete().where(
+                        cols.term == bindparam("t"), cols.first_id == bindparam("f")
+                    ),
+                    stale,
+                )
+            if fresh:
+                conn.execute(postings_table.insert(), fresh)
+        conn.execute(
+            docs_table.delete().where(docs_table.c.docno.in_(list(docnos.values())))
+        )
+        self._bump_stats(conn, -len(docnos), -n_tokens)
+        return len(docnos)
+
+    def _bump_stats(self, conn, n_docs: int, n_tokens: int) -> None:
+        conn.execute(
+            stats_table.insert().prefix_with("OR IGNORE"),
+            [{"key": "docs", "value": 0}, {"key": "tokens", "value": 0}],
+        )
+        conn.execute(
+            stats_table.update()
+            .where(stats_table.c.key == bindparam("k"))
+            .values(value=stats_table.c.value + bindparam("v")),
+            [{"k": "docs", "v": n_docs}, {"k": "tokens", "v": n_tokens}],
+        )
+
+    def compact(self) -> int:
+        """Merge the partial blocks of recently written terms; returns the
+        number of terms rewritten."""
+        terms = sorted(self._dirty)
+        self._dirty.clear()
+        cols = postings_table.c
+        merged = 0
+        with self.engine.begin() as conn:
+            for s in range(0, len(terms), LOOKUP_CHUNK):
+                rows = conn.execute(
+                    select(postings_table)
+                    .where(
+                        cols.term.in_(terms[s : s + LOOKUP_CHUNK]),
+                        cols.n < self.block_size,
+                    )
+                    .order_by(cols.term, cols.first_id)
+                ).fetchall()
+                by_term: Dict[str, list] = {}
+                for r in rows:
+                    by_term.setdefault(r.term, []).append(r)
+                stale = []
+                fresh = []
+                for term, blocks in by_term.items():
+                    if len(blocks) < 2:
+                        continue
+                    ids, tfs, lens = self._decode(blocks)
+                    order = np.argsort(ids, kind="stable")
+                    ids, tfs, lens = ids[order], tfs[order], lens[order]
+                    stale.extend({"t": term, "f": r.first_id} for r in blocks)
+                    for b in range(0, ids.size, self.block_size):
+                        end = b + self.block_size
+                        fresh.append(
+                            _block_row(term, ids[b:end], tfs[b:end], lens[b:end])
+                        )
+                    merged += 1
+                if stale:
+                    conn.execute(
+                        postings_table.delete().where(
+                            cols.term == bindparam("t"),
+                            cols.first_id == bindparam("f"),
+                        ),
+                        stale,
+                    )
+                    conn.execute(postings_table.insert(), fresh)
+        if merged:
+            logger.info("Compacted BM25 postings of %d terms", merged)
+        return merged
+
+    def clear(self) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(postings_table.delete())
+            conn.execute(docs_table.delete())
+            conn.execute(stats_table.delete())
+        self._dirty.clear()
+
+    @staticmethod
+    def _decode(rows) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        ids = [_decode_ids(r.first_id, r.width, r.ids) for r in rows]
+        tfs = [np.frombuffer(r.tfs, dtype=np.uint16) for r in rows]
+        lens = [np.frombuffer(r.lens, dtype=np.uint16) for r in rows]
+        return np.concatenate(ids), np.concatenate(tfs), np.concatenate(lens)
+
+    def docnos_matching(self, sql: str, params: Sequence) -> np.ndarray:
+        """Sorted docnos of the faiss_ids selected by `sql` (e.g. a compiled
+        metadata filter), for use as `search(..., allowed=...)`."""
+        with self.engine.connect() as conn:
+            rows = conn.exec_driver_sql(
+                f"SELECT docno FROM bm25_docs WHERE faiss_id IN ({sql}) "
+                "ORDER BY docno",
+                tuple(params),
+            ).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+
+    def search(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        allowed: Optional[np.ndarray] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """BM25 top-k per query text as (faiss_id, score) lists.
+
+        `allowed` (sorted docnos, see `docnos_matching`) restricts results.
+        """
+        with self.engine.connect() as conn:
+            stats = dict(
+                conn.execute(select(stats_table.c.key, stats_table.c.value)).all()
+            )
+            n_docs = int(stats.get("docs") or 0)
+            if not n_docs:
+                return [[] for _ in queries]
+            avgdl = max(int(stats.get("tokens") or 0) / n_docs, 1.0)
+            hits = [
+                self._search_one(conn, q, top_k, allowed, n_docs, avgdl)
+                for q in queries
+            ]
+            wanted = sorted({dn for row in hits for dn, _ in row})
+            to_faiss = dict(
+                conn.execute(
+                    select(docs_table.c.docno, docs_table.c.faiss_id).where(
+                        docs_table.c.docno.in_(wanted)
+                    )
+                ).all()
+            )
+        return [[(to_faiss[dn], score) for dn, score in row] for row in hits]
+
+    def _search_one(
+        self,
+        conn,
+        query: str,
+        top_k: int,
+        allowed: Optional[np.ndarray],
+        n_docs: int,
+        avgdl: float,
+    ) -> List[Tuple[int, float]]:
+        terms = sorted(set(tokenize(query)))
+        if not terms or top_k <= 0:
+            return []
+        term_stats = conn.execute(
+            select(
+                postings_table.c.term,
+                func.sum(postings_table.c.n),
+                func.max(postings_table.c.max_tf),
+            )
+            .where(postings_table.c.term.in_(terms))
+            .group_by(postings_table.c.term)
+        ).fetchall()
+        k1, b = self.k1, self.b
+        plan = []
+        for term, df, max_tf in term_stats:
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            # score bound: highest tf in the shortest possible chunk
+            ub = idf * max_tf * (k1 + 1) / (max_tf + k1 * (1 - b))
+            plan.append((ub, idf, term))
+        # high-impact (rare) terms first; common terms become non-essential
+        plan.sort(reverse=True)
+        remaining = np.cumsum([ub for ub, _, _ in plan][::-1])[::-1]
+
+        cand_ids = np.empty(0, dtype=np.int64)
+        cand_scores = np.empty(0, dtype=np.float64)
+        theta = 0.0
+        for i, (_, idf, term) in enumerate(plan):
+            essential = cand_ids.size < top_k or remaining[i] > theta
+            ids, tfs, lens = self._postings(conn, term, None if essential else cand_ids)
+            if ids.size and allowed is not None:
+                keep = np.isin(ids, allowed, assume_unique=False)
+                ids, tfs, lens = ids[keep], tfs[keep], lens[keep]
+            if ids.size:
+                tf = tfs.astype(np.float64)
+                norm = k1 * (1 - b + b * lens.astype(np.float64) / avgdl)
+                scores = idf * tf * (k1 + 1) / (tf + norm)
+                if essential:
+                    all_ids = np.concatenate([cand_ids, ids])
+                    cand_ids, inv = np.unique(all_ids, return_inverse=True)
+                    cand_scores = np.bincount(
+                        inv,
+                        weights=np.concatenate([cand_scores, scores]),
+                        minlength=cand_ids.size,
+                    )
+                else:
+                    # only chunks that are already candidates gain score
+                    pos = np.searchsorted(cand_ids, ids)
+                    pos[pos == cand_ids.size] = 0
+                    hit = cand_ids[pos] == ids
+                    np.add.at(cand_scores, pos[hit], scores[hit])
+            if cand_ids.size >= top_k:
+                theta = float(np.partition(cand_scores, -top_k)[-top_k])
+                if i + 1 < len(plan):
+                    # drop candidates that cannot reach the top k any more
+                    alive = cand_scores + remaining[i + 1] >= theta
+                    cand_ids, cand_scores = cand_ids[alive], cand_scores[alive]
+        order = np.lexsort((cand_ids, -cand_scores))[:top_k]
+        return [(int(cand_ids[j]), float(cand_scores[j])) for j in order]
+
+    def _postings(
+        self, conn, term: str, candidates: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Decode a term's postings; with `candidates` (sorted), only blocks
+        whose id range contains one of them are read."""
+        cols = postings_table.c
+        query = select(cols.first_id, cols.width, cols.ids, cols.tfs, cols.lens)
+        query = query.where(cols.term == term)
+        if candidates is not None:
+            if candidates.size == 0:
+                return (np.empty(0, np.int64),) * 3
+            spans = conn.execute(
+                select(cols.first_id, cols.last_id).where(cols.term == term)
+            ).fetchall()
+            firsts = np.array([s[0] for s in spans], dtype=np.int64)
+            lasts = np.array([s[1] for s in spans], dtype=np.int64)
+            lo = np.searchsorted(candidates, firsts, side="left")
+            hi = np.searchsorted(candidates, lasts, side="right")
+            wanted = firsts[hi > lo].tolist()
+            if not wanted:
+                return (np.empty(0, np.int64),) * 3
+            rows = []
+            for s in range(0, len(wanted), LOOKUP_CHUNK):
+                rows += conn.execute(
+                    query.where(cols.first_id.in_(wanted[s : s + LOOKUP_CHUNK]))
+                ).fetchall()
+        else:
+            rows = conn.execute(query).fetchall()
+        if not rows:
+            return (np.empty(0, np.int64),) * 3
+        return self._decode(rows)
@@ -0,0 +1,479 @@
+"""Sharded index: N independent `Indexer`s, each with its own FAISS file and
+metadata DB, behind the same interface.
+
+Documents are routed by document key (see `store.doc_key`): either by hash
+into a fixed number of shards, or by collection (the parent folder of the
+source), one shard per collection. Searches fan out over the shards in a
+thread pool (FAISS releases the GIL) and the per-shard top-k lists are
+merged with a heap. Shards are opened on first use, so a process that only
+queries some of them (`only=`) never maps the others.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+import numpy as np
+import faiss
+
+from .store import (
+    DocumentMeta,
+    Hydrated,
+    IndexStats,
+    Indexer,
+    chunk_id,
+    doc_key,
+    index_version,
+)
+
+logger = logging.getLogger("agent.index.shards")
+
+T = TypeVar("T")
+
+_UNSAFE = re.compile(r"[^\w.-]+")
+
+
+def shard_for_key(key: str, n_shards: int, shard_by: str = "hash") -> str:
+    """Name of the shard that holds document `key`."""
+    if shard_by == "collection":
+        name = _UNSAFE.sub("_", Path(key).parent.name).strip("._")
+        return name or "default"
+    if shard_by != "hash":
+        raise ValueError(f"Unknown shard_by {shard_by!r}")
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return f"shard{int.from_bytes(digest, 'little') % n_shards:03d}"
+
+
+def open_indexer(only: Optional[List[str]] = None, **kwargs):
+    """The configured index: a `ShardedIndexer` when `index.shards` > 1 or
+    `index.shard_by` is "collection", otherwise a plain `Indexer`."""
+    import yaml
+
+    try:
+        cfg = yaml.safe_load(open("config.yml"))
+    except Exception:
+        cfg = {}
+    icfg = cfg.get("index", {}) or {}
+    if int(icfg.get("shards", 1)) > 1 or icfg.get("shard_by") == "collection":
+        return ShardedIndexer(only=only, **kwargs)
+    return Indexer(**kwargs)
+
+
+class ShardedIndexer:
+    def __init__(
+        self,
+        shard_dir: str | None = None,
+        n_shards: int | None = None,
+        shard_by: str | None = None,
+        only: Optional[List[str]] = None,
+        search_workers: int | None = None,
+        index_type: str | None = None,
+        persistence: str | None = None,
+        embedding_format: str | None = None,
+        load_mode: str | None = None,
+        vector_dtype: str | None = None,
+    ):
+        import yaml
+
+        try:
+            cfg = yaml.safe_load(open("config.yml"))
+        except Exception:
+            cfg = {}
+        icfg = cfg.get("index", {}) or {}
+        self.shard_dir = shard_dir or icfg.get("shard_dir", "data/shards")
+        self.n_shards = int(n_shards or icfg.get("shards", 1))
+        self.shard_by = shard_by or icfg.get("shard_by", "hash")
+        if self.shard_by not in ("hash", "collection"):
+            raise ValueError(f"Unknown shard_by {self.shard_by!r}")
+        # restrict reads to these shards; None means every shard on disk
+        self.only = set(only) if only else None
+        self.index_type = index_type or icfg.get("type", "FlatIP")
+        self.train_size = int(icfg.get("train_size", 50000))
+        self._shard_kwargs = dict(
+            index_type=self.index_type,
+            persistence=persistence,
+            embedding_format=embedding_format,
+            load_mode=load_mode,
+            vector_dtype=vector_dtype,
+        )
+        # sidecar state shared by all shards (e.g. the TF-IDF fit) uses this
+        self.faiss_path = os.path.join(self.shard_dir, "faiss.index")
+        os.makedirs(self.shard_dir, exist_ok=True)
+        # trained but empty index that new shards start from (IVF / PQ)
+        self._template = Indexer(
+            faiss_path=os.path.join(self.shard_dir, "trained.index"),
+            sqlite_path=os.path.join(self.shard_dir, "trained.db"),
+            **self._shard_kwargs,
+        )
+        self._shards: Dict[str, Indexer] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        # open bulk() block; shards opened inside it join the transaction
+        self._bulk: Optional[ExitStack] = None
+        workers = search_workers or int(
+            icfg.get("search_workers", min(8, os.cpu_count() or 1))
+        )
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="shard"
+        )
+
+    def shard_for(self, key: str) -> str:
+        return shard_for_key(key, self.n_shards, self.shard_by)
+
+    def shard_names(self) -> List[str]:
+        """Shards that exist on disk (and pass `only`), in name order."""
+        names = [
+            p.name
+            for p in Path(self.shard_dir).iterdir()
+            if p.is_dir() and (p / "meta.db").exists()
+        ]
+        if self.only is not None:
+            names = [n for n in names if n in self.only]
+        return sorted(names)
+
+    def shard(self, name: str) -> Indexer:
+        """The Indexer of shard `name`; its FAISS index loads on first use."""
+        with self._lock:
+            idx = self._shards.get(name)
+            if idx is None:
+                path = os.path.join(self.shard_dir, name)
+                os.makedirs(path, exist_ok=True)
+                idx = Indexer(
+                    faiss_path=os.path.join(path, "faiss.index"),
+                    sqlite_path=os.path.join(path, "meta.db"),
+                    **self._shard_kwargs,
+                )
+                if self._bulk is not None:
+                    self._bulk.enter_context(idx.bulk())
+                self._shards[name] = idx
+                self._locks[name] = threading.Lock()
+            return idx
+
+    def _loaded(self, name: str) -> Indexer:
+        idx = self.shard(name)
+        with self._locks[name]:
+            if idx.index is None:
+                idx.load()
+        return idx
+
+    def _writable(self, name: str) -> Indexer:
+        idx = self._loaded(name)
+        with self._locks[name]:
+            index = idx.index
+            if index is None:
+                raise RuntimeError(f"shard {name} failed to load")
+            if not index.ntotal and not index.is_trained:
+                if not self._template.needs_training():
+                    # start from the shared trained quantizer
+                    idx.index = faiss.read_index(self._template.faiss_path)
+                    idx.dim = int(idx.index.d)
+                    idx.flush()
+        return idx
+
+    def _fan_out(self, fn: Callable[[Indexer], T]) -> List[T]:
+        names = self.shard_names()
+        return list(self._pool.map(lambda n: fn(self._loaded(n)), names))
+
+    def _group(self, keys: List[str]) -> Dict[str, List[int]]:
+        """Positions of `keys` grouped by shard name."""
+        groups: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self.shard_for(key), []).append(i)
+        return groups
+
+    def _all_names(self) -> List[str]:
+        """Shards on disk plus any opened in this process but not yet written."""
+        return sorted(set(self.shard_names()) | set(self._shards))
+
+    def load(self):
+        """(Re)load every shard, replaying its append log."""
+
+        def reload(name: str):
+            idx = self.shard(name)
+            with self._locks[name]:
+                idx.load()
+
+        list(self._pool.map(reload, self._all_names()))
+
+    @contextmanager
+    def bulk(self):
+        """One SQLite transaction per shard for this block, see Indexer.bulk()."""
+        with ExitStack() as stack:
+            with self._lock:
+                for idx in self._shards.values():
+                    stack.enter_context(idx.bulk())
+                self._bulk = stack
+            try:
+                yield self
+            finally:
+                self._bulk = None
+
+    def flush(self):
+        """Checkpoint every shard that is loaded or has a pending append log;
+        the rest are already folded into their index file."""
+        for name in self._all_names():
+            idx = self.shard(name)
+            if idx.index is not None or os.path.exists(idx.log_path):
+                self._loaded(name).flush()
+
+    def rebuild(self):
+        names = self.shard_names()
+        for name in names:
+            self.shard(name).rebuild()
+        self._template.rebuild()
+        for path in (self._template.faiss_path, self._template.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info("Rebuilt %d empty shards in %s", len(names), self.shard_dir)
+
+    def needs_training(self) -> bool:
+        return self._template.needs_training()
+
+    def train(self, sample: np.ndarray):
+        """Train the shared quantizer once; every shard starts from a copy."""
+        self._template.train(sample)
+
+    def add(self, embeddings: np.ndarray, docs: List[Dict]) -> np.ndarray:
+        """Add chunks to their shards; returns faiss_ids aligned with docs."""
+        if self.needs_training():
+            raise ValueError(
+                f"Index type {self.index_type} must be trained before add()"
+            )
+        for name, pos in self._group([doc_key(d) for d in docs]).items():
+            self._writable(name).add(embeddings[pos], [docs[i] for i in pos])
+        return self._ids(docs)
+
+    def upsert(self, embeddings: np.ndarray, docs: List[Dict]) -> np.ndarray:
+        for name, pos in self._group([doc_key(d) for d in docs]).items():
+            self._writable(name).upsert(embeddings[pos], [docs[i] for i in pos])
+        return self._ids(docs)
+
+    @staticmethod
+    def _ids(docs: List[Dict]) -> np.ndarray:
+        return np.array(
+            [
+                chunk_id(doc_key(d), d.get("metadata", {}).get("chunk_index", 0))
+                for d in docs
+            ],
+            dtype=np.int64,
+        )
+
+    def delete(self, doc_ids: str | List[str]) -> int:
+        if isinstance(doc_ids, str):
+            doc_ids = [doc_ids]
+        n = 0
+        existing = set(self.shard_names())
+        for name, pos in self._group(list(doc_ids)).items():
+            if name in existing:
+                n += self._loaded(name).delete([doc_ids[i] for i in pos])
+        return n
+
+    remove_sources = delete
+
+    def file_manifest(self) -> Dict[str, Dict]:
+        manifest: Dict[str, Dict] = {}
+        for name in self.shard_names():
+            manifest.update(self.shard(name).file_manifest())
+        return manifest
+
+    def record_files(self, records: List[Dict]):
+        for name, pos in self._group([r["path"] for r in records]).items():
+            self.shard(name).record_files([records[i] for i in pos])
+
+    def forget_files(self, paths: List[str]):
+        existing = set(self.shard_names())
+        for name, pos in self._group(list(paths)).items():
+            if name in existing:
+                self.shard(name).forget_files([paths[i] for i in pos])
+
+    def reindex_fields(self) -> int:
+        return sum(self.shard(n).reindex_fields() for n in self.shard_names())
+
+    def reindex_lexical(self) -> int:
+        return sum(self.shard(n).reindex_lexical() for n in self.shard_names())
+
+    def migrate_embeddings_to_mmap(self, purge: bool = False) -> int:
+        """Indexer.migrate_embeddings_to_mmap() on every shard; each logs the
+        sidecar file it wrote."""
+        return sum(
+            self.shard(n).migrate_embeddings_to_mmap(purge=purge)
+            for n in self.shard_names()
+        )
+
+    def search(
+        self,
+        query_emb: np.ndarray,
+        top_k: int = 5,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+    ) -> List[Tuple[int, float]]:
+        return self.search_batch(
+            query_emb, top_k=top_k, nprobe=nprobe, ef_search=ef_search
+        )[0]
+
+    def search_batch(
+        self,
+        query_embs: np.ndarray,
+        top_k: int = 5,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        filter_expr: str | None = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """Search every shard in parallel and merge the top-k per query."""
+        query_embs = np.atleast_2d(np.asarray(query_embs, dtype=np.float32))
+        per_shard = self._fan_out(
+            lambda idx: idx.search_batch(
+                query_embs,
+                top_k=top_k,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                filter_expr=filter_expr,
+            )
+        )
+        # L2 indexes (FlatL2, HNSW) return distances: smaller is better
+        ascending = self.metric_type == faiss.METRIC_L2
+        return self._merge(per_shard, query_embs.shape[0], top_k, ascending)
+
+    @property
+    def metric_type(self) -> int:
+        """FAISS metric of the shards, see Indexer.metric_type."""
+        for idx in list(self._shards.values()):
+            if idx.index is not None:
+                return int(idx.index.metric_type)
+        return self._template.metric_type
+
+    def search_lexical(
+        self,
+        query_texts: List[str],
+        top_k: int = 5,
+        filter_expr: str | None = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """BM25 per shard, merged by score; IDF statistics are per shard,
+        which is close to global ones when documents are hash-routed."""
+        per_shard = self._fan_out(
+            lambda idx: idx.search_lexical(
+                query_texts, top_k=top_k, filter_expr=filter_expr
+            )
+        )
+        return self._merge(per_shard, len(query_texts), top_k, False)
+
+    @staticmethod
+    def _merge(
+        per_shard: List, n_queries: int, top_k: int, ascending: bool
+    ) -> List[List[Tuple[int, float]]]:
+        # each shard's list is already sorted best-first
+        key = (lambda h: h[1]) if ascending else (lambda h: -h[1])
+        return [
+            list(
+                itertools.islice(
+                    heapq.merge(*(hits[q] for hits in per_shard), key=key), top_k
+                )
+            )
+            for q in range(n_queries)
+        ]
+
+    def select_ids(self, filter_expr: str) -> np.ndarray:
+        parts = [self.shard(n).select_ids(filter_expr) for n in self.shard_names()]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def fetch_metadata(self, faiss_ids: List[int]) -> List[Dict]:
+        return [m for m in self.hydrate(faiss_ids).metadata if m is not None]
+
+    def hydrate(self, faiss_ids: List[int], with_vectors: bool = False) -> Hydrated:
+        """Indexer.hydrate() on every shard in parallel; each id lives in
+        exactly one shard, the others return None for it."""
+        ids = [int(i) for i in faiss_ids]
+        parts = self._fan_out(lambda idx: idx.hydrate(ids, with_vectors))
+        out = Hydrated(metadata=[None] * len(ids))
+        for part in parts:
+            for row, m in enumerate(part.metadata):
+                if m is not None:
+                    out.metadata[row] = m
+        if not with_vectors:
+            return out
+        # with_vectors=True fills vectors / has_vector on every part
+        filled = [
+            (p.vectors, p.has_vector)
+            for p in parts
+            if p.vectors is not None and p.has_vector is not None
+        ]
+        dim = max((vecs.shape[1] for vecs, _ in filled), default=0)
+        vectors = np.zeros((len(ids), dim), dtype=np.float32)
+        has_vector = np.zeros(len(ids), dtype=bool)
+        for vecs, ok in filled:
+            if vecs.shape[1]:
+                vectors[ok] = vecs[ok]
+                has_vector |= ok
+        out.vectors, out.has_vector = vectors, has_vector
+        return out
+
+    def _route_ids(self, faiss_ids: List[int]) -> Dict[str, List[int]]:
+        """Positions of `faiss_ids` grouped by the shard that stores them."""
+        ids = np.asarray(faiss_ids, dtype=np.int64)
+        where = {i: p for p, i in enumerate(ids.tolist())}
+        routed: Dict[str, List[int]] = {}
+        for name in self.shard_names():
+            known = self.shard(name)._known_ids(ids)
+            if known:
+                routed[name] = [where[i] for i in known]
+        return routed
+
+    def fetch_embeddings(self, faiss_ids: List[int]) -> List[Optional[np.ndarray]]:
+        """Vectors in the order of `faiss_ids`; None for unknown ids."""
+        out: List[Optional[np.ndarray]] = [None] * len(faiss_ids)
+        for name, pos in self._route_ids(faiss_ids).items():
+            vecs = self._loaded(name).fetch_embeddings([faiss_ids[p] for p in pos])
+            for p, v in zip(pos, vecs):
+                out[p] = v
+        return out
+
+    def fetch_embedding_matrix(
+        self, faiss_ids: List[int]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        mat = np.zeros((len(faiss_ids), 0), dtype=np.float32)
+        valid = np.zeros(len(faiss_ids), dtype=bool)
+        for name, pos in self._route_ids(faiss_ids).items():
+            sub, ok = self._loaded(name).fetch_embedding_matrix(
+                [faiss_ids[p] for p in pos]
+            )
+            if sub.shape[1] and not mat.shape[1]:
+                mat = np.zeros((len(faiss_ids), sub.shape[1]), dtype=np.float32)
+            if sub.shape[1]:
+                mat[pos] = sub
+                valid[pos] = ok
+        return mat, valid
+
+    def stats(self) -> IndexStats:
+        """Total and per-shard sizes. Shards that are not loaded report their
+        metadata row count instead of opening the FAISS file."""
+        sizes: Dict[str, int] = {}
+        for name in self.shard_names():
+            idx = self.shard(name)
+            if idx.index is not None:
+                sizes[name] = idx.stats().ntotal
+            else:
+                session = idx.Session()
+                try:
+                    sizes[name] = session.query(DocumentMeta).count()
+                finally:
+                    session.close()
+        return IndexStats(ntotal=sum(sizes.values()), shards=sizes)
+
+    def version(self) -> Tuple[int, ...]:
+        version: List[int] = []
+        for name in self.shard_names():
+            version += index_version(os.path.join(self.shard_dir, name, "faiss.index"))
+        return tuple(version)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
@@ -2,22 +2,63 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import os
-from dataclasses import dataclass
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 import faiss
-from sqlalchemy import Column, Integer, String, Text, LargeBinary, create_engine
+from sqlalchemy import (
+    Column,
+    Float,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    bindparam,
+    create_engine,
+    event,
+    func,
+    select,
+)
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from .filters import field_rows, filter_sql, parse_filter
+from .lexical import BM25Index
+
 
 logger = logging.getLogger("agent.index")
 Base = declarative_base()
 
+# append-log record header: magic, op, number of ids, dimension; followed by
+# the int64 ids and, for adds, their float32 vectors
+_LOG_RECORD = struct.Struct("<4sBqi")
+_LOG_MAGIC = b"IDL1"
+_OP_ADD = 1
+_OP_DELETE = 2
+# records written before stable ids: first positional id, rows, dimension
+_LEGACY_HEADER = struct.Struct("<qii")
+# load_mode "mmap": map codes and inverted lists instead of reading them;
+# FAISS < 1.11 only has IO_FLAG_MMAP (on-disk inverted lists for IVF)
+_MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+_JOURNAL_MODES = ("delete", "truncate", "persist", "memory", "wal", "off")
+_SYNCHRONOUS = ("off", "normal", "full", "extra")
+# storage.vector_dtype of embeddings BLOBs and the mmap sidecar; a BLOB's
+# size tells which one it was written with
+_VECTOR_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+# int8 rows are scaled so their largest component is +-127; readers only
+# need the direction, so the scale is not stored
+_INT8_MAX = 127.0
+
 
 class DocumentMeta(Base):
     __tablename__ = "documents"
@@ -27,6 +68,8 @@ class DocumentMeta(Base):
     chunk_index = Column(Integer)
     text = Column(Text)
     meta = Column(Text)  # json
+    source = Column(String, index=True)  # document key, see doc_key()
+    vec_row = Column(Integer)  # row in the mmap vector sidecar
 
 
 class Embedding(Base):
@@ -36,9 +79,213 @@ class Embedding(Base):
     vector = Column(LargeBinary)  # store raw float32 bytes
 
 
+class DocField(Base):
+    """Inverted index over chunk metadata: one row per (chunk, key, value).
+
+    Filter expressions (see index/filters.py) resolve to faiss_ids here.
+    """
+
+    __tablename__ = "doc_fields"
+    id = Column(Integer, primary_key=True)
+    faiss_id = Column(Integer, index=True)
+    key = Column(String)
+    value = Column(String)
+    __table_args__ = (Index("ix_doc_fields_key_value", "key", "value"),)
+
+
+class FileManifest(Base):
+    """One row per ingested file, used to skip unchanged files on re-ingest."""
+
+    __tablename__ = "files"
+    id = Column(Integer, primary_key=True)
+    path = Column(String, unique=True, index=True)
+    size = Column(Integer)
+    mtime = Column(Float)
+    content_hash = Column(String)  # sha256 hex digest
+    n_chunks = Column(Integer)
+
+
 @dataclass
 class IndexStats:
     ntotal: int
+    shards: Dict[str, int] = field(default_factory=dict)  # name -> vectors
+
+
+@dataclass
+class Hydrated:
+    """Chunks aligned with the requested ids; unknown ids are None."""
+
+    metadata: List[Optional[Dict]]
+    # (n, dim) L2-normalized vectors and the mask of rows that have one;
+    # only filled by hydrate(..., with_vectors=True)
+    vectors: Optional[np.ndarray] = None
+    has_vector: Optional[np.ndarray] = None
+
+
+class _ChunkCache:
+    """Thread-safe LRU of hydrated chunks: faiss_id -> (metadata, vector,
+    whether the vector was fetched). A vector of None means none is stored."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, ids: List[int]) -> List[Optional[Tuple]]:
+        if not self.max_entries:
+            return [None] * len(ids)
+        with self._lock:
+            out = [self._entries.get(i) for i in ids]
+            for i, entry in zip(ids, out):
+                if entry is not None:
+                    self._entries.move_to_end(i)
+            return out
+
+    def put_many(self, entries: Dict[int, Tuple]):
+        if not self.max_entries:
+            return
+        with self._lock:
+            for i, entry in entries.items():
+                self._entries[i] = entry
+                self._entries.move_to_end(i)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, ids):
+        with self._lock:
+            for i in ids:
+                self._entries.pop(int(i), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _params_for(
+    index: faiss.Index,
+    nprobe: int,
+    ef_search: int,
+    sel: Optional[faiss.IDSelector] = None,
+) -> Optional[faiss.SearchParameters]:
+    """Build per-call search parameters for `index`, walking pre-transforms.
+
+    `sel` restricts the search to the selected ids inside FAISS.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        # the id map translates `sel` to external ids and forwards params
+        return _params_for(index.index, nprobe, ef_search, sel)
+    if isinstance(index, faiss.IndexPreTransform):
+        inner = _params_for(index.index, nprobe, ef_search, sel)
+        if inner is None:
+            return None
+        params = faiss.SearchParametersPreTransform()
+        params.index_params = inner
+        # SWIG does not keep the nested object alive on its own
+        params.referenced_objects = [inner]
+        return params
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe, sel=sel)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def _normalized(vec: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+def encode_vectors(vecs: np.ndarray, dtype: str = "float32") -> np.ndarray:
+    """L2-normalized rows of `vecs` in the compact storage `dtype`."""
+    vecs = np.asarray(vecs, dtype=np.float32)
+    norms = np.linalg.norm(vecs, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = vecs / norms
+    if dtype == "int8":
+        peak = np.abs(unit).max(axis=-1, keepdims=True)
+        peak[peak == 0] = 1.0
+        return np.rint(unit * (_INT8_MAX / peak)).astype(np.int8)
+    return np.ascontiguousarray(unit, dtype=_VECTOR_DTYPES[dtype])
+
+
+def decode_vectors(codes: np.ndarray) -> np.ndarray:
+    """float32 rows of vectors stored by encode_vectors; int8 rows are
+    re-normalized, float rows are returned as stored."""
+    mat = np.asarray(codes, dtype=np.float32)
+    if codes.dtype == np.int8:
+        norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        mat /= norms
+    return mat
+
+
+def _blob_vector(blob: bytes, dim: int) -> np.ndarray:
+    """float32 vector of an embeddings BLOB of any vector_dtype."""
+    itemsize = len(blob) // dim if dim else 4
+    dtype = {2: np.float16, 1: np.int8}.get(itemsize, np.float32)
+    return decode_vectors(np.frombuffer(blob, dtype=dtype))
+
+
+def doc_key(doc: Dict) -> str:
+    """Key of the document a chunk belongs to: its `doc_id`, else the
+    manifest `source` path, else the chunk id without its "::chunk::N" tail."""
+    meta = doc.get("metadata") or {}
+    key = doc.get("doc_id") or doc.get("source") or meta.get("source")
+    if not key:
+        key = str(doc.get("id", "")).split("::chunk::", 1)[0]
+    return str(key)
+
+
+def chunk_id(key: str, chunk_index: int) -> int:
+    """Stable 63-bit FAISS id of chunk `chunk_index` of document `key`.
+
+    The same chunk of the same document always maps to the same id, so
+    re-ingesting a document replaces its vectors instead of duplicating them.
+    """
+    digest = hashlib.blake2b(
+        f"{key}::{chunk_index}".encode("utf-8"), digest_size=8
+    ).digest()
+    # non-negative, and never FAISS's -1 "no result" label
+    return int.from_bytes(digest, "little") >> 1
+
+
+def sqlite_pragmas(engine, journal_mode: str = "wal", synchronous: str = "normal"):
+    """Set the journal mode and fsync level on every new connection.
+
+    WAL with synchronous=NORMAL only fsyncs at WAL checkpoints, and readers
+    no longer block the writer.
+    """
+    journal_mode, synchronous = journal_mode.lower(), synchronous.lower()
+    if journal_mode not in _JOURNAL_MODES:
+        raise ValueError(f"Unknown SQLite journal_mode {journal_mode!r}")
+    if synchronous not in _SYNCHRONOUS:
+        raise ValueError(f"Unknown SQLite synchronous {synchronous!r}")
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.close()
+
+
+def index_version(faiss_path: str) -> Tuple[int, ...]:
+    """(mtime_ns, size) of the index file and its append log.
+
+    Changes whenever a checkpoint or an appended batch lands on disk, so
+    long-lived readers can tell their loaded copy is stale.
+    """
+    version: List[int] = []
+    for path in (faiss_path, f"{faiss_path}.log"):
+        try:
+            st = os.stat(path)
+            version += [st.st_mtime_ns, st.st_size]
+        except FileNotFoundError:
+            version += [0, 0]
+    return tuple(version)
 
 
 class Indexer:
@@ -47,6 +294,12 @@ class Indexer:
         faiss_path: str | None = None,
         sqlite_path: str | None = None,
         index_type: str | None = None,
+        persistence: str | None = None,
+        embedding_format: str | None = None,
+        load_mode: str | None = None,
+        sqlite_journal_mode: str | None = None,
+        sqlite_synchronous: str | None = None,
+        vector_dtype: str | None = None,
     ):
         import yaml
 
@@ -61,6 +314,47 @@ class Indexer:
             "sqlite_path", "data/meta.db"
         )
         self.index_type = index_type or cfg.get("index", {}).get("type", "FlatIP")
+        self.hnsw_m = int(cfg.get("index", {}).get("hnsw_m", 32))
+        # query-time defaults for IVF / HNSW indexes; overridable per search
+        self.nprobe = int(cfg.get("index", {}).get("nprobe", 16))
+        self.ef_search = int(cfg.get("index", {}).get("ef_search", 64))
+        # max vectors sampled to train IVF / PQ / OPQ indexes
+        self.train_size = int(cfg.get("index", {}).get("train_size", 50000))
+        # "append": add() only appends new vectors to a log, flush() checkpoints
+        # "full": add() rewrites the whole index file (legacy behaviour)
+        self.persistence = persistence or cfg.get("index", {}).get(
+            "persistence", "append"
+        )
+        self.log_path = f"{self.faiss_path}.log"
+        # "memory": read the whole index into the process
+        # "mmap": map the checkpoint read-only so processes share the page
+        # cache; the first write copies it into memory
+        self.load_mode = load_mode or cfg.get("index", {}).get("load_mode", "memory")
+        if self.load_mode not in ("memory", "mmap"):
+            raise ValueError(f"Unknown load_mode {self.load_mode!r}")
+        self._mapped: Optional[faiss.Index] = None
+        # "binary": float32 BLOBs in the embeddings table
+        # "mmap": normalized float32 rows in a raw sidecar (documents.vec_row)
+        # "faiss": no copy at all; vectors are reconstructed from the index
+        self.embedding_format = embedding_format or cfg.get("storage", {}).get(
+            "embedding_format", "binary"
+        )
+        # "float32", or "float16" / "int8" for 2x / 4x smaller normalized
+        # copies (enough for MMR and re-scoring; the index keeps its own codes)
+        self.vector_dtype = vector_dtype or cfg.get("storage", {}).get(
+            "vector_dtype", "float32"
+        )
+        if self.vector_dtype not in _VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector_dtype {self.vector_dtype!r}")
+        self.vectors_path = self._sidecar_path(self.vector_dtype)
+        # recently hydrated chunks; 0 disables the cache
+        self._chunk_cache = _ChunkCache(
+            int(cfg.get("storage", {}).get("hydrate_cache_size", 4096))
+        )
+        self._vec_map: Optional[np.memmap] = None
+        self._can_reconstruct = True
+        # removed-but-not-dropped HNSW nodes, see _tombstone_map()
+        self._tombstones = 0
         self.dim: Optional[int] = None
         self.index: Optional[faiss.Index] = None
 
@@ -68,35 +362,145 @@ class Indexer:
         os.makedirs(os.path.dirname(self.sqlite_path) or ".", exist_ok=True)
 
         self.engine = create_engine(f"sqlite:///{self.sqlite_path}")
+        storage_cfg = cfg.get("storage", {}) or {}
+        sqlite_pragmas(
+            self.engine,
+            journal_mode=sqlite_journal_mode
+            or storage_cfg.get("sqlite_journal_mode", "wal"),
+            synchronous=sqlite_synchronous
+            or storage_cfg.get("sqlite_synchronous", "normal"),
+        )
         Base.metadata.create_all(self.engine)
         self.Session = sessionmaker(bind=self.engine)
+        # connection holding the open transaction of bulk(), if any
+        self._bulk_conn = None
+        # BM25 postings for hybrid retrieval live in the same database
+        lex_cfg = cfg.get("lexical", {}) or {}
+        self.lexical: Optional[BM25Index] = None
+        if lex_cfg.get("enabled", True):
+            self.lexical = BM25Index(
+                self.engine,
+                k1=float(lex_cfg.get("k1", 1.2)),
+                b=float(lex_cfg.get("b", 0.75)),
+                block_size=int(lex_cfg.get("block_size", 4096)),
+            )
 
     def _make_index(self) -> faiss.Index:
+        """Empty index of the configured type that stores explicit 64-bit ids.
+
+        IVF indexes keep ids natively (with a hash-table direct map, so ids
+        can be removed and reconstructed); others are wrapped in IndexIDMap2.
+        """
         if self.dim is None:
             raise ValueError("Index dimension not set")
         if self.index_type == "FlatL2":
             idx = faiss.IndexFlatL2(self.dim)
         elif self.index_type == "HNSW":
-            idx = faiss.IndexHNSWFlat(self.dim, 32)
-        else:
+            idx = faiss.IndexHNSWFlat(self.dim, self.hnsw_m)
+        elif self.index_type == "FlatIP":
             # default to inner product for cosine if vectors normalized
             idx = faiss.IndexFlatIP(self.dim)
-        return idx
+        else:
+            # FAISS factory string, e.g. "IVF1024,Flat", "IVF4096,PQ64" or
+            # "OPQ64,IVF4096,PQ64"; these need train() before add(). Scalar
+            # quantizers ("SQfp16", "SQ8", "IVF1024,SQ8") scan 2x / 4x less
+            # memory than Flat; SQ8 is trained for its per-dimension ranges
+            idx = faiss.index_factory(
+                self.dim, self.index_type, faiss.METRIC_INNER_PRODUCT
+            )
+        ivf = faiss.try_extract_index_ivf(idx)
+        if ivf is not None:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            return idx
+        return faiss.IndexIDMap2(idx)
+
+    def needs_training(self) -> bool:
+        if self.index is None:
+            self.load()
+        return not self.index.is_trained
+
+    def train(self, sample: np.ndarray):
+        """Train an empty index (IVF centroids, PQ/OPQ codebooks) on a sample
+        of embeddings and checkpoint the trained quantizer right away."""
+        if self.index is None:
+            self.load()
+        if self.index.ntotal:
+            raise ValueError("Cannot train a non-empty index; rebuild it first")
+        self._ensure_writable()
+        sample = np.ascontiguousarray(sample, dtype=np.float32)
+        if int(self.index.d) != sample.shape[1]:
+            self.dim = int(sample.shape[1])
+            self.index = self._make_index()
+        if sample.shape[0] > self.train_size:
+            rng = np.random.default_rng(0)
+            pick = rng.choice(sample.shape[0], self.train_size, replace=False)
+            sample = sample[np.sort(pick)]
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None and sample.shape[0] < ivf.nlist:
+            raise ValueError(
+                f"Index type {self.index_type} needs at least {ivf.nlist} "
+                f"training vectors, got {sample.shape[0]}"
+            )
+        logger.info(
+            "Training %s index on %d vectors", self.index_type, sample.shape[0]
+        )
+        self.index.train(sample)
+        self.flush()
+
+    def _search_params(
+        self,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        sel: Optional[faiss.IDSelector] = None,
+    ) -> Optional[faiss.SearchParameters]:
+        return _params_for(
+            self.index, nprobe or self.nprobe, ef_search or self.ef_search, sel
+        )
 
     def rebuild(self):
-        # For now, rebuild is a placeholder: it creates an empty index
+        """Reset to an empty index.
+
+        Chunk metadata, BM25 postings and the file manifest are cleared too,
+        so the next ingest re-adds every file.
+        """
         if self.dim is None:
             # create a placeholder dimension; will be reset on add
             self.dim = 768
         self.index = self._make_index()
-        faiss.write_index(self.index, self.faiss_path)
+        self._tombstones = 0
+        self._chunk_cache.clear()
+        session = self.Session()
+        try:
+            for model in (Embedding, DocField, DocumentMeta, FileManifest):
+                session.query(model).delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+        self.flush()
+        # sidecars of every vector_dtype, so a rebuild can switch dtypes
+        for path in map(self._sidecar_path, _VECTOR_DTYPES):
+            if os.path.exists(path):
+                self._vec_map = None
+                os.remove(path)
+        if self.lexical is not None:
+            self.lexical.clear()
         logger.info("Rebuilt empty index at %s", self.faiss_path)
 
     def load(self):
+        # another process may have replaced chunks since the last load
+        self._chunk_cache.clear()
         try:
             if Path(self.faiss_path).exists():
-                self.index = faiss.read_index(self.faiss_path)
-                logger.info("Loaded FAISS index from %s", self.faiss_path)
+                if self.load_mode == "mmap":
+                    self.index = faiss.read_index(self.faiss_path, _MMAP_FLAG)
+                    self._mapped = self.index
+                else:
+                    self.index = faiss.read_index(self.faiss_path)
+                self.dim = int(self.index.d)
+                logger.info(
+                    "Loaded FAISS index from %s (%s)", self.faiss_path, self.load_mode
+                )
+                self._upgrade_legacy()
             else:
                 if self.dim is None:
                     # lazy default dimension
@@ -106,99 +510,786 @@ class Indexer:
         except Exception:
             logger.exception("Failed to load FAISS index; creating new one")
             self.index = self._make_index()
+        self._replay_log()
+        id_map = self._tombstone_map()
+        self._tombstones = 0 if id_map is None else int(np.sum(id_map == -1))
+
+    def _ensure_writable(self):
+        """Copy a memory-mapped index into process memory before a write.
 
-    def add(self, embeddings: np.ndarray, docs: List[Dict]):
-        """Add embeddings and documents (docs must contain keys text, doc_id, chunk_index, meta)."""
+        Mapped codes and inverted lists are read-only views of the file.
+        """
+        if self._mapped is None or self.index is not self._mapped:
+            self._mapped = None
+            return
+        try:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+        except RuntimeError:
+            # on-disk inverted lists only serialize as a reference to the file
+            self.index = faiss.read_index(self.faiss_path)
+        self._mapped = None
+        logger.info("Copied mapped index %s into memory for writing", self.faiss_path)
+
+    def _upgrade_legacy(self):
+        """Give an index written before stable ids explicit ids.
+
+        Its metadata references positional ids 0..n-1, so the vectors are
+        re-added under exactly those ids; new chunks get stable ids.
+        """
+        index = faiss.downcast_index(self.index)
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            # IVF lists already store ids; an array direct map would refuse
+            # arbitrary ones
+            if ivf.direct_map.type != faiss.DirectMap.Hashtable:
+                self._ensure_writable()
+                ivf = faiss.try_extract_index_ivf(self.index)
+                ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            return
+        if isinstance(index, faiss.IndexIDMap):
+            return
+        self._ensure_writable()
+        index = faiss.downcast_index(self.index)
+        n = int(index.ntotal)
+        vecs = index.reconstruct_n(0, n) if n else None
+        inner = faiss.clone_index(index)
+        inner.reset()
+        wrapped = faiss.IndexIDMap2(inner)
+        if n:
+            wrapped.add_with_ids(vecs, np.arange(n, dtype=np.int64))
+        self.index = wrapped
+        logger.info("Converted %d positional ids in %s", n, self.faiss_path)
+
+    def _tombstone_map(self) -> Optional[np.ndarray]:
+        """Writable view of the id map of an HNSW index, or None.
+
+        HNSW graphs cannot drop nodes, so removed ids are overwritten with -1
+        (FAISS's "no result" label) and vanish on the next rebuild.
+        """
+        index = faiss.downcast_index(self.index)
+        if not isinstance(index, faiss.IndexIDMap2) or not isinstance(
+            faiss.downcast_index(index.index), faiss.IndexHNSW
+        ):
+            return None
+        if index.id_map.size() == 0:
+            return np.empty(0, dtype=np.int64)
+        return faiss.rev_swig_ptr(index.id_map.data(), index.id_map.size())
+
+    def _remove_from_index(self, ids: np.ndarray) -> int:
+        """Remove `ids` from the FAISS index (unknown ids are ignored)."""
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        if ids.size == 0 or self.index.ntotal == 0:
+            return 0
+        self._ensure_writable()
+        id_map = self._tombstone_map()
+        if id_map is not None:
+            rows = np.flatnonzero(np.isin(id_map, ids))
+            if rows.size:
+                id_map[rows] = -1
+                faiss.downcast_index(self.index).construct_rev_map()
+                self._tombstones += int(rows.size)
+            return int(rows.size)
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None and ivf.direct_map.type == faiss.DirectMap.Hashtable:
+            # hash-table lookups: only the lists holding `ids` are touched
+            sel = faiss.IDSelectorArray(ids.size, faiss.swig_ptr(ids))
+        else:
+            sel = faiss.IDSelectorBatch(ids.size, faiss.swig_ptr(ids))
+        return int(self.index.remove_ids(sel))
+
+    @contextmanager
+    def bulk(self):
+        """Run the metadata writes of this block in one SQLite transaction.
+
+        It is committed at every flush() and on exit, so metadata becomes
+        durable at the same checkpoints as the FAISS index; an exception
+        rolls back what was written since the last checkpoint. Only the
+        thread that entered the block may use the indexer inside it.
+        """
+        if self._bulk_conn is not None:
+            yield self
+            return
+        conn = self.engine.connect()
+        conn.begin()
+        self._bulk_conn = conn
+        # sessions join the open transaction: their commit() leaves it open
+        self.Session = sessionmaker(bind=conn, join_transaction_mode="rollback_only")
+        try:
+            yield self
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            self._chunk_cache.clear()
+            raise
+        finally:
+            self.Session = sessionmaker(bind=self.engine)
+            self._bulk_conn = None
+            conn.close()
+
+    def _commit_bulk(self):
+        if self._bulk_conn is not None:
+            self._bulk_conn.commit()
+            self._bulk_conn.begin()
+
+    def flush(self):
+        """Checkpoint the in-memory index to disk and truncate the append log.
+
+        The index is written to a temporary file and atomically renamed over
+        `faiss_path`, so a crash mid-write never leaves a half-written index.
+        """
+        self._commit_bulk()
+        if self.index is None:
+            return
+        tmp_path = f"{self.faiss_path}.tmp"
+        faiss.write_index(self.index, tmp_path)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.faiss_path)
+        if self.lexical is not None:
+            self.lexical.compact()
+        # a crash before this point is harmless: replay skips records that are
+        # already contained in the checkpoint
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        logger.info(
+            "Checkpointed %d vectors to %s", int(self.index.ntotal), self.faiss_path
+        )
+
+    def _append_log(self, op: int, ids: np.ndarray, vecs: np.ndarray | None = None):
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        dim = 0 if vecs is None else int(vecs.shape[1])
+        with open(self.log_path, "ab") as f:
+            f.write(_LOG_RECORD.pack(_LOG_MAGIC, op, ids.size, dim))
+            f.write(ids.tobytes())
+            if vecs is not None:
+                f.write(np.ascontiguousarray(vecs, dtype=np.float32).tobytes())
+
+    def _read_log_record(self, f) -> Optional[Tuple[int, np.ndarray, int, bytes]]:
+        """Next (op, ids, dim, vector bytes) from the log; None at the end or
+        at a torn record."""
+        magic = f.read(len(_LOG_MAGIC))
+        if not magic:
+            return None
+        if magic == _LOG_MAGIC:
+            header = magic + f.read(_LOG_RECORD.size - len(magic))
+            if len(header) < _LOG_RECORD.size:
+                return None
+            _, op, n, dim = _LOG_RECORD.unpack(header)
+            raw_ids = f.read(n * 8)
+            if len(raw_ids) < n * 8:
+                return None
+            ids = np.frombuffer(raw_ids, dtype=np.int64)
+        else:
+            header = magic + f.read(_LEGACY_HEADER.size - len(magic))
+            if len(header) < _LEGACY_HEADER.size:
+                return None
+            first_id, n, dim = _LEGACY_HEADER.unpack(header)
+            op = _OP_ADD
+            ids = np.arange(first_id, first_id + n, dtype=np.int64)
+        payload = f.read(n * dim * 4) if op == _OP_ADD else b""
+        if len(payload) < (n * dim * 4 if op == _OP_ADD else 0):
+            return None
+        return op, ids, dim, payload
+
+    def _replay_log(self):
+        """Re-apply the adds and deletes logged since the last checkpoint.
+
+        Records are idempotent (an add replaces its ids), so replaying ones
+        the checkpoint already contains is harmless. The log is folded into
+        its net effect first: every logged id is removed from the index in
+        one call and the surviving adds are inserted in one batch, since
+        remove_ids scans the whole index for Flat / SQ / HNSW types.
+        """
+        if self.index is None or not os.path.exists(self.log_path):
+            return
+        replayed = 0
+        size = os.path.getsize(self.log_path)
+        if size:
+            self._ensure_writable()
+        torn_at = None
+        touched: Dict[int, None] = {}  # ids of every record, in log order
+        adds: List[np.ndarray] = []  # vectors of each add record
+        # id -> (add record, row) of its latest add, unless deleted since
+        latest: Dict[int, Tuple[int, int]] = {}
+        with open(self.log_path, "rb") as f:
+            while True:
+                start = f.tell()
+                record = self._read_log_record(f)
+                if record is None:
+                    if start < size:
+                        torn_at = start
+                    break
+                op, ids, dim, payload = record
+                if op == _OP_ADD and int(self.index.ntotal) == 0:
+                    if int(self.index.d) != dim:
+                        self.dim = dim
+                        self.index = self._make_index()
+                if op == _OP_ADD and not self.index.is_trained:
+                    logger.warning(
+                        "Index is not trained; cannot replay %s", self.log_path
+                    )
+                    break
+                id_list = ids.tolist()
+                touched.update(dict.fromkeys(id_list))
+                if op == _OP_ADD:
+                    for row, i in enumerate(id_list):
+                        latest[i] = (len(adds), row)
+                    vecs = np.frombuffer(payload, dtype=np.float32)
+                    adds.append(vecs.reshape(ids.size, dim))
+                else:
+                    for i in id_list:
+                        latest.pop(i, None)
+                replayed += 1
+        if touched:
+            self._remove_from_index(
+                np.fromiter(touched, dtype=np.int64, count=len(touched))
+            )
+        if latest:
+            keep = np.fromiter(latest, dtype=np.int64, count=len(latest))
+            where = np.array(list(latest.values()), dtype=np.int64)
+            # gather rows record by record
+            order = np.argsort(where[:, 0], kind="stable")
+            keep, where = keep[order], where[order]
+            records = np.unique(where[:, 0])
+            vecs = np.vstack(
+                [adds[r][where[where[:, 0] == r, 1]] for r in records.tolist()]
+            )
+            self.index.add_with_ids(vecs, keep)
+        if torn_at is not None:
+            # drop the torn tail so later appends stay readable
+            logger.warning("Ignoring truncated record in %s", self.log_path)
+            with open(self.log_path, "rb+") as f:
+                f.truncate(torn_at)
+        if replayed:
+            logger.info("Replayed %d records from %s", replayed, self.log_path)
+
+    def _persist(self, op: int, ids: np.ndarray, vecs: np.ndarray | None = None):
+        if self.persistence == "full":
+            self.flush()
+        else:
+            self._append_log(op, ids, vecs)
+
+    def add(self, embeddings: np.ndarray, docs: List[Dict]) -> np.ndarray:
+        """Add chunks and return their faiss_ids.
+
+        docs carry keys id, text, metadata (with chunk_index) and optionally
+        source / doc_id; ids come from chunk_id(doc_key(doc), chunk_index),
+        and a chunk that is already indexed is replaced.
+        """
+        if self.index is None:
+            self.load()
         # ensure we have correct index for embedding dimension
         emb_dim = int(embeddings.shape[1])
-        if self.dim is None or self.dim != emb_dim:
+        if int(self.index.d) != emb_dim:
+            if self.index.ntotal:
+                raise ValueError(
+                    f"Embedding dimension {emb_dim} does not match index "
+                    f"dimension {self.index.d}"
+                )
             self.dim = emb_dim
-            # recreate index with new dim
+            # recreate the (empty) index with the new dim
             self.index = self._make_index()
-        if self.index is None:
-            self.load()
-        n_before = int(self.index.ntotal)
+        if not self.index.is_trained:
+            raise ValueError(
+                f"Index type {self.index_type} must be trained before add()"
+            )
+        self._ensure_writable()
+        ids = np.array(
+            [
+                chunk_id(doc_key(d), d.get("metadata", {}).get("chunk_index", 0))
+                for d in docs
+            ],
+            dtype=np.int64,
+        )
         # ensure embeddings are float32
-        vecs = embeddings.astype("float32")
-        self.index.add(vecs)
+        vecs = np.ascontiguousarray(embeddings, dtype=np.float32)
+        _, last = np.unique(ids[::-1], return_index=True)
+        if last.size < ids.size:
+            # a chunk repeated within the batch: the last copy wins
+            keep = np.sort(ids.size - 1 - last)
+            ids, vecs, docs = ids[keep], vecs[keep], [docs[i] for i in keep]
+        # replaced chunks; the add record below re-removes them on replay
+        self._delete_ids(self._known_ids(ids), persist=False)
+        self.index.add_with_ids(vecs, ids)
+        first_row = 0
+        if self.embedding_format == "mmap":
+            # written before the metadata commits, so no row ever points at
+            # vectors that are not on disk
+            first_row = self._vector_rows(emb_dim)
+            self._write_vectors(first_row, vecs)
         # update metadata mapping in SQLite
+        # plain executemany inserts: no per-row ORM objects or unit of work
+        rows: List[Dict] = []
+        fields: List[Dict] = []
+        for i, doc in enumerate(docs):
+            faiss_id = int(ids[i])
+            meta = doc.get("metadata", {})
+            fields.extend(
+                {"faiss_id": faiss_id, "key": k, "value": v}
+                for k, v in field_rows(meta)
+            )
+            rows.append(
+                {
+                    "faiss_id": faiss_id,
+                    "doc_id": doc.get("id", ""),
+                    "chunk_index": meta.get("chunk_index", 0),
+                    "text": doc.get("text", ""),
+                    "meta": json.dumps(meta),
+                    "source": doc_key(doc),
+                    "vec_row": (
+                        first_row + i if self.embedding_format == "mmap" else None
+                    ),
+                }
+            )
         session = self.Session()
         try:
-            for i, doc in enumerate(docs):
-                faiss_id = n_before + i
-                meta_json = json.dumps(doc.get("metadata", {}))
-                rec = DocumentMeta(
-                    faiss_id=faiss_id,
-                    doc_id=doc.get("id", ""),
-                    chunk_index=doc.get("metadata", {}).get("chunk_index", 0),
-                    text=doc.get("text", ""),
-                    meta=meta_json,
+            session.execute(DocumentMeta.__table__.insert(), rows)
+            if self.embedding_format == "binary":
+                # raw float32 bytes, or normalized float16 / int8 codes
+                blobs = (
+                    vecs
+                    if self.vector_dtype == "float32"
+                    else encode_vectors(vecs, self.vector_dtype)
+                )
+                session.execute(
+                    Embedding.__table__.insert(),
+                    [
+                        {"faiss_id": int(fid), "vector": vec.tobytes()}
+                        for fid, vec in zip(ids, blobs)
+                    ],
+                )
+            if fields:
+                session.execute(DocField.__table__.insert(), fields)
+            if self.lexical is not None:
+                self.lexical.add(
+                    session.connection(),
+                    ids.tolist(),
+                    [doc.get("text", "") for doc in docs],
                 )
-                session.add(rec)
-                # store embedding as raw float32 bytes
-                vec = vecs[i]
-                bin_blob = vec.tobytes()
-                eb = Embedding(faiss_id=faiss_id, vector=bin_blob)
-                session.add(eb)
             session.commit()
         finally:
             session.close()
-        faiss.write_index(self.index, self.faiss_path)
+        self._persist(_OP_ADD, ids, vecs)
         logger.info(
             "Added %d vectors (total=%d)", embeddings.shape[0], int(self.index.ntotal)
         )
+        return ids
+
+    def upsert(self, embeddings: np.ndarray, docs: List[Dict]) -> np.ndarray:
+        """Replace the documents in `docs` with the given chunks.
+
+        Chunks of those documents that are not in `docs` (the document got
+        shorter) are deleted; the rest of the index is untouched.
+        """
+        ids = [
+            chunk_id(doc_key(d), d.get("metadata", {}).get("chunk_index", 0))
+            for d in docs
+        ]
+        keys = sorted({doc_key(d) for d in docs})
+        new = set(ids)
+        stale = [fid for fid in self._ids_for_keys(keys) if fid not in new]
+        self._delete_ids(stale)
+        return self.add(embeddings, docs)
+
+    def delete(self, doc_ids: str | List[str]) -> int:
+        """Delete every chunk of the given documents (see doc_key()) from
+        FAISS and SQLite; returns the number of chunks removed."""
+        if isinstance(doc_ids, str):
+            doc_ids = [doc_ids]
+        chunks = self._chunks_for_keys(list(doc_ids))
+        n = self._delete_ids([fid for fid, _ in chunks])
+        # keys that matched nothing are not counted
+        docs = len({key for _, key in chunks})
+        logger.info("Removed %d chunks from %d documents", n, docs)
+        return n
 
-    def search(self, query_emb: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
+    # the ingestion pipeline's name for delete(): keys are manifest paths
+    remove_sources = delete
+
+    def _ids_for_keys(self, keys: List[str]) -> List[int]:
+        return [fid for fid, _ in self._chunks_for_keys(keys)]
+
+    def _chunks_for_keys(self, keys: List[str]) -> List[Tuple[int, str]]:
+        """(faiss_id, document key) of every chunk of the documents `keys`."""
+        if not keys:
+            return []
+        session = self.Session()
+        try:
+            doc = DocumentMeta.__table__.c
+            stmt = select(doc.faiss_id, doc.source).where(doc.source.in_(keys))
+            return [(int(r[0]), str(r[1])) for r in session.execute(stmt)]
+        finally:
+            session.close()
+
+    def _known_ids(self, ids: np.ndarray) -> List[int]:
+        """The subset of `ids` that already has metadata."""
+        session = self.Session()
+        try:
+            return [
+                fid
+                for (fid,) in session.query(DocumentMeta.faiss_id).filter(
+                    DocumentMeta.faiss_id.in_(ids.tolist())
+                )
+            ]
+        finally:
+            session.close()
+
+    def _delete_ids(self, ids: List[int], persist: bool = True) -> int:
+        """Remove chunks by faiss_id from SQLite, BM25 and FAISS.
+
+        The SQLite and BM25 work is proportional to len(ids). FAISS removal
+        only touches the affected lists of IVF indexes, but scans the whole
+        index for Flat / SQ (IndexIDMap2) and HNSW ones.
+        """
+        if not ids:
+            return 0
         if self.index is None:
             self.load()
-        if query_emb.ndim == 1:
-            query_emb = query_emb[None, :]
-        query_emb = query_emb.astype("float32")
-        D, idxs = self.index.search(query_emb, top_k)
-        # return list of (faiss_id, score)
-        return [(int(i), float(d)) for i, d in zip(idxs[0], D[0]) if i != -1]
-
-    def fetch_metadata(self, faiss_ids: List[int]) -> List[Dict]:
         session = self.Session()
         try:
             rows = (
-                session.query(DocumentMeta)
-                .filter(DocumentMeta.faiss_id.in_(faiss_ids))
+                session.query(DocumentMeta.faiss_id, DocumentMeta.text)
+                .filter(DocumentMeta.faiss_id.in_(ids))
                 .all()
             )
-            out = []
-            for r in rows:
-                try:
-                    meta = json.loads(r.meta or "{}")
-                except Exception:
-                    meta = {}
-                out.append(
-                    {
-                        "faiss_id": r.faiss_id,
-                        "doc_id": r.doc_id,
-                        "chunk_index": r.chunk_index,
-                        "text": r.text,
-                        "meta": meta,
-                    }
+            if self.lexical is not None:
+                self.lexical.remove(
+                    session.connection(), [r[0] for r in rows], [r[1] for r in rows]
+                )
+            session.query(Embedding).filter(Embedding.faiss_id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            session.query(DocField).filter(DocField.faiss_id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            session.query(DocumentMeta).filter(DocumentMeta.faiss_id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            session.commit()
+        finally:
+            session.close()
+        # metadata goes first: a crash in between leaves vectors without
+        # metadata, which retrieval already drops
+        id_arr = np.asarray(ids, dtype=np.int64)
+        self._chunk_cache.discard(ids)
+        self._remove_from_index(id_arr)
+        if persist:
+            self._persist(_OP_DELETE, id_arr)
+        return len(rows)
+
+    def file_manifest(self) -> Dict[str, Dict]:
+        """Return {path: {size, mtime, content_hash, n_chunks}} for all files."""
+        session = self.Session()
+        try:
+            return {
+                r.path: {
+                    "size": r.size,
+                    "mtime": r.mtime,
+                    "content_hash": r.content_hash,
+                    "n_chunks": r.n_chunks,
+                }
+                for r in session.query(FileManifest).all()
+            }
+        finally:
+            session.close()
+
+    def record_files(self, records: List[Dict]):
+        """Insert or update manifest rows (dicts with path, size, mtime,
+        content_hash, n_chunks)."""
+        if not records:
+            return
+        session = self.Session()
+        try:
+            existing = {
+                r.path: r
+                for r in session.query(FileManifest).filter(
+                    FileManifest.path.in_([rec["path"] for rec in records])
                 )
+            }
+            for rec in records:
+                row = existing.get(rec["path"])
+                if row is None:
+                    session.add(FileManifest(**rec))
+                else:
+                    for key, value in rec.items():
+                        setattr(row, key, value)
+            session.commit()
+        finally:
+            session.close()
+
+    def forget_files(self, paths: List[str]):
+        if not paths:
+            return
+        session = self.Session()
+        try:
+            session.query(FileManifest).filter(FileManifest.path.in_(paths)).delete(
+                synchronize_session=False
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def search(
+        self,
+        query_emb: np.ndarray,
+        top_k: int = 5,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+    ) -> List[Tuple[int, float]]:
+        return self.search_batch(
+            query_emb, top_k=top_k, nprobe=nprobe, ef_search=ef_search
+        )[0]
+
+    def search_batch(
+        self,
+        query_embs: np.ndarray,
+        top_k: int = 5,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        filter_expr: str | None = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """Search an (m, d) query matrix in one FAISS call; one hit list per row.
+
+        `nprobe` (IVF) and `ef_search` (HNSW) default to the configured values.
+        `filter_expr` (see index/filters.py) restricts the search to matching
+        chunks; FAISS skips the others while scanning.
+        """
+        if self.index is None:
+            self.load()
+        if query_embs.ndim == 1:
+            query_embs = query_embs[None, :]
+        query_embs = query_embs.astype("float32")
+        sel = None
+        if filter_expr:
+            ids = self.select_ids(filter_expr)
+            if ids.size == 0:
+                return [[] for _ in range(query_embs.shape[0])]
+            # hashed id set, checked against the stored 64-bit ids
+            sel = faiss.IDSelectorBatch(ids.size, faiss.swig_ptr(ids))
+        elif self._tombstones:
+            # skip removed HNSW nodes instead of returning fewer hits;
+            # `minus_one` and `removed` must outlive the search call
+            minus_one = np.array([-1], dtype=np.int64)
+            removed = faiss.IDSelectorArray(1, faiss.swig_ptr(minus_one))
+            sel = faiss.IDSelectorNot(removed)
+        params = self._search_params(nprobe, ef_search, sel)
+        D, idxs = self.index.search(query_embs, top_k, params=params)
+        # return lists of (faiss_id, score)
+        return [
+            [(int(i), float(d)) for i, d in zip(row_ids, row_d) if i != -1]
+            for row_ids, row_d in zip(idxs, D)
+        ]
+
+    def select_ids(self, filter_expr: str) -> np.ndarray:
+        """faiss_ids of live chunks matching `filter_expr`; raises FilterError."""
+        sql, params = filter_sql(parse_filter(filter_expr))
+        # positional parameters; SQLAlchemy's text() wants named ones
+        with self.engine.connect() as conn:
+            rows = conn.exec_driver_sql(sql, tuple(params)).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+
+    def _iter_documents(self, session, batch: int) -> Iterator[List[Tuple]]:
+        """(faiss_id, text, meta_json) rows of every chunk, in id order."""
+        last = -1
+        while True:
+            rows = (
+                session.query(
+                    DocumentMeta.faiss_id, DocumentMeta.text, DocumentMeta.meta
+                )
+                .filter(DocumentMeta.faiss_id > last)
+                .order_by(DocumentMeta.faiss_id)
+                .limit(batch)
+                .all()
+            )
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][0]
+
+    def reindex_fields(self, batch: int = 5000) -> int:
+        """Rebuild `doc_fields` from stored chunk metadata; returns row count.
+
+        Needed once for databases created before filtering existed.
+        """
+        n = 0
+        session = self.Session()
+        try:
+            session.query(DocField).delete(synchronize_session=False)
+            for rows in self._iter_documents(session, batch):
+                fields = []
+                for fid, _, meta_json in rows:
+                    try:
+                        meta = json.loads(meta_json or "{}")
+                    except Exception:
+                        meta = {}
+                    fields.extend(
+                        {"faiss_id": fid, "key": k, "value": v}
+                        for k, v in field_rows(meta)
+                    )
+                if fields:
+                    session.execute(DocField.__table__.insert(), fields)
+                n += len(fields)
+            session.commit()
+        finally:
+            session.close()
+        logger.info("Indexed %d metadata fields", n)
+        return n
+
+    def reindex_lexical(self, batch: int = 5000) -> int:
+        """Rebuild the BM25 index from stored chunk texts; returns chunk count.
+
+        Needed once for databases created before hybrid retrieval existed.
+        """
+        if self.lexical is None:
+            return 0
+        self.lexical.clear()
+        n = 0
+        session = self.Session()
+        try:
+            conn = session.connection()
+            for rows in self._iter_documents(session, batch):
+                self.lexical.add(conn, [r[0] for r in rows], [r[1] for r in rows])
+                n += len(rows)
+            session.commit()
+        finally:
+            session.close()
+        self.lexical.compact()
+        logger.info("Indexed %d chunks for BM25", n)
+        return n
+
+    def search_lexical(
+        self,
+        query_texts: List[str],
+        top_k: int = 5,
+        filter_expr: str | None = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """BM25 top-k per query text as (faiss_id, score) lists."""
+        if self.lexical is None:
+            return [[] for _ in query_texts]
+        allowed = None
+        if filter_expr:
+            sql, params = filter_sql(parse_filter(filter_expr))
+            allowed = self.lexical.docnos_matching(sql, params)
+        return self.lexical.search(query_texts, top_k=top_k, allowed=allowed)
+
+    def fetch_metadata(self, faiss_ids: List[int]) -> List[Dict]:
+        """Metadata of the chunks that exist, in the order of `faiss_ids`."""
+        return [m for m in self.hydrate(faiss_ids).metadata if m is not None]
+
+    def hydrate(self, faiss_ids: List[int], with_vectors: bool = False) -> Hydrated:
+        """Metadata, and with `with_vectors` L2-normalized vectors, aligned
+        with `faiss_ids` (unknown ids give None / an invalid row).
+
+        Chunks missing from the LRU cache are read in one joined query; in
+        "mmap" and "faiss" format the vectors come from the sidecar or the
+        index instead of the database.
+        """
+        ids = [int(i) for i in faiss_ids]
+        # vectors reconstructed from the index are not worth caching
+        stored = with_vectors and self.embedding_format != "faiss"
+        cached = self._chunk_cache.get_many(ids)
+        missing = sorted(
+            {
+                i
+                for i, entry in zip(ids, cached)
+                if entry is None or (stored and not entry[2])
+            }
+        )
+        fetched = self._fetch_chunks(missing, stored) if missing else {}
+        self._chunk_cache.put_many(fetched)
+        entries = [fetched.get(i, entry) for i, entry in zip(ids, cached)]
+        out = Hydrated(metadata=[None if e is None else e[0] for e in entries])
+        if not with_vectors:
             return out
+        if stored:
+            vecs = [None if e is None else e[1] for e in entries]
+        else:
+            known = np.array([i for i, e in zip(ids, entries) if e], dtype=np.int64)
+            mat, valid = self._reconstruct(known)
+            rebuilt = {
+                fid: _normalized(v)
+                for fid, v, ok in zip(known.tolist(), mat, valid)
+                if ok
+            }
+            vecs = [rebuilt.get(i) for i in ids]
+        dim = next((v.shape[0] for v in vecs if v is not None), 0)
+        out.vectors = np.zeros((len(ids), dim), dtype=np.float32)
+        out.has_vector = np.array([v is not None for v in vecs], dtype=bool)
+        for row, v in enumerate(vecs):
+            if v is not None:
+                out.vectors[row] = v
+        return out
+
+    def _fetch_chunks(self, ids: List[int], with_vectors: bool) -> Dict[int, Tuple]:
+        """{faiss_id: (metadata, vector or None, with_vectors)} of known ids;
+        vectors come from the embeddings table or the mmap sidecar."""
+        doc = DocumentMeta.__table__.c
+        cols = [doc.faiss_id, doc.doc_id, doc.chunk_index, doc.text, doc.meta]
+        fmt = self.embedding_format if with_vectors else None
+        if fmt == "binary":
+            emb = Embedding.__table__
+            stmt = select(*cols, emb.c.vector).select_from(
+                DocumentMeta.__table__.outerjoin(emb, emb.c.faiss_id == doc.faiss_id)
+            )
+        elif fmt == "mmap":
+            stmt = select(*cols, func.coalesce(doc.vec_row, doc.faiss_id))
+        else:
+            stmt = select(*cols)
+        stmt = stmt.where(doc.faiss_id.in_(bindparam("ids", expanding=True)))
+        session = self.Session()
+        try:
+            rows = session.execute(stmt, {"ids": ids}).all()
         finally:
             session.close()
 
+        metas: Dict[int, Dict] = {}
+        for r in rows:
+            try:
+                meta = json.loads(r[4] or "{}")
+            except Exception:
+                meta = {}
+            metas[r[0]] = {
+                "faiss_id": r[0],
+                "doc_id": r[1],
+                "chunk_index": r[2],
+                "text": r[3],
+                "meta": meta,
+            }
+        vecs: Dict[int, Optional[np.ndarray]] = {}
+        if fmt == "binary":
+            dim = self._index_dim()
+            for r in rows:
+                if r[5] is not None:
+                    vecs[r[0]] = _normalized(_blob_vector(r[5], dim))
+        elif fmt == "mmap":
+            vec_map = self._vectors()
+            if vec_map is not None:
+                found = [r for r in rows if 0 <= r[5] < vec_map.shape[0]]
+                # one fancy-index; stored rows are already normalized
+                mat = decode_vectors(vec_map[[r[5] for r in found]])
+                for r, v in zip(found, mat):
+                    if v.any():
+                        vecs[r[0]] = _normalized(v)
+        return {fid: (m, vecs.get(fid), with_vectors) for fid, m in metas.items()}
+
     def fetch_embeddings(self, faiss_ids: List[int]) -> List[np.ndarray]:
         """Return list of numpy float32 vectors corresponding to faiss_ids (order preserved when possible)."""
+        if self.embedding_format in ("mmap", "faiss"):
+            mat, valid = self.fetch_embedding_matrix(faiss_ids)
+            return [mat[i] if ok else None for i, ok in enumerate(valid)]
         session = self.Session()
         try:
             rows = (
                 session.query(Embedding).filter(Embedding.faiss_id.in_(faiss_ids)).all()
             )
             id_to_vec = {}
+            dim = self._index_dim()
             for r in rows:
                 try:
                     b = r.vector
                     if b is None:
                         continue
-                    arr = np.frombuffer(b, dtype=np.float32)
+                    arr = _blob_vector(b, dim)
                     id_to_vec[r.faiss_id] = arr
                 except Exception:
                     continue
@@ -206,6 +1297,220 @@ class Indexer:
         finally:
             session.close()
 
+    def fetch_embedding_matrix(
+        self, faiss_ids: List[int]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return an (n, dim) matrix of L2-normalized vectors aligned with
+        faiss_ids, plus a bool mask of the rows that have a stored vector.
+
+        In "mmap" format this is one row lookup in SQLite plus a single
+        fancy-index into the shared sidecar; in "faiss" format the vectors
+        come from `index.reconstruct_batch`.
+        """
+        ids = np.asarray(faiss_ids, dtype=np.int64)
+        if self.embedding_format == "faiss":
+            mat, valid = self._reconstruct(ids)
+            norms = np.linalg.norm(mat, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            return mat / norms, valid
+        if self.embedding_format == "mmap":
+            vec_map = self._vectors()
+            if vec_map is None:
+                return np.zeros((len(ids), 0), dtype=np.float32), np.zeros(
+                    len(ids), dtype=bool
+                )
+            rows = self._vec_rows(ids)
+            in_range = (rows >= 0) & (rows < vec_map.shape[0])
+            mat = np.zeros((len(ids), vec_map.shape[1]), dtype=np.float32)
+            mat[in_range] = decode_vectors(vec_map[rows[in_range]])
+            # rows never written are all zeros
+            valid = in_range & mat.any(axis=1)
+            if self.vector_dtype != "float32":
+                # rounding to int8 / float16 moves norms slightly off 1
+                norms = np.linalg.norm(mat, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                mat /= norms
+            return mat, valid
+        rows = self.fetch_embeddings(faiss_ids)
+        valid = np.array([r is not None for r in rows], dtype=bool)
+        dim = next((r.shape[0] for r in rows if r is not None), 0)
+        mat = np.zeros((len(ids), dim), dtype=np.float32)
+        for i, r in enumerate(rows):
+            if r is not None:
+                mat[i] = r
+        # ensure embeddings normalized
+        norms = np.linalg.norm(mat, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return mat / norms, valid
+
+    def _reconstruct(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.index is None:
+            self.load()
+        mat = np.zeros((len(ids), int(self.index.d)), dtype=np.float32)
+        valid = np.zeros(len(ids), dtype=bool)
+        if not self._can_reconstruct or not len(ids):
+            return mat, valid
+        try:
+            mat[:] = self.index.reconstruct_batch(ids)
+            return mat, ~valid
+        except RuntimeError:
+            pass
+        # some id may have been removed meanwhile; keep the ones that work
+        for j in range(len(ids)):
+            try:
+                mat[j] = self.index.reconstruct_batch(ids[j : j + 1])[0]
+                valid[j] = True
+            except RuntimeError:
+                continue
+        if not valid.any():
+            logger.warning(
+                "Index type %s cannot reconstruct vectors; "
+                "MMR falls back to score order",
+                self.index_type,
+            )
+            self._can_reconstruct = False
+        return mat, valid
+
+    def _vec_rows(self, ids: np.ndarray) -> np.ndarray:
+        """Sidecar row of each faiss_id, -1 for unknown ids."""
+        session = self.Session()
+        try:
+            # rows written before vec_row existed sit at row == faiss_id
+            found = dict(
+                session.query(
+                    DocumentMeta.faiss_id,
+                    func.coalesce(DocumentMeta.vec_row, DocumentMeta.faiss_id),
+                )
+                .filter(DocumentMeta.faiss_id.in_(ids.tolist()))
+                .all()
+            )
+        finally:
+            session.close()
+        return np.array([found.get(int(i), -1) for i in ids], dtype=np.int64)
+
+    def _index_dim(self) -> int:
+        if self.index is None:
+            self.load()
+        return int(self.index.d)
+
+    def _sidecar_path(self, dtype: str) -> str:
+        # float32 keeps the original name, so existing sidecars stay valid
+        if dtype == "float32":
+            return f"{self.faiss_path}.vecs"
+        return f"{self.faiss_path}.vecs.{dtype}"
+
+    def _check_sidecar(self):
+        """vec_row offsets point into one sidecar: refuse to mix dtypes."""
+        if os.path.exists(self.vectors_path):
+            return
+        for dtype in _VECTOR_DTYPES:
+            if dtype != self.vector_dtype and os.path.exists(
+                self._sidecar_path(dtype)
+            ):
+                raise ValueError(
+                    f"Vectors were stored as {dtype}, not {self.vector_dtype}; "
+                    "rebuild the index to change storage.vector_dtype"
+                )
+
+    def _vector_rows(self, dim: int) -> int:
+        """Number of complete rows in the vector sidecar."""
+        self._check_sidecar()
+        if not os.path.exists(self.vectors_path):
+            return 0
+        row_bytes = dim * np.dtype(_VECTOR_DTYPES[self.vector_dtype]).itemsize
+        return os.path.getsize(self.vectors_path) // row_bytes
+
+    def _vectors(self) -> Optional[np.memmap]:
+        """Read-only memmap over the vector sidecar, remapped when it grows."""
+        dim = self._index_dim()
+        rows = self._vector_rows(dim)
+        if rows == 0:
+            return None
+        if self._vec_map is None or self._vec_map.shape != (rows, dim):
+            self._vec_map = np.memmap(
+                self.vectors_path,
+                dtype=_VECTOR_DTYPES[self.vector_dtype],
+                mode="r",
+                shape=(rows, dim),
+            )
+        return self._vec_map
+
+    def _write_vectors(self, first_row: int, vecs: np.ndarray):
+        """Write normalized rows at `first_row`; the sidecar only grows, rows
+        of replaced or deleted chunks are reclaimed by a rebuild."""
+        rows = encode_vectors(vecs, self.vector_dtype)
+        mode = "rb+" if os.path.exists(self.vectors_path) else "wb"
+        with open(self.vectors_path, mode) as f:
+            # positional write also overwrites a torn partial row at the end
+            f.seek(first_row * rows.shape[1] * rows.itemsize)
+            f.write(rows.tobytes())
+
+    def migrate_embeddings_to_mmap(
+        self, purge: bool = False, batch: int = 10000
+    ) -> int:
+        """Copy vectors from the `embeddings` table into the mmap sidecar.
+
+        Set `storage.embedding_format: "mmap"` afterwards; with `purge` the
+        table rows are deleted once copied. Returns the number of vectors.
+        """
+        copied = 0
+        last_id = -1
+        update = (
+            DocumentMeta.__table__.update()
+            .where(DocumentMeta.faiss_id == bindparam("fid"))
+            .values(vec_row=bindparam("vrow"))
+        )
+        session = self.Session()
+        try:
+            while True:
+                rows = (
+                    session.query(Embedding.faiss_id, Embedding.vector)
+                    .filter(Embedding.faiss_id > last_id)
+                    .order_by(Embedding.faiss_id)
+                    .limit(batch)
+                    .all()
+                )
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                rows = [(fid, blob) for fid, blob in rows if blob]
+                if not rows:
+                    continue
+                dim = self._index_dim()
+                vecs = np.vstack([_blob_vector(b, dim) for _, b in rows])
+                first_row = self._vector_rows(vecs.shape[1])
+                self._write_vectors(first_row, vecs)
+                session.execute(
+                    update,
+                    [
+                        {"fid": fid, "vrow": first_row + j}
+                        for j, (fid, _) in enumerate(rows)
+                    ],
+                )
+                copied += len(rows)
+            if purge:
+                session.query(Embedding).delete()
+            session.commit()
+        finally:
+            session.close()
+        self._vec_map = None
+        logger.info("Migrated %d embeddings to %s", copied, self.vectors_path)
+        return copied
+
+    @property
+    def metric_type(self) -> int:
+        """faiss.METRIC_L2 for FlatL2 and HNSW, whose scores are distances
+        (smaller is better), else faiss.METRIC_INNER_PRODUCT."""
+        if self.index is not None:
+            return int(self.index.metric_type)
+        if self.index_type in ("FlatL2", "HNSW"):
+            return faiss.METRIC_L2
+        return faiss.METRIC_INNER_PRODUCT
+
     def stats(self) -> IndexStats:
         ntotal = int(self.index.ntotal) if self.index is not None else 0
-        return IndexStats(ntotal=ntotal)
+        # removed HNSW nodes still count in ntotal until a rebuild
+        return IndexStats(ntotal=ntotal - self._tombstones)
+
+    def version(self) -> Tuple[int, ...]:
+        return index_version(self.faiss_path)
@@ -1,6 +1,6 @@
 """Ingest package: document loaders, chunking, and PII detection."""
 
-from .loader import Ingestor
+from .loader import Ingestor, ingest_path
 from .chunker import chunk_text
 
-__all__ = ["Ingestor", "chunk_text"]
+__all__ = ["Ingestor", "ingest_path", "chunk_text"]
@@ -40,6 +40,8 @@ class Ingestor:
     Methods
     -------
     ingest_folder(folder: Path, recursive: bool) -> List[DocumentChunk]
+    iter_files(folder: Path, recursive: bool) -> Iterator[Path]
+    ingest_file(path: Path) -> List[DocumentChunk]
     """
 
     def __init__(self):
@@ -50,15 +52,24 @@ class Ingestor:
     ) -> List[DocumentChunk]:
         folder = Path(folder)
         chunks: List[DocumentChunk] = []
-        for p in folder.glob("**/*" if recursive else "*"):
-            if p.is_file() and p.suffix.lower().lstrip(".") in self.supported:
-                chunks.extend(list(self._ingest_file(p)))
+        for p in self.iter_files(folder, recursive=recursive):
+            chunks.extend(self.ingest_file(p))
         logger.info("Ingested %d chunks from %s", len(chunks), folder)
         return chunks
 
+    def iter_files(self, folder: Path, recursive: bool = False) -> Iterator[Path]:
+        """Yield supported files under `folder` without reading them."""
+        for p in Path(folder).glob("**/*" if recursive else "*"):
+            if p.is_file() and p.suffix.lower().lstrip(".") in self.supported:
+                yield p
+
+    def ingest_file(self, path: Path) -> List[DocumentChunk]:
+        return list(self._ingest_file(Path(path)))
+
     def _ingest_file(self, path: Path) -> Iterator[DocumentChunk]:
         ext = path.suffix.lower()
-        meta = {"source": str(path), "name": path.name}
+        # resolved like the pipeline's manifest and document keys
+        meta = {"source": str(path.resolve()), "name": path.name}
         text = ""
         if ext == ".pdf":
             text, meta_tables = self._load_pdf(path)
@@ -123,3 +134,8 @@ class Ingestor:
             if found:
                 warnings[name] = len(found)
         return warnings
+
+
+def ingest_path(path: Path) -> List[DocumentChunk]:
+    """Parse a single file; a picklable entry point for process pools."""
+    return Ingestor().ingest_file(path)
@@ -0,0 +1,150 @@
+"""Background jobs for long-running work (ingestion, rebuilds) started from the UI.
+
+Jobs run on a single worker thread, so two ingestions never write to the
+index at the same time. Callers poll `JobManager.get` for progress.
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("agent.jobs")
+
+
+@dataclass
+class Job:
+    id: str
+    name: str
+    status: str = "queued"  # queued -> running -> done | failed
+    done: int = 0
+    total: int = 0
+    message: str = ""
+    result: Any = None
+    error: Optional[str] = None
+    submitted: float = 0.0
+    finished: Optional[float] = None
+    # set by the task to refresh `done` / `total` / `message` while running
+    poll: Optional[Callable[["Job"], None]] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def fraction(self) -> float:
+        if self.status == "done":
+            return 1.0
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    def refresh(self) -> None:
+        if self.status == "running" and self.poll is not None:
+            try:
+                self.poll(self)
+            except Exception:
+                logger.debug("Progress poll for job %s failed", self.id)
+
+
+class JobManager:
+    """Run `fn(job, *args, **kwargs)` in the background and track its state."""
+
+    def __init__(self, max_workers: int = 1, keep: int = 50):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.keep = keep
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs) -> Job:
+        job = Job(id=str(next(self._ids)), name=name, submitted=time.time())
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.refresh()
+        return job
+
+    def jobs(self) -> List[Job]:
+        """All tracked jobs, newest first."""
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: -int(j.id))
+        for job in jobs:
+            job.refresh()
+        return jobs
+
+    def active(self) -> bool:
+        return any(job.active for job in self._jobs.values())
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Job, fn: Callable, args: tuple, kwargs: dict) -> None:
+        job.status = "running"
+        try:
+            job.result = fn(job, *args, **kwargs)
+            if job.poll is not None:
+                job.poll(job)
+            job.status = "done"
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job.id, job.name)
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+
+    def _prune(self) -> None:
+        finished = [j for j in self._jobs.values() if not j.active]
+        finished.sort(key=lambda j: int(j.id))
+        for job in finished[: max(len(self._jobs) - self.keep, 0)]:
+            del self._jobs[job.id]
+
+
+def ingest_folder(
+    job: Job,
+    folder: str | Path,
+    recursive: bool = False,
+    force: bool = False,
+    pipeline=None,
+    embedder=None,
+) -> int:
+    """Job body: run the ingestion pipeline, reporting files scanned so far.
+
+    Pass the caller's `embedder` so each job does not load the model again.
+    """
+    from ingest.loader import Ingestor
+    from pipeline import Pipeline
+
+    folder = Path(folder)
+    pl = pipeline or Pipeline(embedder=embedder)
+    job.total = sum(1 for _ in Ingestor().iter_files(folder, recursive=recursive))
+
+    def poll(job: Job) -> None:
+        # run_folder updates `last_stats` in place as batches go through
+        stats = pl.last_stats
+        job.done = stats.parse.items + stats.files_unchanged
+        job.message = f"{stats.index.items} chunks indexed"
+
+    job.poll = poll
+    return pl.run_folder(folder, recursive=recursive, force=force)
+
+
+def rebuild_index(job: Job, indexer=None) -> None:
+    """Job body: replace the FAISS index with an empty one."""
+    from index.shards import open_indexer
+
+    idx = indexer or open_indexer()
+    idx.rebuild()
+    job.message = "index cleared"
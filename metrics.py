@@ -0,0 +1,172 @@
+"""Query latency instrumentation: timing spans per answer, metrics per process.
+
+`Spans` records how long each stage of one `Reasoner.answer` call took
+(cache lookup, decompose, encode, search, lexical, hydrate, rescore, mmr,
+synthesize). `Metrics` aggregates spans and counters across calls: per
+stage a count, a total and p50 / p95 / p99 over the most recent `window`
+observations, as JSON (`snapshot`) or Prometheus text format
+(`prometheus`). Standard library only, so the thin client can format them.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Spans:
+    """Timing spans of one request, in milliseconds since it started."""
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.items: List[Dict] = []
+
+    @contextmanager
+    def span(self, stage: str, **attrs) -> Iterator[None]:
+        """Time the block as `stage`; `attrs` (e.g. `batch`, the number of
+        sub-queries sharing the call) are stored with the span."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.items.append(
+                {
+                    "stage": stage,
+                    "start_ms": (start - self._t0) * 1000,
+                    "ms": (end - start) * 1000,
+                    **attrs,
+                }
+            )
+
+    def finish(self) -> List[Dict]:
+        """All spans plus a "total" span covering the whole request."""
+        total = (time.perf_counter() - self._t0) * 1000
+        return self.items + [{"stage": "total", "start_ms": 0.0, "ms": total}]
+
+
+def _quantile(values: List[float], q: float) -> float:
+    """Linearly interpolated quantile of sorted `values`."""
+    pos = q * (len(values) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+class _Series:
+    def __init__(self, window: int):
+        self.count = 0
+        self.sum_ms = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+
+class Metrics:
+    """Thread-safe counters and per-stage latency series."""
+
+    def __init__(self, window: int = 1024, namespace: str = "agent"):
+        self.window = window
+        self.namespace = namespace
+        self._counters: Dict[str, float] = {}
+        self._stages: Dict[str, _Series] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0.0) + value
+
+    def observe(self, stage: str, ms: float):
+        with self._lock:
+            series = self._stages.get(stage)
+            if series is None:
+                series = self._stages[stage] = _Series(self.window)
+            series.count += 1
+            series.sum_ms += ms
+            series.recent.append(ms)
+
+    def record(self, spans: List[Dict]):
+        for s in spans:
+            self.observe(s["stage"], s["ms"])
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._stages.clear()
+
+    def snapshot(self) -> Dict:
+        """{"counters": {name: value}, "stages": {stage: {count, sum_ms,
+        mean_ms, p50_ms, p95_ms, p99_ms}}}; quantiles cover the last
+        `window` observations of each stage."""
+        with self._lock:
+            counters = dict(self._counters)
+            series = {
+                k: (s.count, s.sum_ms, sorted(s.recent))
+                for k, s in self._stages.items()
+            }
+        stages = {}
+        for stage, (count, sum_ms, recent) in series.items():
+            row = {"count": count, "sum_ms": sum_ms, "mean_ms": sum_ms / count}
+            for q in QUANTILES:
+                row[f"p{round(q * 100)}_ms"] = _quantile(recent, q)
+            stages[stage] = row
+        return {"counters": counters, "stages": stages}
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format: one counter per counter name
+        and a summary of stage latencies in seconds."""
+        snap = self.snapshot()
+        ns = self.namespace
+        lines = []
+        for name, value in sorted(snap["counters"].items()):
+            metric = f"{ns}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value:g}"]
+        if snap["stages"]:
+            metric = f"{ns}_stage_seconds"
+            lines += [
+                f"# HELP {metric} Time spent per query stage.",
+                f"# TYPE {metric} summary",
+            ]
+            for stage, row in snap["stages"].items():
+                for q in QUANTILES:
+                    value = row[f"p{round(q * 100)}_ms"] / 1000
+                    lines.append(
+                        f'{metric}{{stage="{stage}",quantile="{q:g}"}} {value:.6g}'
+                    )
+                label = f'{{stage="{stage}"}}'
+                lines.append(f"{metric}_sum{label} {row['sum_ms'] / 1000:.6g}")
+                lines.append(f"{metric}_count{label} {row['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def format_stages(snapshot: Dict) -> str:
+    """Plain-text table of a `Metrics.snapshot()`."""
+    lines = [
+        f"{'stage':<16}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}"
+    ]
+    for stage, row in snapshot.get("stages", {}).items():
+        lines.append(
+            f"{stage:<16}{row['count']:>8}{row['mean_ms']:>10.2f}"
+            f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+        )
+    for name, value in snapshot.get("counters", {}).items():
+        lines.append(f"{name}: {value:g}")
+    return "\n".join(lines)
+
+
+def format_spans(spans: List[Dict]) -> str:
+    """One line per span: stage, start and duration in milliseconds."""
+    lines = []
+    for s in spans:
+        batch = f"  ({s['batch']} sub-queries)" if s.get("batch", 1) > 1 else ""
+        start, ms = s["start_ms"], s["ms"]
+        lines.append(f"{s['stage']:<16}{start:>9.1f} +{ms:>8.2f} ms{batch}")
+    return "\n".join(lines)
+
+
+# process-wide registry used by Reasoner and the query server
+METRICS = Metrics()
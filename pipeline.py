@@ -2,43 +2,433 @@
 
 from __future__ import annotations
 
+import hashlib
 import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
 
 from embed.encoder import Embedder
+from index.shards import open_indexer
 from index.store import Indexer
-from ingest.loader import Ingestor
+from ingest.loader import DocumentChunk, Ingestor, ingest_path
 
 logger = logging.getLogger("agent.pipeline")
 
+_DONE = object()  # end-of-stream marker passed through the queues
+
+
+@dataclass
+class _Batch:
+    """Unit of work flowing between stages.
+
+    The index stage applies it in order: purge `removed` sources, add
+    `chunks`, drop `deleted` manifest rows, then record `files`.
+    """
+
+    chunks: List[DocumentChunk] = field(default_factory=list)
+    sources: List[str] = field(default_factory=list)  # manifest key per chunk
+    removed: List[str] = field(default_factory=list)
+    files: List[Dict] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+
+
+@dataclass
+class StageStats:
+    items: int = 0
+    busy_s: float = 0.0
+
+    @property
+    def per_sec(self) -> float:
+        return self.items / self.busy_s if self.busy_s > 0 else 0.0
+
+
+@dataclass
+class PipelineStats:
+    parse: StageStats = field(default_factory=StageStats)  # items = files
+    encode: StageStats = field(default_factory=StageStats)  # items = chunks
+    index: StageStats = field(default_factory=StageStats)  # items = chunks
+    files_unchanged: int = 0
+    files_deleted: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    wall_s: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"parse {self.parse.items} files ({self.parse.per_sec:.1f}/s, "
+            f"{self.files_unchanged} unchanged, {self.files_deleted} deleted), "
+            f"encode {self.encode.items} chunks ({self.encode.per_sec:.1f}/s), "
+            f"index {self.index.items} chunks ({self.index.per_sec:.1f}/s), "
+            f"embedding cache {self.cache_hits}/{self.cache_hits + self.cache_misses}"
+            f" hits, wall {self.wall_s:.2f}s"
+        )
+
 
 class Pipeline:
+    """Streaming ingest -> embed -> index pipeline.
+
+    Files are parsed in a process pool, chunk batches flow through bounded
+    queues into an encoder thread, and the calling thread adds encoded
+    batches to the index. At most `queue_size` batches wait between stages,
+    so memory stays flat regardless of corpus size.
+    """
+
     def __init__(
-        self, embedder: Embedder | None = None, indexer: Indexer | None = None
+        self,
+        embedder: Embedder | None = None,
+        indexer: Indexer | None = None,
+        workers: int | None = None,
+        queue_size: int | None = None,
     ):
+        import yaml
+
+        try:
+            cfg = yaml.safe_load(open("config.yml"))
+        except Exception:
+            cfg = {}
         self.embedder = embedder or Embedder()
-        self.indexer = indexer or Indexer()
+        self.indexer = indexer or open_indexer()
+        # 0 parses in-thread (no process pool)
+        self.workers = (
+            workers
+            if workers is not None
+            else int(cfg.get("pipeline", {}).get("workers", os.cpu_count() or 1))
+        )
+        self.queue_size = queue_size or int(
+            cfg.get("pipeline", {}).get("queue_size", 8)
+        )
+        self.last_stats = PipelineStats()
+        # TF-IDF fallback: keep fitted weights next to the index
+        if hasattr(self.embedder, "use_state"):
+            self.embedder.use_state(f"{self.indexer.faiss_path}.tfidf")
 
     def run_folder(
-        self, folder: str | Path, recursive: bool = False, batch_size: int | None = None
+        self,
+        folder: str | Path,
+        recursive: bool = False,
+        batch_size: int | None = None,
+        force: bool = False,
     ) -> int:
+        """Ingest `folder` and return the number of chunks indexed.
+
+        With `force`, every file is re-parsed and its chunks replaced even if
+        the manifest says it is unchanged.
+        """
         folder = Path(folder)
-        ing = Ingestor()
-        chunks = list(ing.ingest_folder(folder, recursive=recursive))
-        logger.info("Pipeline: %d chunks to embed", len(chunks))
-        texts = [c.text for c in chunks]
-        ids = [c.id for c in chunks]
-        metas = [c.metadata for c in chunks]
-
-        batch_size = batch_size or self.embedder.batch_size
+        # with encoder processes, one batch feeds every worker
+        batch_size = batch_size or self.embedder.batch_size * max(
+            1, getattr(self.embedder, "workers", 0)
+        )
+        stats = PipelineStats()
+        self.last_stats = stats
+        start = time.perf_counter()
+        cache_before = self._cache_stats()
+
+        chunk_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        emb_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors: List[BaseException] = []
+
+        files = Ingestor().iter_files(folder, recursive=recursive)
+        scope = (folder.resolve(), recursive)
+        manifest = self.indexer.file_manifest()
+        threads = [
+            self._spawn(
+                "parse",
+                self._parse_stage,
+                (files, scope, manifest, force, batch_size, chunk_q, stop, stats),
+                chunk_q,
+                stop,
+                errors,
+            ),
+            self._spawn(
+                "encode",
+                self._encode_stage,
+                (chunk_q, emb_q, stop, stats),
+                emb_q,
+                stop,
+                errors,
+            ),
+        ]
+        try:
+            # one SQLite transaction for the run, committed before the checkpoint
+            with self.indexer.bulk():
+                n = self._index_stage(emb_q, stop, stats)
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            for t in threads:
+                t.join()
+        if errors:
+            raise errors[0]
+        # single checkpoint per run; batches in between only append to the log
+        self.indexer.flush()
+        cache_after = self._cache_stats()
+        stats.cache_hits = int(cache_after["hits"] - cache_before["hits"])
+        stats.cache_misses = int(cache_after["misses"] - cache_before["misses"])
+        stats.wall_s = time.perf_counter() - start
+        logger.info("Pipeline: %s", stats.summary())
+        return n
+
+    def _cache_stats(self) -> Dict[str, float]:
+        stats_fn = getattr(self.embedder, "cache_stats", None)
+        return stats_fn() if stats_fn else {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _spawn(
+        name: str,
+        stage: Callable,
+        args: tuple,
+        out_q: queue.Queue,
+        stop: threading.Event,
+        errors: List[BaseException],
+    ) -> threading.Thread:
+        """Start a stage thread; on failure it records the error and stops the
+        other stages. The end marker is always sent downstream."""
+
+        def run():
+            try:
+                stage(*args)
+            except BaseException as e:  # re-raised in run_folder
+                errors.append(e)
+                stop.set()
+            finally:
+                while True:
+                    try:
+                        out_q.put(_DONE, timeout=0.1)
+                        break
+                    except queue.Full:
+                        if stop.is_set():
+                            # nobody will drain the queue; make room
+                            try:
+                                out_q.get_nowait()
+                            except queue.Empty:
+                                pass
+
+        t = threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+        t.start()
+        return t
+
+    def _parse_stage(
+        self, files, scope, manifest, force, batch_size, chunk_q, stop, stats
+    ):
+        t0 = time.perf_counter()
+        batch = _Batch()
+        seen = set()
+        for key, record, chunks in self._scanned_files(files, manifest, force, stop):
+            seen.add(key)
+            if chunks is None:
+                # same content; a touched file only refreshes its manifest row
+                stats.files_unchanged += 1
+                if record is not None:
+                    batch.files.append(record)
+                continue
+            stats.parse.items += 1
+            if key in manifest:
+                batch.removed.append(key)
+            for c in chunks:
+                batch.chunks.append(c)
+                batch.sources.append(key)
+                if len(batch.chunks) >= batch_size:
+                    if not _put(chunk_q, batch, stop):
+                        return
+                    batch = _Batch()
+            # recorded with the batch holding the file's last chunk
+            batch.files.append(record)
+            stats.parse.busy_s = time.perf_counter() - t0
+        if stop.is_set():
+            return
+        gone = [k for k in manifest if k not in seen and _in_scope(k, *scope)]
+        stats.files_deleted = len(gone)
+        batch.removed.extend(gone)
+        batch.deleted.extend(gone)
+        _put(chunk_q, batch, stop)
+
+    def _scanned_files(
+        self, files, manifest: Dict[str, Dict], force: bool, stop
+    ) -> Iterator[Tuple[str, Optional[Dict], Optional[List[DocumentChunk]]]]:
+        """Yield (manifest key, manifest record, chunks) per file, in file
+        order, keeping a bounded number of files in flight in the process pool.
+
+        Files whose size and mtime match the manifest are not read at all
+        (record and chunks are None); files whose content hash matches get a
+        fresh record but chunks None.
+        """
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 0 else None
+        window: deque[Tuple[str, os.stat_result, Future]] = deque()
+
+        def finish(item):
+            key, st, fut = item
+            content_hash, chunks = fut.result()
+            record = {
+                "path": key,
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "content_hash": content_hash,
+                "n_chunks": (
+                    manifest[key]["n_chunks"] if chunks is None else len(chunks)
+                ),
+            }
+            return key, record, chunks
+
+        try:
+            for p in files:
+                if stop.is_set():
+                    return
+                key = str(p.resolve())
+                st = p.stat()
+                known = None if force else manifest.get(key)
+                if (
+                    known
+                    and known["size"] == st.st_size
+                    and known["mtime"] == st.st_mtime
+                ):
+                    yield key, None, None
+                    continue
+                known_hash = known["content_hash"] if known else None
+                if pool is None:
+                    fut: Future = Future()
+                    fut.set_result(scan_file(p, known_hash))
+                else:
+                    fut = pool.submit(scan_file, p, known_hash)
+                window.append((key, st, fut))
+                if len(window) >= 2 * max(self.workers, 1):
+                    yield finish(window.popleft())
+            while window and not stop.is_set():
+                yield finish(window.popleft())
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def _encode_stage(self, chunk_q, emb_q, stop, stats):
+        # an unfitted TF-IDF embedder holds batches back until it has a sample
+        needs_fit = getattr(self.embedder, "needs_fit", lambda: False)()
+        held: List[_Batch] = []
+        while True:
+            batch = chunk_q.get()
+            if batch is _DONE or stop.is_set():
+                break
+            if needs_fit:
+                held.append(batch)
+                if sum(len(b.chunks) for b in held) < self.embedder.fit_size:
+                    continue
+                self.embedder.fit([c.text for b in held for c in b.chunks])
+                needs_fit = False
+                batch = held.pop()
+                for b in held:
+                    if not self._encode_batch(b, emb_q, stop, stats):
+                        return
+                held = []
+            if not self._encode_batch(batch, emb_q, stop, stats):
+                return
+        if held and not stop.is_set():
+            texts = [c.text for b in held for c in b.chunks]
+            if texts:
+                self.embedder.fit(texts)
+            for b in held:
+                if not self._encode_batch(b, emb_q, stop, stats):
+                    return
+
+    def _encode_batch(self, batch, emb_q, stop, stats) -> bool:
+        emb = None
+        if batch.chunks:
+            t0 = time.perf_counter()
+            emb = self.embedder.encode([c.text for c in batch.chunks])
+            stats.encode.busy_s += time.perf_counter() - t0
+            stats.encode.items += len(batch.chunks)
+        return _put(emb_q, (emb, batch), stop)
+
+    def _index_stage(
+        self, emb_q: queue.Queue, stop: threading.Event, stats: PipelineStats
+    ) -> int:
         n = 0
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i : i + batch_size]
-            batch_emb = self.embedder.encode(batch_texts)
-            docs = []
-            for j, t in enumerate(batch_texts):
-                docs.append({"id": ids[i + j], "text": t, "metadata": metas[i + j]})
-            self.indexer.add(batch_emb, docs)
-            n += batch_emb.shape[0]
-            logger.info("Indexed batch %d -> total %d", i, n)
+        # IVF / PQ indexes: hold batches back until there is a training sample
+        pending: List[Tuple[np.ndarray, List[Dict], List[Dict]]] = []
+        while True:
+            item = emb_q.get()
+            if item is _DONE:
+                break
+            batch_emb, batch = item
+            t0 = time.perf_counter()
+            self.indexer.remove_sources(batch.removed)
+            if batch_emb is not None:
+                docs = [
+                    {"id": c.id, "text": c.text, "metadata": c.metadata, "source": src}
+                    for c, src in zip(batch.chunks, batch.sources)
+                ]
+                if self.indexer.needs_training():
+                    pending.append((batch_emb, docs, batch.files))
+                    held = sum(e.shape[0] for e, _, _ in pending)
+                    if held >= self.indexer.train_size:
+                        n += self._train_and_add(pending)
+                else:
+                    self.indexer.add(batch_emb, docs)
+                    self.indexer.record_files(batch.files)
+                    n += batch_emb.shape[0]
+            else:
+                self.indexer.record_files(batch.files)
+            self.indexer.forget_files(batch.deleted)
+            stats.index.busy_s += time.perf_counter() - t0
+            stats.index.items = n
+            logger.info("Indexed batch -> total %d", n)
+        if pending and not stop.is_set():
+            t0 = time.perf_counter()
+            n += self._train_and_add(pending)
+            stats.index.busy_s += time.perf_counter() - t0
+            stats.index.items = n
         return n
+
+    def _train_and_add(
+        self, pending: List[Tuple[np.ndarray, List[Dict], List[Dict]]]
+    ) -> int:
+        self.indexer.train(np.vstack([e for e, _, _ in pending]))
+        n = 0
+        for emb, docs, files in pending:
+            self.indexer.add(emb, docs)
+            self.indexer.record_files(files)
+            n += emb.shape[0]
+        pending.clear()
+        return n
+
+
+def scan_file(
+    path: Path, known_hash: str | None = None
+) -> Tuple[str, Optional[List[DocumentChunk]]]:
+    """Hash a file and parse it unless its content matches `known_hash`.
+
+    Module-level so it can run in a process pool.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    if digest == known_hash:
+        return digest, None
+    return digest, ingest_path(path)
+
+
+def _in_scope(key: str, folder: Path, recursive: bool) -> bool:
+    p = Path(key)
+    return folder in p.parents if recursive else p.parent == folder
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up (returns False) once `stop` is set."""
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if stop.is_set():
+                return False
@@ -1,6 +1,7 @@
 """Reasoner package: query decomposition, planning, and synthesis."""
 
 from .reasoner import Reasoner
+from .cache import QueryCache
 from .llm_adapter import LLMAdapter
 
-__all__ = ["Reasoner", "LLMAdapter"]
+__all__ = ["Reasoner", "QueryCache", "LLMAdapter"]
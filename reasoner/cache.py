@@ -0,0 +1,174 @@
+"""In-process cache of Reasoner.answer results.
+
+Entries are keyed by the normalized query text and the retrieval
+parameters, and are only valid for the index version they were computed
+on: the first lookup after the index changes on disk empties the cache.
+Optionally ("semantic" mode) a query whose embedding is within a cosine
+threshold of a cached query with the same parameters reuses its result.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("agent.reasoner.cache")
+
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of `query`, without trailing
+    punctuation, so "What is X?" and "what is  x" share an entry."""
+    return _SPACE.sub(" ", query).strip().rstrip("?.!").strip().lower()
+
+
+class QueryCache:
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        ttl_s: float | None = None,
+        semantic: bool | None = None,
+        semantic_threshold: float | None = None,
+    ):
+        import yaml
+
+        try:
+            cfg = yaml.safe_load(open("config.yml"))
+        except Exception:
+            cfg = {}
+        qcfg = cfg.get("query_cache", {}) or {}
+        enabled = qcfg.get("enabled", True)
+        self.max_entries = int(
+            max_entries
+            if max_entries is not None
+            else (qcfg.get("max_entries", 1024) if enabled else 0)
+        )
+        # 0 keeps entries until the index changes or they are evicted
+        self.ttl_s = float(ttl_s if ttl_s is not None else qcfg.get("ttl_s", 3600))
+        self.semantic = bool(
+            semantic if semantic is not None else qcfg.get("semantic", False)
+        )
+        self.semantic_threshold = float(
+            semantic_threshold
+            if semantic_threshold is not None
+            else qcfg.get("semantic_threshold", 0.95)
+        )
+        # key -> (created, query embedding or None, result)
+        self._entries: OrderedDict = OrderedDict()
+        self._version: Optional[Tuple] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _check_version(self, version: Tuple):
+        if version != self._version:
+            if self._entries:
+                logger.info(
+                    "Index changed; dropping %d cached answers", len(self._entries)
+                )
+            self._entries.clear()
+            self._version = version
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_s > 0 and now - created > self.ttl_s
+
+    def get(self, query: str, params: Hashable, version: Tuple) -> Optional[Dict]:
+        """Exact lookup of (normalized query, params); None on a miss."""
+        if not self.enabled:
+            return None
+        key = (normalize_query(query), params)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0], time.monotonic()):
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[2])
+
+    def get_similar(
+        self, embedding: np.ndarray, params: Hashable, version: Tuple
+    ) -> Optional[Dict]:
+        """Semantic lookup: the result of the most similar cached query with
+        the same params, if its cosine similarity reaches the threshold."""
+        if not (self.enabled and self.semantic):
+            return None
+        q = _unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            best_key, best_sim = None, self.semantic_threshold
+            for key, (created, emb, _) in self._entries.items():
+                if key[1] != params or emb is None or self._expired(created, now):
+                    continue
+                sim = float(np.dot(q, emb))
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return copy.deepcopy(self._entries[best_key][2])
+
+    def put(
+        self,
+        query: str,
+        params: Hashable,
+        version: Tuple,
+        result: Dict,
+        embedding: np.ndarray | None = None,
+    ):
+        if not self.enabled:
+            return
+        key = (normalize_query(query), params)
+        emb = _unit(embedding) if self.semantic and embedding is not None else None
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), emb, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def miss(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_ratio": (
+                    (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+                ),
+            }
+
+
+def _unit(vec: np.ndarray) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
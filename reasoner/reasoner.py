@@ -3,22 +3,80 @@
 from __future__ import annotations
 
 import logging
-from typing import List, Dict
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+import numpy as np
 
 from retrieve.retriever import Retriever
+from index.shards import open_indexer
 from index.store import Indexer
 from embed.encoder import Embedder
+from metrics import METRICS, Metrics, Spans
+from .cache import QueryCache
 from .llm_adapter import LLMAdapter
 
 logger = logging.getLogger("agent.reasoner")
 
 
 class Reasoner:
-    def __init__(self, indexer: Indexer | None = None):
-        self.indexer = indexer or Indexer()
-        self.embed = Embedder()
+    def __init__(
+        self,
+        indexer: Indexer | None = None,
+        embedder=None,
+        cache: QueryCache | None = None,
+        metrics: Metrics | None = None,
+    ):
+        self.indexer = indexer or open_indexer()
+        # anything with `encode(texts)`; the query server passes its batcher
+        self.embed = embedder or Embedder()
+        # TF-IDF fallback: reuse the weights fit at ingestion time
+        if hasattr(self.embed, "use_state"):
+            self.embed.use_state(f"{self.indexer.faiss_path}.tfidf")
         self.retriever = Retriever(self.indexer)
         self.llm = LLMAdapter()
+        # answers for repeated questions, dropped when the index changes
+        self.cache = cache if cache is not None else QueryCache()
+        # per-stage latencies and counters of every answer() call
+        self.metrics = metrics if metrics is not None else METRICS
+        # reload() swaps the index in place; answers wrapped in reading()
+        # never see it half-loaded
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._reloading = False
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        """Hold off reload() for the duration of the block (shared; many
+        readers may hold it at once). New readers wait for a pending reload."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._reloading)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+
+    def reload(self):
+        """Reload the index from disk once the current readers are done."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._reloading)
+            self._reloading = True
+            self._cond.wait_for(lambda: self._readers == 0)
+        try:
+            self.indexer.load()
+            # cached answers may come from the in-memory index just replaced
+            self.cache.clear()
+            # a rebuild may have re-fit the TF-IDF fallback
+            if hasattr(self.embed, "use_state"):
+                self.embed.use_state(f"{self.indexer.faiss_path}.tfidf")
+        finally:
+            with self._cond:
+                self._reloading = False
+                self._cond.notify_all()
 
     def decompose(self, query: str) -> List[str]:
         # Simple decomposition: split by sentences
@@ -34,27 +92,102 @@ class Reasoner:
         mmr_enabled: bool = True,
         mmr_lambda: float = 0.7,
         candidate_multiplier: int = 5,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        filter_expr: str | None = None,
+        lexical_weight: float = 0.0,
+        fusion: str = "rrf",
+        rescore: bool = False,
     ) -> Dict:
-        parts = self.decompose(query)
+        params = (
+            top_k,
+            mmr_enabled,
+            mmr_lambda,
+            candidate_multiplier,
+            nprobe,
+            ef_search,
+            filter_expr,
+            lexical_weight,
+            fusion,
+            rescore,
+        )
+        # timing spans of every stage, with a final "total", go into each
+        # trace; cached answers keep those of the run that computed them
+        spans = Spans()
+        with spans.span("cache"):
+            version = self.indexer.version() if self.cache.enabled else ()
+            cached = self.cache.get(query, params, version)
+        if cached is not None:
+            logger.info("Answer cache hit for %r", query)
+            self.metrics.inc("answer_cache_hits")
+            self._record(spans)
+            return cached
+
+        with spans.span("decompose"):
+            parts = self.decompose(query)
         traces = []
         collected_evidence = []
-        for part in parts:
-            emb = self.embed.encode([part])[0]
-            hits = self.retriever.retrieve(
-                emb,
-                top_k=top_k,
-                mmr_enabled=mmr_enabled,
-                lambda_param=mmr_lambda,
-                candidate_multiplier=candidate_multiplier,
+        # one encoder call and one batched search for all sub-queries
+        with spans.span("encode", batch=len(parts)):
+            embs = self.embed.encode(parts)
+        signature = np.asarray(embs, dtype=np.float32).mean(axis=0)
+        if self.cache.semantic:
+            with spans.span("semantic_cache"):
+                similar = self.cache.get_similar(signature, params, version)
+            if similar is not None:
+                logger.info("Semantic answer cache hit for %r", query)
+                self.metrics.inc("answer_cache_semantic_hits")
+                self._record(spans)
+                return similar
+        self.cache.miss()
+        cache = (
+            self.embed.cache_stats() if hasattr(self.embed, "cache_stats") else {}
+        )
+        if cache.get("hits") or cache.get("misses"):
+            logger.info(
+                "Embedding cache hit ratio %.2f (%d hits)",
+                cache["hit_ratio"],
+                cache["hits"],
             )
+        hits_per_part = self.retriever.retrieve_batch(
+            embs,
+            top_k=top_k,
+            mmr_enabled=mmr_enabled,
+            lambda_param=mmr_lambda,
+            candidate_multiplier=candidate_multiplier,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            filter_expr=filter_expr,
+            query_texts=parts,
+            lexical_weight=lexical_weight,
+            fusion=fusion,
+            rescore=rescore,
+            spans=spans,
+        )
+        for part, hits in zip(parts, hits_per_part):
             traces.append({"subquery": part, "hits": hits})
             for h in hits:
                 collected_evidence.append((h["text"], h.get("meta", {})))
 
         # extractive synthesis: take top passages and cite by source
-        combined = "\n\n".join([t for t, _ in collected_evidence[: top_k * 2]])
-        synthesis = f"Extractive Summary:\n\n{combined}"
-        if False:  # placeholder for LLM-enabled abstractive
-            synthesis = self.llm.synthesize(query + "\n" + combined)
+        with spans.span("synthesize"):
+            combined = "\n\n".join([t for t, _ in collected_evidence[: top_k * 2]])
+            synthesis = f"Extractive Summary:\n\n{combined}"
+            if False:  # placeholder for LLM-enabled abstractive
+                synthesis = self.llm.synthesize(query + "\n" + combined)
+
+        timings = self._record(spans)
+        self.metrics.inc("subqueries", len(parts))
+        # stages with a "batch" count were one call shared by all sub-queries
+        for trace in traces:
+            trace["spans"] = [dict(s) for s in timings]
+        result = {"synthesis": synthesis, "traces": traces}
+        self.cache.put(query, params, version, result, embedding=signature)
+        return result
 
-        return {"synthesis": synthesis, "traces": traces}
+    def _record(self, spans: Spans) -> List[Dict]:
+        """Count the query and add its spans to the metrics."""
+        timings = spans.finish()
+        self.metrics.inc("queries")
+        self.metrics.record(timings)
+        return timings
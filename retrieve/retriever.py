@@ -1,13 +1,15 @@
-"""Retriever implementing dense search and optional MMR reranking."""
+"""Retriever implementing dense (optionally hybrid BM25) search and MMR reranking."""
 
 from __future__ import annotations
 
 import logging
-from typing import List, Dict
+from typing import Dict, List, Tuple
 
+import faiss
 import numpy as np
 
 from index.store import Indexer
+from metrics import Spans
 
 logger = logging.getLogger("agent.retrieve")
 
@@ -20,6 +22,10 @@ def mmr(
 ) -> List[int]:
     """Maximal Marginal Relevance selection.
 
+    The candidate-candidate similarity matrix is computed once and the
+    max-similarity-to-selected vector is updated incrementally, so each step
+    is a single vectorized pass over the candidates.
+
     Args:
         doc_embeddings: (n_docs, dim) normalized
         query_embedding: (dim,) normalized
@@ -31,33 +37,111 @@ def mmr(
     n = doc_embeddings.shape[0]
     if n == 0:
         return []
+    return mmr_batch(
+        doc_embeddings[None, :, :],
+        np.asarray(query_embedding)[None, :],
+        lambda_param=lambda_param,
+        k=k,
+    )[0]
+
+
+def mmr_batch(
+    doc_embeddings: np.ndarray,
+    query_embeddings: np.ndarray,
+    lambda_param: float = 0.7,
+    k: int = 5,
+    mask: np.ndarray | None = None,
+) -> List[List[int]]:
+    """MMR selection for many queries at once.
+
+    Args:
+        doc_embeddings: (n_queries, n_docs, dim) normalized candidates per query
+        query_embeddings: (n_queries, dim) normalized
+        lambda_param: tradeoff between relevance and diversity
+        k: number to select per query
+        mask: optional (n_queries, n_docs) bool array; False marks padding rows
+            for queries with fewer than n_docs candidates
+
+    Returns one list of selected indices per query, ties broken by lowest index.
+    """
+    b, n = doc_embeddings.shape[:2]
+    if b == 0 or n == 0:
+        return [[] for _ in range(b)]
     # cosine similarities since embeddings normalized -> dot product
-    sims = doc_embeddings @ query_embedding
-    selected: List[int] = []
-    candidates = set(range(n))
-    while len(selected) < min(k, n):
-        best_score = None
-        best_idx = None
-        for idx in list(candidates):
-            rel = sims[idx]
-            if not selected:
-                score = lambda_param * rel
-            else:
-                # similarity of candidate to any selected (max)
-                sim_to_selected = max(
-                    float(doc_embeddings[idx] @ doc_embeddings[s]) for s in selected
-                )
-                score = lambda_param * rel - (1 - lambda_param) * sim_to_selected
-            if best_score is None or score > best_score:
-                best_score = score
-                best_idx = idx
-        if best_idx is None:
+    rel = lambda_param * np.einsum(
+        "bnd,bd->bn", doc_embeddings, query_embeddings
+    ).astype(np.float64)
+    pairwise = np.matmul(doc_embeddings, doc_embeddings.transpose(0, 2, 1)).astype(
+        np.float64
+    )
+    available = (
+        np.ones((b, n), dtype=bool) if mask is None else np.array(mask, dtype=bool)
+    )
+    # similarity of each candidate to its closest already-selected document
+    max_sim = np.zeros((b, n), dtype=np.float64)
+    rows = np.arange(b)
+    selected: List[List[int]] = [[] for _ in range(b)]
+    for step in range(min(k, n)):
+        if step == 0:
+            scores = rel.copy()
+        else:
+            scores = rel - (1 - lambda_param) * max_sim
+        scores[~available] = -np.inf
+        best = np.argmax(scores, axis=1)
+        active = available[rows, best]
+        if not active.any():
             break
-        selected.append(best_idx)
-        candidates.remove(best_idx)
+        for q in np.flatnonzero(active):
+            selected[q].append(int(best[q]))
+        available[rows[active], best[active]] = False
+        new_sims = pairwise[rows, best]
+        if step == 0:
+            max_sim[active] = new_sims[active]
+        else:
+            max_sim[active] = np.maximum(max_sim[active], new_sims[active])
     return selected
 
 
+def fuse(
+    dense: List[Tuple[int, float]],
+    lexical: List[Tuple[int, float]],
+    lexical_weight: float,
+    method: str = "rrf",
+    rrf_k: int = 60,
+    dense_metric: int = faiss.METRIC_INNER_PRODUCT,
+) -> List[Tuple[int, float]]:
+    """Fuse two ranked (id, score) lists into one, best first.
+
+    "rrf": weighted reciprocal rank fusion, sum of w / (rrf_k + rank).
+    "weighted": min-max normalized scores combined as (1 - w) * dense +
+    w * lexical; a list that misses an id contributes 0. With
+    `dense_metric` faiss.METRIC_L2 the dense scores are distances, so the
+    nearest hit normalizes to 1.
+    """
+    if method not in ("rrf", "weighted"):
+        raise ValueError(f"Unknown fusion method {method!r}")
+    fused: Dict[int, float] = {}
+    lists = (
+        (dense, 1.0 - lexical_weight, dense_metric == faiss.METRIC_L2),
+        (lexical, lexical_weight, False),
+    )
+    for hits, w, distances in lists:
+        if not hits or w <= 0:
+            continue
+        if method == "rrf":
+            for rank, (hid, _) in enumerate(hits):
+                fused[hid] = fused.get(hid, 0.0) + w / (rrf_k + rank + 1)
+        else:
+            scores = np.array([score for _, score in hits], dtype=np.float64)
+            if distances:
+                scores = -scores
+            lo, span = scores.min(), np.ptp(scores)
+            norm = (scores - lo) / span if span > 0 else np.ones_like(scores)
+            for (hid, _), x in zip(hits, norm):
+                fused[hid] = fused.get(hid, 0.0) + w * float(x)
+    return sorted(fused.items(), key=lambda kv: (-kv[1], kv[0]))
+
+
 class Retriever:
     def __init__(self, indexer: Indexer):
         self.indexer = indexer
@@ -69,23 +153,152 @@ class Retriever:
         mmr_enabled: bool = True,
         lambda_param: float = 0.7,
         candidate_multiplier: int = 5,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        filter_expr: str | None = None,
+        query_text: str | None = None,
+        lexical_weight: float = 0.0,
+        fusion: str = "rrf",
+        rescore: bool = False,
+        spans: Spans | None = None,
     ) -> List[Dict]:
+        qvec = np.asarray(query_emb, dtype=np.float32).reshape(1, -1)
+        return self.retrieve_batch(
+            qvec,
+            top_k=top_k,
+            mmr_enabled=mmr_enabled,
+            lambda_param=lambda_param,
+            candidate_multiplier=candidate_multiplier,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            filter_expr=filter_expr,
+            query_texts=None if query_text is None else [query_text],
+            lexical_weight=lexical_weight,
+            fusion=fusion,
+            rescore=rescore,
+            spans=spans,
+        )[0]
+
+    def retrieve_batch(
+        self,
+        query_embs: np.ndarray,
+        top_k: int = 5,
+        mmr_enabled: bool = True,
+        lambda_param: float = 0.7,
+        candidate_multiplier: int = 5,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        filter_expr: str | None = None,
+        query_texts: List[str] | None = None,
+        lexical_weight: float = 0.0,
+        fusion: str = "rrf",
+        rescore: bool = False,
+        spans: Spans | None = None,
+    ) -> List[List[Dict]]:
+        """Retrieve for an (m, d) matrix of query vectors.
+
+        Runs one index search for all rows and fetches metadata and embeddings
+        for the union of candidate ids once. Returns one hit list per row.
+        `nprobe` / `ef_search` tune IVF / HNSW search (None = configured value).
+        `filter_expr` (e.g. ``source^=/contracts and ext=md``) is applied
+        inside the FAISS search, so no over-fetching is needed.
+        With `query_texts` and `lexical_weight` > 0, BM25 candidates are fused
+        with the dense ones (`fusion` "rrf" or "weighted"); 1.0 is BM25 only.
+        `rescore` replaces the approximate scores of a quantized (SQ / PQ)
+        index with exact cosine similarities from the stored vectors and
+        re-ranks the candidates before the top-k / MMR cut; dense only, and
+        only for inner-product indexes.
+        With `spans`, the time of each stage (search, lexical, hydrate,
+        rescore, mmr) is recorded there; every stage covers all rows.
+        """
+        qmat = np.atleast_2d(np.asarray(query_embs, dtype=np.float32))
+        n_candidates = top_k * candidate_multiplier
+        hybrid = bool(query_texts) and lexical_weight > 0
+        spans = spans if spans is not None else Spans()
+        batch = qmat.shape[0]
         # get a superset of candidates
-        hits = self.indexer.search(query_emb, top_k=top_k * candidate_multiplier)
-        if not hits:
-            return []
-        faiss_ids = [hid for hid, _ in hits]
-        metas = self.indexer.fetch_metadata(faiss_ids)
-
-        # fetch stored embeddings for these ids
-        doc_embs = self.indexer.fetch_embeddings(faiss_ids)
-        # filter out missing embeddings
-        valid_idx = [i for i, e in enumerate(doc_embs) if e is not None]
-        if not valid_idx:
-            # fallback: return top-k by score
-            out = []
-            for (hid, score), m in zip(hits, metas):
-                out.append(
+        hits_per_query: List[List[Tuple[int, float]]]
+        if hybrid and lexical_weight >= 1.0:
+            hits_per_query = [[] for _ in range(qmat.shape[0])]
+        else:
+            with spans.span("search", batch=batch):
+                hits_per_query = self.indexer.search_batch(
+                    qmat,
+                    top_k=n_candidates,
+                    nprobe=nprobe,
+                    ef_search=ef_search,
+                    filter_expr=filter_expr,
+                )
+        if hybrid and query_texts:
+            with spans.span("lexical", batch=batch):
+                lexical = self.indexer.search_lexical(
+                    query_texts, top_k=n_candidates, filter_expr=filter_expr
+                )
+                hits_per_query = [
+                    fuse(
+                        dense,
+                        lex,
+                        lexical_weight,
+                        method=fusion,
+                        dense_metric=self.indexer.metric_type,
+                    )[:n_candidates]
+                    for dense, lex in zip(hits_per_query, lexical)
+                ]
+        union = sorted({hid for hits in hits_per_query for hid, _ in hits})
+        if not union:
+            return [[] for _ in hits_per_query]
+        # exact scores are cosine similarities; L2 indexes rank by distance
+        rescore = (
+            rescore
+            and not hybrid
+            and self.indexer.metric_type == faiss.METRIC_INNER_PRODUCT
+        )
+        # metadata and, for MMR or re-scoring, vectors of every candidate
+        # in one call
+        with spans.span("hydrate", batch=batch):
+            hydrated = self.indexer.hydrate(
+                union, with_vectors=mmr_enabled or rescore
+            )
+        metas = {
+            hid: m for hid, m in zip(union, hydrated.metadata) if m is not None
+        }
+        # drop hits whose metadata is gone
+        hits_per_query = [
+            [(hid, score) for hid, score in hits if hid in metas]
+            for hits in hits_per_query
+        ]
+        # filled whenever hydrate() was asked for vectors
+        vectors, has_vector = hydrated.vectors, hydrated.has_vector
+        if rescore and vectors is not None and has_vector is not None:
+            with spans.span("rescore", batch=batch):
+                hits_per_query = self._rescore(
+                    qmat, hits_per_query, union, vectors, has_vector
+                )
+
+        selections: List[List[int]] = [
+            list(range(min(top_k, len(hits)))) for hits in hits_per_query
+        ]
+        if mmr_enabled and vectors is not None and has_vector is not None:
+            with spans.span("mmr", batch=batch):
+                picks = self._mmr_select(
+                    qmat,
+                    hits_per_query,
+                    top_k,
+                    lambda_param,
+                    union,
+                    vectors,
+                    has_vector,
+                )
+            for q, sel in picks.items():
+                selections[q] = sel
+
+        out: List[List[Dict]] = []
+        for hits, sel in zip(hits_per_query, selections):
+            res = []
+            for idx in sel:
+                hid, score = hits[idx]
+                m = metas[hid]
+                res.append(
                     {
                         "faiss_id": hid,
                         "score": score,
@@ -93,44 +306,76 @@ class Retriever:
                         "meta": m.get("meta", {}),
                     }
                 )
-            return out[:top_k]
-
-        emb_matrix = np.vstack([doc_embs[i] for i in valid_idx])
-        # ensure embeddings normalized
-        norms = np.linalg.norm(emb_matrix, axis=1, keepdims=True)
-        norms[norms == 0] = 1.0
-        emb_matrix = emb_matrix / norms
-
-        qvec = np.array(query_emb, dtype=np.float32)
-        if qvec.ndim == 2 and qvec.shape[0] == 1:
-            qvec = qvec.ravel()
-        qnorm = np.linalg.norm(qvec)
-        if qnorm == 0:
-            qnorm = 1.0
-        qvec = qvec / qnorm
-
-        if mmr_enabled:
-            sel = mmr(
-                emb_matrix,
-                qvec,
-                lambda_param=lambda_param,
-                k=min(top_k, emb_matrix.shape[0]),
-            )
-            selected_global_idxs = [valid_idx[s] for s in sel]
-        else:
-            # fallback: pick highest score order
-            selected_global_idxs = list(range(min(top_k, len(faiss_ids))))
+            out.append(res)
+        return out
 
+    def _rescore(
+        self,
+        qmat: np.ndarray,
+        hits_per_query: List[List[Tuple[int, float]]],
+        union: List[int],
+        union_mat: np.ndarray,
+        has_vec: np.ndarray,
+    ) -> List[List[Tuple[int, float]]]:
+        """Hits re-scored by cosine similarity to their stored vector, best
+        first; a hit without a stored vector keeps its index score."""
+        if not has_vec.any():
+            return hits_per_query
+        qnorms = np.linalg.norm(qmat, axis=1, keepdims=True)
+        qnorms[qnorms == 0] = 1.0
+        # (len(union), n_queries) in one product
+        exact = union_mat @ (qmat / qnorms).T
+        pos = {hid: i for i, hid in enumerate(union)}
         out = []
-        for idx in selected_global_idxs:
-            hid, score = hits[idx]
-            m = metas[idx]
-            out.append(
-                {
-                    "faiss_id": hid,
-                    "score": score,
-                    "text": m.get("text", ""),
-                    "meta": m.get("meta", {}),
-                }
-            )
+        for q, hits in enumerate(hits_per_query):
+            scored = [
+                (hid, float(exact[pos[hid], q]) if has_vec[pos[hid]] else score)
+                for hid, score in hits
+            ]
+            # stable: ties keep the index order
+            scored.sort(key=lambda h: -h[1])
+            out.append(scored)
         return out
+
+    def _mmr_select(
+        self,
+        qmat: np.ndarray,
+        hits_per_query: List[List[Tuple[int, float]]],
+        top_k: int,
+        lambda_param: float,
+        union: List[int],
+        union_mat: np.ndarray,
+        has_vec: np.ndarray,
+    ) -> Dict[int, List[int]]:
+        """MMR picks (positions into each query's hits) for the queries that
+        have stored embeddings; the others fall back to top-k by score.
+
+        `union_mat` holds the normalized vectors of `union`, row-aligned.
+        """
+        pos = {hid: i for i, hid in enumerate(union)}
+        # per query: positions (into its hits) of candidates with an embedding
+        valid = [
+            [i for i, (hid, _) in enumerate(hits) if has_vec[pos[hid]]]
+            for hits in hits_per_query
+        ]
+        queries = [q for q, v in enumerate(valid) if v]
+        if not queries:
+            return {}
+        n_max = max(len(valid[q]) for q in queries)
+        # gather candidates per query with one fancy-index, padding with row 0
+        gather = np.zeros((len(queries), n_max), dtype=np.int64)
+        mask = np.zeros((len(queries), n_max), dtype=bool)
+        for row, q in enumerate(queries):
+            gather[row, : len(valid[q])] = [
+                pos[hits_per_query[q][i][0]] for i in valid[q]
+            ]
+            mask[row, : len(valid[q])] = True
+        cand = union_mat[gather]
+
+        qvecs = qmat[queries]
+        qnorms = np.linalg.norm(qvecs, axis=1, keepdims=True)
+        qnorms[qnorms == 0] = 1.0
+        qvecs = qvecs / qnorms
+
+        picks = mmr_batch(cand, qvecs, lambda_param=lambda_param, k=top_k, mask=mask)
+        return {q: [valid[q][s] for s in picks[row]] for row, q in enumerate(queries)}
@@ -0,0 +1,312 @@
+"""Resident query server: keeps the embedder, FAISS index and metadata store warm.
+
+`cli.py serve` starts it; `cli.py query --server URL` is the thin client.
+Concurrent requests share one encoder thread that micro-batches their
+sub-queries into a single `encode` call.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("agent.server")
+
+_STOP = object()  # shuts the batcher thread down
+
+# request fields forwarded to Reasoner.answer, with their types
+_QUERY_ARGS = {
+    "top_k": int,
+    "mmr_enabled": bool,
+    "mmr_lambda": float,
+    "candidate_multiplier": int,
+    "nprobe": int,
+    "ef_search": int,
+    "filter_expr": str,
+    "lexical_weight": float,
+    "fusion": str,
+    "rescore": bool,
+}
+
+
+class MicroBatcher:
+    """Queue encode requests and serve them from one background thread.
+
+    The thread takes the first waiting request, then keeps collecting for
+    up to `window_ms` (or until `max_batch` texts) and encodes everything
+    in one call. Other attributes are delegated to the wrapped embedder.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        window_ms: float = 5.0,
+        max_batch: int = 64,
+        max_queue: int = 1024,
+    ):
+        self.embedder = embedder
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.batches = 0
+        self.texts = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(
+            target=self._run, name="encode-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def __getattr__(self, name):
+        return getattr(self.embedder, name)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        fut: Future = Future()
+        self._queue.put((list(texts), fut))
+        return fut.result()
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            n = len(item[0])
+            deadline = time.monotonic() + self.window_s
+            stop = False
+            while n < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+                n += len(item[0])
+            self._encode(batch)
+            if stop:
+                return
+
+    def _encode(self, batch) -> None:
+        texts = [t for texts, _ in batch for t in texts]
+        try:
+            embs = np.asarray(self.embedder.encode(texts))
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        self.batches += 1
+        self.texts += len(texts)
+        start = 0
+        for texts, fut in batch:
+            fut.set_result(embs[start : start + len(texts)])
+            start += len(texts)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    """Threaded HTTP server whose handlers reach the QueryServer as `app`."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], app: QueryServer):
+        super().__init__(address, _Handler)
+        self.app = app
+
+
+class QueryServer:
+    """Load the index and embedder once and answer queries over HTTP.
+
+    Endpoints: `POST /query` (JSON body with `q` plus optional
+    `Reasoner.answer` arguments), `POST /reload` (re-read the index from
+    disk), `GET /health`, and per-stage query latencies and counters as
+    `GET /metrics` (Prometheus text format) or `GET /stats` (JSON).
+    """
+
+    def __init__(
+        self,
+        host: str | None = None,
+        port: int | None = None,
+        indexer=None,
+        embedder=None,
+        window_ms: float | None = None,
+        max_batch: int | None = None,
+    ):
+        import yaml
+
+        try:
+            cfg = yaml.safe_load(open("config.yml"))
+        except Exception:
+            cfg = {}
+        scfg = cfg.get("server", {})
+        # heavy imports stay here so the thin client only needs the stdlib
+        from index.shards import open_indexer
+        from reasoner.reasoner import Reasoner
+
+        if embedder is None:
+            from embed.encoder import Embedder
+
+            embedder = Embedder()
+        self.indexer = indexer or open_indexer()
+        self.indexer.load()
+        self.embedder = embedder
+        self.batcher = MicroBatcher(
+            embedder,
+            window_ms=(
+                window_ms
+                if window_ms is not None
+                else float(scfg.get("batch_window_ms", 5))
+            ),
+            max_batch=max_batch or int(scfg.get("max_batch", 64)),
+        )
+        self.reasoner = Reasoner(indexer=self.indexer, embedder=self.batcher)
+        self.host = str(host or scfg.get("host", "127.0.0.1"))
+        port = int(port if port is not None else scfg.get("port", 8765))
+        self.httpd = _HTTPServer((self.host, port), self)
+
+    @property
+    def url(self) -> str:
+        # port 0 binds a free port; read back the one chosen
+        return f"http://{self.host}:{self.httpd.server_address[1]}"
+
+    def answer(self, payload: Dict) -> Dict:
+        q = payload.get("q")
+        if not isinstance(q, str) or not q.strip():
+            raise ValueError("missing query text 'q'")
+        kwargs = {
+            k: cast(payload[k])
+            for k, cast in _QUERY_ARGS.items()
+            if payload.get(k) is not None
+        }
+        with self.reasoner.reading():
+            return self.reasoner.answer(q, **kwargs)
+
+    def reload(self) -> Dict:
+        self.reasoner.reload()
+        return self.health()
+
+    def health(self) -> Dict:
+        return {
+            "status": "ok",
+            "ntotal": int(self.indexer.stats().ntotal),
+            "encode_batches": self.batcher.batches,
+            "encoded_texts": self.batcher.texts,
+            "answer_cache": self.reasoner.cache.stats(),
+        }
+
+    def stats(self) -> Dict:
+        return self.reasoner.metrics.snapshot()
+
+    def metrics_text(self) -> str:
+        return self.reasoner.metrics.prometheus()
+
+    def serve_forever(self) -> None:
+        logger.info("Query server listening on %s", self.url)
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.batcher.close()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        app = self.server.app
+        if self.path == "/health":
+            self._reply(200, app.health())
+        elif self.path == "/stats":
+            self._reply(200, app.stats())
+        elif self.path == "/metrics":
+            self._reply_text(200, app.metrics_text())
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        app = self.server.app
+        try:
+            if self.path == "/query":
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                self._reply(200, app.answer(payload))
+            elif self.path == "/reload":
+                self._reply(200, app.reload())
+            else:
+                self._reply(404, {"error": f"unknown path {self.path}"})
+        except (ValueError, TypeError) as e:
+            self._reply(400, {"error": str(e)})
+        except Exception as e:
+            logger.exception("Query failed")
+            self._reply(500, {"error": str(e)})
+
+    def _reply(self, status: int, body: Dict) -> None:
+        data = json.dumps(body, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reply_text(self, status: int, text: str) -> None:
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("%s " + format, self.address_string(), *args)
+
+
+def _json_default(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    raise TypeError(f"not JSON serializable: {type(o).__name__}")
+
+
+def query_remote(url: str, q: str, timeout: float = 60.0, **kwargs) -> Dict:
+    """Send one query to a running server; raises RuntimeError on failure."""
+    payload = {"q": q, **{k: v for k, v in kwargs.items() if v is not None}}
+    req = urllib.request.Request(
+        url.rstrip("/") + "/query",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        detail = json.loads(e.read() or b"{}").get("error", e.reason)
+        raise RuntimeError(f"query server returned {e.code}: {detail}") from e
+
+
+def fetch_stats(url: str, prometheus: bool = False, timeout: float = 10.0):
+    """Metrics of a running server: the `/stats` dict, or with `prometheus`
+    the `/metrics` text; raises RuntimeError on failure."""
+    path = "/metrics" if prometheus else "/stats"
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + path, timeout=timeout) as resp:
+            body = resp.read()
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"query server returned {e.code}: {e.reason}") from e
+    return body.decode("utf-8") if prometheus else json.loads(body)
@@ -1,7 +1,138 @@
 import sys
+import time
 from pathlib import Path
 
+import numpy as np
+import pytest
+
 # Ensure repo root is on sys.path for imports
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+from index.store import Indexer  # noqa: E402
+
+
+@pytest.fixture
+def unit_vectors():
+    """`unit_vectors(rng, *shape)`: random float32 vectors of unit length
+    along the last axis, e.g. `unit_vectors(rng, n, d)` for n rows."""
+
+    def make(rng, *shape):
+        x = rng.standard_normal(shape).astype(np.float32)
+        return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+    return make
+
+
+@pytest.fixture
+def make_docs():
+    """`make_docs(name, n, version=0)`: n chunks of the file /data/<name>."""
+
+    def make(name, n, version=0):
+        return [
+            {
+                "id": f"{name}::chunk::{i}",
+                "text": f"{name} part{i} rev{version}",
+                "metadata": {"chunk_index": i, "name": name},
+                "source": f"/data/{name}",
+            }
+            for i in range(n)
+        ]
+
+    return make
+
+
+@pytest.fixture
+def plain_docs():
+    """`plain_docs(n, start=0)`: n single-chunk docs without a source path."""
+
+    def make(n, start=0):
+        return [
+            {"id": f"d{i}", "text": f"doc{i}", "metadata": {"chunk_index": 0}}
+            for i in range(start, start + n)
+        ]
+
+    return make
+
+
+@pytest.fixture
+def make_indexer(tmp_path):
+    """`make_indexer(**kwargs)`: an Indexer whose files live in tmp_path."""
+
+    def make(**kwargs):
+        return Indexer(
+            faiss_path=str(tmp_path / "faiss.index"),
+            sqlite_path=str(tmp_path / "meta.db"),
+            **kwargs,
+        )
+
+    return make
+
+
+class _RandomEmbedder:
+    """Unit vectors seeded by the batch size; `calls` holds the number of
+    texts of every encode() call."""
+
+    def __init__(self, dim=8, batch_size=4):
+        self.dim = dim
+        self.batch_size = batch_size
+        self.calls = []
+
+    @property
+    def encoded(self):
+        return sum(self.calls)
+
+    def encode(self, texts):
+        self.calls.append(len(texts))
+        rng = np.random.default_rng(len(texts))
+        x = rng.standard_normal((len(texts), self.dim)).astype(np.float32)
+        return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+class _BucketEmbedder:
+    """One-hot vectors: a text lands in bucket sum(ord) % 8, after `fold`.
+    Each encode() call records its number of texts in `calls`."""
+
+    batch_size = 4
+
+    def __init__(self, delay=0.0, fold=None):
+        self.delay = delay
+        self.fold = fold
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(len(texts))
+        if self.delay:
+            time.sleep(self.delay)
+        x = np.zeros((len(texts), 8), dtype=np.float32)
+        for i, t in enumerate(texts):
+            x[i, sum(map(ord, self.fold(t) if self.fold else t)) % 8] = 1.0
+        return x
+
+
+@pytest.fixture
+def random_embedder():
+    """`random_embedder(dim=8, batch_size=4)`: a fake embedder whose
+    vectors depend only on the number of texts encoded together."""
+    return _RandomEmbedder
+
+
+@pytest.fixture
+def bucket_embedder():
+    """`bucket_embedder(delay=0.0, fold=None)`: a fake embedder mapping each
+    text to one of 8 one-hot vectors; `fold` normalizes texts first."""
+    return _BucketEmbedder
+
+
+@pytest.fixture
+def eye_indexer(make_indexer):
+    """An Indexer in tmp_path holding "doc 0".."doc 7" as one-hot vectors."""
+    idx = make_indexer()
+    idx.rebuild()
+    docs = [
+        {"id": f"d{i}", "text": f"doc {i}", "metadata": {"chunk_index": 0}}
+        for i in range(8)
+    ]
+    idx.add(np.eye(8, dtype=np.float32), docs)
+    return idx
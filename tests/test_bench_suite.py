@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+
+from bench.suite import compare, main
+from bench.synthetic import FakeEmbedder, make_corpus
+from ingest.loader import Ingestor
+
+
+def test_fake_embedder_is_deterministic():
+    texts = ["torque spec for part AB", "Torque spec, for part AB!", "unrelated words"]
+    a = FakeEmbedder(dim=16).encode(texts)
+    b = FakeEmbedder(dim=16).encode(texts)
+    np.testing.assert_array_equal(a, b)
+    np.testing.assert_allclose(np.linalg.norm(a, axis=1), 1.0, rtol=1e-6)
+    # case and punctuation do not matter, shared words do
+    assert a[0] @ a[1] > 0.999
+    assert a[0] @ a[2] < 0.9
+
+
+def test_make_corpus_is_reproducible(tmp_path):
+    a = make_corpus(str(tmp_path / "a"), docs=6, doc_words=80, queries=4, seed=3)
+    b = make_corpus(str(tmp_path / "b"), docs=6, doc_words=80, queries=4, seed=3)
+    assert a.texts == b.texts and a.queries == b.queries
+    assert len(a.queries) == 4
+    exts = sorted(p.rsplit(".", 1)[1] for p in a.paths)
+    assert exts == ["html", "html", "md", "md", "txt", "txt"]
+    chunks = Ingestor().ingest_folder(tmp_path / "a")
+    assert {c.metadata["name"] for c in chunks} == {
+        p.rsplit("/", 1)[1] for p in a.paths
+    }
+
+
+def _result(**values):
+    stages = {
+        name: {"metric": "m", "value": v, "better": better}
+        for name, (v, better) in values.items()
+    }
+    return {"stages": stages}
+
+
+def test_compare_flags_slowdowns_beyond_threshold():
+    base = _result(
+        ingest=(100.0, "higher"), search=(1.0, "lower"), mmr=(1.0, "lower")
+    )
+    new = _result(
+        ingest=(80.0, "higher"), search=(0.5, "lower"), answer=(2.0, "lower")
+    )
+    rows = {r["stage"]: r for r in compare(base, new, threshold=0.1)}
+    assert rows["ingest"]["status"] == "regression"
+    assert abs(rows["ingest"]["change"] + 0.2) < 1e-9
+    assert rows["search"]["status"] == "improvement"
+    assert rows["mmr"]["status"] == "removed"
+    assert rows["answer"]["status"] == "added"
+    rows = {r["stage"]: r for r in compare(base, new, threshold=0.3)}
+    assert rows["ingest"]["status"] == "ok"
+
+
+def test_suite_run_and_compare(tmp_path, capsys):
+    out = str(tmp_path / "run.json")
+    args = ["run", "--docs", "4", "--doc-words", "200", "--queries", "3"]
+    assert main(args + ["--repeat", "1", "--dim", "32", "--out", out]) == 0
+    with open(out) as f:
+        result = json.load(f)
+    assert list(result["stages"]) == [
+        "ingest",
+        "chunk",
+        "encode",
+        "index_add",
+        "search",
+        "search_batch",
+        "fetch_metadata",
+        "fetch_embeddings",
+        "mmr",
+        "answer",
+    ]
+    assert result["params"]["docs"] == 4
+    assert all(s["value"] > 0 for s in result["stages"].values())
+    assert main(["compare", out, out]) == 0
+    assert "regression" not in capsys.readouterr().out
@@ -0,0 +1,176 @@
+import math
+from collections import Counter
+
+import faiss
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+
+from index.lexical import postings_table, tokenize
+from retrieve.retriever import Retriever, fuse
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+
+
+def _corpus(n, seed=0):
+    rng = np.random.default_rng(seed)
+    texts = []
+    for i in range(n):
+        words = rng.choice(WORDS, size=int(rng.integers(3, 30)), p=_zipf())
+        texts.append(" ".join(words) + f" sn{i:04d}")
+    return texts
+
+
+def _zipf():
+    w = 1.0 / np.arange(1, len(WORDS) + 1)
+    return w / w.sum()
+
+
+def _indexer(make_indexer, texts, batch=16, dim=8, index_type=None):
+    idx = make_indexer(index_type=index_type)
+    idx.lexical.block_size = 8  # many blocks, so MaxScore skipping kicks in
+    rng = np.random.default_rng(1)
+    vecs = rng.standard_normal((len(texts), dim)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    ids = []
+    for s in range(0, len(texts), batch):
+        docs = [
+            {"id": f"d{i}", "text": t, "metadata": {"chunk_index": 0, "name": f"{i}"}}
+            for i, t in enumerate(texts[s : s + batch], start=s)
+        ]
+        ids.extend(idx.add(vecs[s : s + batch], docs).tolist())
+    idx.flush()
+    return idx, vecs, ids
+
+
+def _brute_force(texts, query, k1=1.2, b=0.75):
+    docs = [Counter(tokenize(t)) for t in texts]
+    lens = [sum(d.values()) for d in docs]
+    avgdl = sum(lens) / len(docs)
+    scores = np.zeros(len(docs))
+    for term in set(tokenize(query)):
+        df = sum(term in d for d in docs)
+        if not df:
+            continue
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for i, d in enumerate(docs):
+            tf = d[term]
+            if tf:
+                norm = k1 * (1 - b + b * lens[i] / avgdl)
+                scores[i] += idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def test_tokenize_keeps_part_numbers_and_their_parts():
+    assert tokenize("The AB-1234 valve, v2.1 of it") == [
+        "ab-1234",
+        "ab",
+        "1234",
+        "valve",
+        "v2.1",
+        "v2",
+        "1",
+    ]
+
+
+@pytest.mark.parametrize(
+    "query", ["alpha", "kappa lambda mu", "beta theta sn0007", "alpha beta gamma"]
+)
+def test_maxscore_matches_exhaustive_bm25(make_indexer, query):
+    texts = _corpus(120)
+    idx, _, ids = _indexer(make_indexer, texts)
+    expected = _brute_force(texts, query)
+    hits = idx.search_lexical([query], top_k=5)[0]
+    top = np.sort(expected)[::-1][:5]
+    np.testing.assert_allclose([s for _, s in hits], top, rtol=1e-6)
+    for hid, score in hits:
+        assert expected[ids.index(hid)] == pytest.approx(score, rel=1e-6)
+
+
+def test_compaction_merges_partial_blocks(make_indexer):
+    texts = _corpus(120)
+    idx, _, _ = _indexer(make_indexer, texts, batch=4)
+    with idx.engine.connect() as conn:
+        blocks, postings = conn.execute(
+            select(func.count(), func.sum(postings_table.c.n)).where(
+                postings_table.c.term == "alpha"
+            )
+        ).one()
+    # 30 add() batches were merged into full blocks of 8 plus one tail
+    assert blocks == math.ceil(postings / 8)
+    # stale postings are cleared with the index
+    idx.rebuild()
+    assert idx.search_lexical(["alpha"]) == [[]]
+
+
+def test_hybrid_retrieval_finds_exact_keyword(make_indexer):
+    texts = _corpus(120)
+    idx, vecs, ids = _indexer(make_indexer, texts)
+    ret = Retriever(idx)
+    # the dense query points at chunk 3; the serial number names chunk 42
+    dense_only = ret.retrieve(vecs[3], top_k=3, mmr_enabled=False)
+    assert ids[42] not in [h["faiss_id"] for h in dense_only]
+    hybrid = ret.retrieve(
+        vecs[3],
+        top_k=3,
+        mmr_enabled=False,
+        query_text="sn0042",
+        lexical_weight=0.5,
+    )
+    assert {ids[3], ids[42]} <= {h["faiss_id"] for h in hybrid}
+    lexical_only = ret.retrieve(
+        vecs[3], top_k=1, query_text="sn0042", lexical_weight=1.0
+    )
+    assert [h["faiss_id"] for h in lexical_only] == [ids[42]]
+    # metadata filters apply to the BM25 side too
+    filtered = idx.search_lexical(["sn0042"], filter_expr="name=7")
+    assert filtered == [[]]
+
+
+def test_fuse_rrf_and_weighted():
+    dense = [(1, 0.9), (3, 0.8), (2, 0.1)]
+    lexical = [(3, 12.0), (4, 3.0)]
+    rrf = fuse(dense, lexical, 0.5)
+    assert rrf[0][0] in (1, 3)
+    assert {hid for hid, _ in rrf} == {1, 2, 3, 4}
+    weighted = fuse(dense, lexical, 0.5, method="weighted")
+    assert weighted[0][0] == 3  # strong in both lists
+    assert fuse(dense, lexical, 0.0) == fuse(dense, [], 0.0)
+    with pytest.raises(ValueError):
+        fuse(dense, lexical, 0.5, method="max")
+
+
+def test_weighted_fusion_ranks_l2_distances_nearest_first():
+    dense = [(1, 0.1), (2, 0.5), (3, 1.0)]
+    weighted = fuse(dense, [], 0.0, method="weighted", dense_metric=faiss.METRIC_L2)
+    assert weighted == [(1, 1.0), (2, 5 / 9), (3, 0.0)]
+
+
+@pytest.mark.parametrize("index_type", ["FlatL2", "HNSW"])
+def test_weighted_hybrid_on_l2_index(make_indexer, index_type):
+    texts = _corpus(120)
+    idx, vecs, ids = _indexer(make_indexer, texts, index_type=index_type)
+    ret = Retriever(idx)
+    # the nearest dense hit (distance 0) leads when BM25 finds nothing
+    hits = ret.retrieve(
+        vecs[3],
+        top_k=3,
+        mmr_enabled=False,
+        query_text="nomatch",
+        lexical_weight=0.2,
+        fusion="weighted",
+    )
+    assert hits[0]["faiss_id"] == ids[3]
+    hybrid = ret.retrieve(
+        vecs[3],
+        top_k=2,
+        mmr_enabled=False,
+        query_text="sn0042",
+        lexical_weight=0.5,
+        fusion="weighted",
+    )
+    assert {h["faiss_id"] for h in hybrid} == {ids[3], ids[42]}
+    # exact re-scoring is cosine-based, so L2 indexes keep their distances
+    rescored = ret.retrieve(vecs[3], top_k=3, mmr_enabled=False, rescore=True)
+    plain = ret.retrieve(vecs[3], top_k=3, mmr_enabled=False)
+    assert rescored == plain
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from embed.encoder import Embedder, plan_batches
+
+
+def test_plan_batches_respects_token_budget():
+    lengths = np.array([5, 120, 7, 64, 3, 200, 6, 6])
+    batches = plan_batches(lengths, max_tokens=256)
+    # every text exactly once, shortest first
+    flat = np.concatenate(batches)
+    assert sorted(flat.tolist()) == list(range(len(lengths)))
+    assert lengths[flat].tolist() == sorted(lengths.tolist())
+    for b in batches:
+        assert len(b) == 1 or len(b) * lengths[b].max() <= 256
+    # the five short texts share one call instead of being padded to 200
+    assert sorted(batches[0].tolist()) == [0, 2, 4, 6, 7]
+    # a text longer than the budget still gets a batch
+    assert plan_batches(np.array([300]), max_tokens=256)[0].tolist() == [0]
+    assert [len(b) for b in plan_batches(np.ones(10), 256, max_texts=4)] == [4, 4, 2]
+
+
+class _RecordingModel:
+    """Stands in for a SentenceTransformer without a tokenizer."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.array([[len(t.split()), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_encode_buckets_by_length_and_keeps_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    emb = Embedder()
+    emb._backend = "sbert"
+    emb.model = _RecordingModel()
+    emb.max_batch_tokens = 40
+    texts = ["w " * 30, "a b", "w " * 12, "c", "d e f"]
+    out = emb.encode(texts)
+    # word counts + 2 special tokens: 32, 4, 14, 3, 5
+    assert emb.model.calls == [["c", "a b", "d e f"], ["w " * 12], ["w " * 30]]
+    expected = np.array([[30, 1], [2, 1], [12, 1], [1, 1], [3, 1]], dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    np.testing.assert_allclose(out, expected, rtol=1e-6)
+
+
+def _tiny_model(root):
+    """A small random-weight BERT SentenceTransformer saved under `root`."""
+    pytest.importorskip("torch")
+    st = pytest.importorskip("sentence_transformers")
+    tk = pytest.importorskip("tokenizers")
+    transformers = pytest.importorskip("transformers")
+    st_models = pytest.importorskip("sentence_transformers.models")
+
+    tok = tk.Tokenizer(tk.models.WordPiece(unk_token="[UNK]"))
+    tok.normalizer = tk.normalizers.BertNormalizer(lowercase=True)
+    tok.pre_tokenizer = tk.pre_tokenizers.BertPreTokenizer()
+    special = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    words = "the torque spec for part is nm a short contract clause example"
+    trainer = tk.trainers.WordPieceTrainer(vocab_size=120, special_tokens=special)
+    tok.train_from_iterator([words] * 20, trainer)
+    tok.post_processor = tk.processors.TemplateProcessing(
+        single="[CLS] $A [SEP]",
+        special_tokens=[(t, tok.token_to_id(t)) for t in ("[CLS]", "[SEP]")],
+    )
+    fast = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tok,
+        unk_token="[UNK]",
+        pad_token="[PAD]",
+        cls_token="[CLS]",
+        sep_token="[SEP]",
+        mask_token="[MASK]",
+    )
+    config = transformers.BertConfig(
+        vocab_size=fast.vocab_size,
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        intermediate_size=64,
+        max_position_embeddings=128,
+    )
+    hf_dir, st_dir = str(root / "hf"), str(root / "st")
+    transformers.BertModel(config).save_pretrained(hf_dir)
+    fast.save_pretrained(hf_dir)
+    modules = [
+        st_models.Transformer(hf_dir, max_seq_length=64),
+        st_models.Pooling(32, "mean"),
+    ]
+    st.SentenceTransformer(modules=modules).save(st_dir)
+    return st_dir
+
+
+def test_worker_processes_match_in_process_encoding(tmp_path, monkeypatch):
+    model = _tiny_model(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    texts = [f"torque spec for part {i} " * (1 + i % 7) for i in range(40)]
+    local = Embedder(model_name=model, backend="sbert", workers=0)
+    pooled = Embedder(model_name=model, backend="sbert", workers=2)
+    pooled.max_batch_tokens = 256
+    try:
+        got = pooled.encode(texts)
+        assert pooled._pool is not None
+    finally:
+        pooled.close()
+    np.testing.assert_allclose(got, local.encode(texts), atol=1e-5)
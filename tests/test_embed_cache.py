@@ -0,0 +1,49 @@
+import numpy as np
+
+from embed.cache import EmbeddingCache
+from embed.encoder import Embedder
+
+
+def test_cache_roundtrip_and_lru_eviction(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.db"), max_entries=3)
+    vecs = np.eye(4, dtype=np.float32)
+    cache.put_many("m", ["a", "b", "c"], vecs[:3])
+    assert cache.get_many("other-model", ["a"]) == [None]
+
+    got = cache.get_many("m", ["a", "x"])
+    assert np.array_equal(got[0], vecs[0]) and got[1] is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # "a" was used most recently, so "b" is the LRU entry evicted by "d"
+    cache.get_many("m", ["c"])
+    cache.get_many("m", ["a"])
+    cache.put_many("m", ["d"], vecs[3:])
+    found = cache.get_many("m", ["a", "b", "c", "d"])
+    assert [v is not None for v in found] == [True, False, True, True]
+
+    # persisted across instances
+    again = EmbeddingCache(path=str(tmp_path / "cache.db"), max_entries=3)
+    assert again.get_many("m", ["d"])[0] is not None
+
+
+class _CountingModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_embedder_only_encodes_misses(tmp_path):
+    emb = Embedder(cache=EmbeddingCache(path=str(tmp_path / "cache.db")))
+    # stand in for a loaded SentenceTransformer
+    emb._backend = "sbert"
+    emb.model = _CountingModel()
+
+    first = emb.encode(["aa", "bbb"])
+    second = emb.encode(["bbb", "cccc", "aa"])
+    assert emb.model.calls == [["aa", "bbb"], ["cccc"]]
+    assert np.allclose(second[[0, 2]], first[[1, 0]])
+    stats = emb.cache_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 3
@@ -1,16 +1,16 @@
+import numpy as np
+
 from embed.encoder import Embedder
-from index.store import Indexer
+from retrieve.retriever import Retriever
 
 
-def test_embed_and_index(tmp_path):
+def test_embed_and_index(make_indexer):
     texts = ["This is a test.", "Another short document."]
     emb = Embedder()
     vecs = emb.encode(texts)
     assert vecs.shape[0] == 2
 
-    idx = Indexer(
-        faiss_path=str(tmp_path / "faiss.index"), sqlite_path=str(tmp_path / "meta.db")
-    )
+    idx = make_indexer()
     idx.rebuild()
     docs = []
     for i, t in enumerate(texts):
@@ -23,3 +23,27 @@ def test_embed_and_index(tmp_path):
     qv = vecs[0]
     hits = idx.search(qv, top_k=2)
     assert len(hits) >= 1
+
+
+def test_retrieve_batch_matches_single_queries(make_indexer):
+    rng = np.random.default_rng(1)
+    vecs = rng.standard_normal((40, 8)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    idx = make_indexer()
+    idx.rebuild()
+    docs = [
+        {"id": f"d{i}", "text": f"doc{i}", "metadata": {"chunk_index": 0}}
+        for i in range(40)
+    ]
+    ids = idx.add(vecs, docs).tolist()
+
+    retr = Retriever(idx)
+    queries = vecs[[0, 5, 9]]
+    for mmr_enabled in (True, False):
+        batched = retr.retrieve_batch(queries, top_k=4, mmr_enabled=mmr_enabled)
+        assert len(batched) == 3
+        for q, hits in zip(queries, batched):
+            single = retr.retrieve(q, top_k=4, mmr_enabled=mmr_enabled)
+            assert [h["faiss_id"] for h in hits] == [h["faiss_id"] for h in single]
+            # metadata is aligned with the hit ids
+            assert all(h["text"] == f"doc{ids.index(h['faiss_id'])}" for h in hits)
@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+
+from index.filters import FilterError, field_rows, parse_filter
+from retrieve.retriever import Retriever
+
+
+def _docs(n):
+    docs = []
+    for i in range(n):
+        folder = "contracts" if i % 2 == 0 else "notes"
+        ext = "md" if i % 3 == 0 else "txt"
+        meta = {
+            "source": f"/data/{folder}/f{i}.{ext}",
+            "name": f"f{i}.{ext}",
+            "chunk_index": 0,
+        }
+        if ext == "md":
+            meta["tags"] = ["nda", "draft"] if i % 4 == 0 else ["final"]
+            meta["author"] = "alice" if i < n // 2 else "bob"
+        docs.append(
+            {
+                "id": f"d{i}",
+                "text": f"doc {i}",
+                "metadata": meta,
+                "source": meta["source"],
+            }
+        )
+    return docs
+
+
+def _indexer(make_indexer, index_type="FlatIP", n=60, dim=16):
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((n, dim)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    idx = make_indexer(index_type=index_type)
+    idx.rebuild()
+    idx.dim = dim
+    idx.index = idx._make_index()
+    if not idx.index.is_trained:
+        idx.train(vecs)
+    docs = _docs(n)
+    ids = idx.add(vecs, docs).tolist()
+    return idx, vecs, docs, ids
+
+
+def _is_md(m):
+    return m["name"].endswith(".md")
+
+
+CASES = [
+    ("source^=/data/contracts", lambda m: m["source"].startswith("/data/contracts")),
+    ("ext=md and tags=nda", lambda m: _is_md(m) and "nda" in m.get("tags", [])),
+    ("name$=.txt or author=bob", lambda m: not _is_md(m) or m["author"] == "bob"),
+    # suffixes match case-sensitively, like "=" and "^="
+    ("name$=.TXT or name$=1.txt", lambda m: m["name"].endswith((".TXT", "1.txt"))),
+    ("name$=_.md", lambda m: False),
+    ("not (author=alice or author=bob)", lambda m: "author" not in m),
+    ("author!=alice and ext='md'", lambda m: _is_md(m) and m["author"] != "alice"),
+]
+
+
+@pytest.mark.parametrize("expr,pred", CASES)
+def test_select_ids_matches_python_filter(make_indexer, expr, pred):
+    idx, _, docs, ids = _indexer(make_indexer)
+    expected = sorted(ids[i] for i, d in enumerate(docs) if pred(d["metadata"]))
+    assert sorted(idx.select_ids(expr).tolist()) == expected
+
+
+@pytest.mark.parametrize("index_type", ["FlatIP", "HNSW", "IVF4,Flat"])
+def test_filtered_search_only_returns_matching_chunks(make_indexer, index_type):
+    idx, vecs, docs, _ = _indexer(make_indexer, index_type=index_type)
+    allowed = set(idx.select_ids("source^=/data/contracts and ext=txt").tolist())
+    hits = idx.search_batch(
+        vecs[:5], top_k=5, nprobe=4, filter_expr="source^=/data/contracts and ext=txt"
+    )
+    for row in hits:
+        assert len(row) == 5
+        assert {hid for hid, _ in row} <= allowed
+
+
+def test_retriever_filter_needs_no_overfetch(make_indexer):
+    idx, vecs, docs, _ = _indexer(make_indexer)
+    ret = Retriever(idx)
+    # a doc outside the filter is the best match for its own vector
+    hits = ret.retrieve(
+        vecs[1],
+        top_k=3,
+        mmr_enabled=False,
+        candidate_multiplier=1,
+        filter_expr="tags=nda",
+    )
+    assert len(hits) == 3
+    assert all("nda" in h["meta"]["tags"] for h in hits)
+    assert ret.retrieve(vecs[1], filter_expr="author=nobody") == []
+
+
+def test_filter_skips_removed_sources_and_reindex(make_indexer):
+    idx, vecs, docs, ids = _indexer(make_indexer)
+    idx.remove_sources(["/data/contracts/f0.md"])
+    assert ids[0] not in idx.select_ids("tags=nda").tolist()
+    before = sorted(idx.select_ids("ext=md").tolist())
+    idx.reindex_fields()
+    assert sorted(idx.select_ids("ext=md").tolist()) == before
+
+
+def test_field_rows_and_parse_errors():
+    meta = {
+        "name": "a.MD",
+        "tags": ["x", "y"],
+        "meta": {"year": 2024},
+        "draft": True,
+        "tables": [{"page": 1}],
+    }
+    assert set(field_rows(meta)) == {
+        ("name", "a.MD"),
+        ("tags", "x"),
+        ("tags", "y"),
+        ("meta.year", "2024"),
+        ("draft", "true"),
+        ("ext", "md"),
+    }
+    assert parse_filter('title="a \\"b\\"" and x^=1') == (
+        "and",
+        ("cmp", "title", "=", 'a "b"'),
+        ("cmp", "x", "^=", "1"),
+    )
+    for bad in ["", "source", "source=", "(a=b", "a=b and", "a=b c=d"]:
+        with pytest.raises(FilterError):
+            parse_filter(bad)
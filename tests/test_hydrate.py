@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from sqlalchemy import event
+
+from index.shards import ShardedIndexer
+from index.store import chunk_id
+
+
+def _count_queries(engine):
+    counter = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*args):
+        counter["n"] += 1
+
+    return counter
+
+
+@pytest.mark.parametrize("fmt", ["binary", "mmap", "faiss"])
+def test_hydrate_is_aligned_with_input_order(
+    fmt, unit_vectors, make_docs, make_indexer
+):
+    rng = np.random.default_rng(0)
+    idx = make_indexer(embedding_format=fmt)
+    idx.rebuild()
+    vecs = unit_vectors(rng, 6, 8)
+    ids = idx.add(vecs, make_docs("a.md", 6)).tolist()
+
+    order = [ids[4], 12345, ids[0], ids[2]]
+    counter = _count_queries(idx.engine)
+    out = idx.hydrate(order, with_vectors=True)
+    # one round trip for metadata and vectors
+    assert counter["n"] == 1
+    assert [m and m["text"] for m in out.metadata] == [
+        "a.md part4 rev0",
+        None,
+        "a.md part0 rev0",
+        "a.md part2 rev0",
+    ]
+    assert out.has_vector.tolist() == [True, False, True, True]
+    np.testing.assert_allclose(out.vectors[[0, 2, 3]], vecs[[4, 0, 2]], atol=1e-6)
+    assert [m["faiss_id"] for m in idx.fetch_metadata(order)] == [
+        ids[4],
+        ids[0],
+        ids[2],
+    ]
+
+
+def test_hot_chunks_are_cached_until_replaced(unit_vectors, make_docs, make_indexer):
+    rng = np.random.default_rng(1)
+    idx = make_indexer()
+    idx.rebuild()
+    idx.add(unit_vectors(rng, 3, 8), make_docs("a.md", 3))
+    first = chunk_id("/data/a.md", 0)
+    idx.hydrate([first], with_vectors=True)
+
+    counter = _count_queries(idx.engine)
+    cached = idx.hydrate([first], with_vectors=True)
+    assert cached.metadata[0]["text"] == "a.md part0 rev0"
+    assert cached.has_vector.tolist() == [True]
+    assert counter["n"] == 0
+
+    idx.upsert(unit_vectors(rng, 3, 8), make_docs("a.md", 3, version=1))
+    assert idx.hydrate([first]).metadata[0]["text"] == "a.md part0 rev1"
+    idx.delete("/data/a.md")
+    assert idx.hydrate([first]).metadata == [None]
+
+
+def test_sharded_hydrate_merges_shards(tmp_path, unit_vectors, make_docs):
+    rng = np.random.default_rng(2)
+    idx = ShardedIndexer(shard_dir=str(tmp_path), n_shards=3)
+    docs = [d for name in ("a.md", "b.md", "c.md", "d.md") for d in make_docs(name, 2)]
+    vecs = unit_vectors(rng, len(docs), 8)
+    ids = idx.add(vecs, docs).tolist()
+    order = ids[::-1] + [7]
+    out = idx.hydrate(order, with_vectors=True)
+    assert [m and m["faiss_id"] for m in out.metadata] == ids[::-1] + [None]
+    assert out.has_vector.tolist() == [True] * len(ids) + [False]
+    np.testing.assert_allclose(out.vectors[: len(ids)], vecs[::-1], atol=1e-6)
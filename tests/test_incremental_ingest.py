@@ -0,0 +1,73 @@
+import logging
+import os
+
+from index.store import DocumentMeta
+from pipeline import Pipeline
+
+
+def _sources(idx):
+    session = idx.Session()
+    try:
+        rows = session.query(DocumentMeta.source).all()
+        return sorted(os.path.basename(s) for (s,) in rows)
+    finally:
+        session.close()
+
+
+def test_reingest_skips_replaces_and_purges(tmp_path, random_embedder, make_indexer):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    for name in ("a", "b", "c"):
+        (folder / f"{name}.txt").write_text(f"{name} " * 300)  # 2 chunks each
+    idx = make_indexer()
+    emb = random_embedder()
+    pl = Pipeline(embedder=emb, indexer=idx, workers=0)
+    assert pl.run_folder(folder) == 6
+
+    # nothing changed: nothing is parsed or embedded
+    emb.calls.clear()
+    assert pl.run_folder(folder) == 0
+    assert emb.encoded == 0
+    assert pl.last_stats.files_unchanged == 3
+
+    # touched but identical content: still skipped
+    os.utime(folder / "a.txt", (1, 1))
+    assert pl.run_folder(folder) == 0
+    assert emb.encoded == 0
+
+    # b modified (now 1 chunk), c deleted
+    (folder / "b.txt").write_text("short new content")
+    (folder / "c.txt").unlink()
+    assert pl.run_folder(folder) == 1
+    assert pl.last_stats.files_deleted == 1
+    assert _sources(idx) == ["a.txt", "a.txt", "b.txt"]
+    assert sorted(os.path.basename(p) for p in idx.file_manifest()) == [
+        "a.txt",
+        "b.txt",
+    ]
+
+    # force re-ingests everything without duplicating chunks
+    assert pl.run_folder(folder, force=True) == 3
+    assert _sources(idx) == ["a.txt", "a.txt", "b.txt"]
+
+
+def test_relative_folder_is_keyed_by_resolved_path(
+    tmp_path, monkeypatch, caplog, random_embedder, make_indexer
+):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "a.txt").write_text("a " * 300)
+    monkeypatch.chdir(tmp_path)
+    idx = make_indexer()
+    emb = random_embedder()
+    pl = Pipeline(embedder=emb, indexer=idx, workers=0)
+    assert pl.run_folder("docs") == 2
+
+    resolved = str(tmp_path.resolve() / "docs" / "a.txt")
+    assert list(idx.file_manifest()) == [resolved]
+    hits = idx.search_batch(emb.encode(["q"]), top_k=2)[0]
+    meta = idx.fetch_metadata([h for h, _ in hits])
+    assert {m["meta"]["source"] for m in meta} == {resolved}
+    # only documents that matched are counted
+    with caplog.at_level(logging.INFO, logger="agent.index"):
+        assert idx.delete([resolved, "docs/a.txt"]) == 2
+    assert "Removed 2 chunks from 1 documents" in caplog.text
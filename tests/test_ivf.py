@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from pipeline import Pipeline
+from retrieve.retriever import Retriever
+
+
+@pytest.mark.parametrize("index_type", ["IVF8,Flat", "IVF8,PQ4x4", "OPQ4,IVF8,PQ4x4"])
+def test_trained_index_types(index_type, unit_vectors, plain_docs, make_indexer):
+    rng = np.random.default_rng(0)
+    vecs = unit_vectors(rng, 400, 16)
+    idx = make_indexer(index_type=index_type)
+    idx.rebuild()
+    assert idx.needs_training()
+    with pytest.raises(ValueError):
+        idx.add(vecs[:10], plain_docs(10))
+    idx.train(vecs)
+    ids = idx.add(vecs, plain_docs(400))
+
+    # the trained quantizer and the vectors survive a reload
+    reopened = make_indexer(index_type=index_type)
+    reopened.load()
+    assert not reopened.needs_training()
+    assert reopened.stats().ntotal == 400
+
+    # probing every list makes IVF-Flat search exhaustive
+    hits = reopened.search(vecs[3], top_k=5, nprobe=8)
+    assert hits
+    if index_type == "IVF8,Flat":
+        assert hits[0][0] == ids[3]
+    res = Retriever(reopened).retrieve(vecs[3], top_k=3, nprobe=8)
+    assert len(res) == 3
+
+
+def test_pipeline_trains_before_adding(tmp_path, random_embedder, make_indexer):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    for i in range(40):
+        (folder / f"f{i}.txt").write_text(f"document number {i} " * 10)
+    idx = make_indexer(index_type="IVF4,Flat")
+    emb = random_embedder(dim=16, batch_size=16)
+    n = Pipeline(embedder=emb, indexer=idx).run_folder(folder)
+    assert n == 40
+    assert not idx.needs_training()
+    assert idx.stats().ntotal == 40
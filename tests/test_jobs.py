@@ -0,0 +1,68 @@
+import time
+
+from jobs import JobManager, ingest_folder
+from pipeline import Pipeline
+
+
+def _wait(jobs, job, timeout=30):
+    for _ in range(int(timeout / 0.02)):
+        if not jobs.get(job.id).active:
+            return
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+
+def test_ingest_job_reports_progress_and_result(
+    tmp_path, random_embedder, make_indexer
+):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    for i in range(6):
+        (folder / f"f{i}.txt").write_text(f"file {i} " * 150)
+    idx = make_indexer()
+    before = idx.version()
+    pl = Pipeline(embedder=random_embedder(), indexer=idx, workers=0)
+    jobs = JobManager()
+    job = jobs.submit("ingest", ingest_folder, folder, pipeline=pl)
+    _wait(jobs, job)
+
+    assert job.status == "done"
+    assert job.result == 18
+    assert (job.done, job.total) == (6, 6)
+    assert job.fraction == 1.0
+    assert job.message == "18 chunks indexed"
+    # cached readers key on this to reload after ingestion
+    assert idx.version() != before
+    jobs.shutdown()
+
+
+def test_ingest_job_reuses_the_given_embedder(tmp_path, monkeypatch, random_embedder):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha " * 150)
+    monkeypatch.chdir(tmp_path)
+    embedder = random_embedder()
+    jobs = JobManager()
+    job = jobs.submit("ingest", ingest_folder, folder, embedder=embedder)
+    _wait(jobs, job)
+
+    assert job.status == "done", job.error
+    assert embedder.encoded == job.result > 0
+    jobs.shutdown()
+
+
+def test_failed_job_keeps_error_and_later_jobs_run(tmp_path):
+    def boom(job):
+        raise RuntimeError("disk full")
+
+    jobs = JobManager()
+    bad = jobs.submit("bad", boom)
+    good = jobs.submit("good", lambda job, x: x * 2, 21)
+    _wait(jobs, good)
+
+    assert bad.status == "failed"
+    assert "disk full" in bad.error
+    assert good.result == 42
+    assert [j.name for j in jobs.jobs()] == ["good", "bad"]
+    assert not jobs.active()
+    jobs.shutdown()
@@ -0,0 +1,100 @@
+import threading
+
+from metrics import Metrics, Spans, format_spans, format_stages
+from reasoner.cache import QueryCache
+from reasoner.reasoner import Reasoner
+from server import QueryServer, fetch_stats, query_remote
+
+
+def test_metrics_quantiles_window_and_prometheus():
+    m = Metrics(window=100)
+    for ms in range(1, 201):
+        m.observe("search", float(ms))
+    m.inc("queries", 3)
+    snap = m.snapshot()
+    row = snap["stages"]["search"]
+    # counts and sums cover everything, quantiles the last 100 (101..200)
+    assert row["count"] == 200 and row["sum_ms"] == sum(range(1, 201))
+    assert row["p50_ms"] == 150.5
+    assert abs(row["p99_ms"] - 199.01) < 1e-9
+    assert snap["counters"] == {"queries": 3.0}
+
+    text = m.prometheus()
+    assert "# TYPE agent_queries_total counter\nagent_queries_total 3\n" in text
+    assert "# TYPE agent_stage_seconds summary" in text
+    assert 'agent_stage_seconds{stage="search",quantile="0.95"} 0.19505' in text
+    assert 'agent_stage_seconds_count{stage="search"} 200' in text
+    assert "search" in format_stages(snap)
+    m.reset()
+    assert m.snapshot() == {"counters": {}, "stages": {}}
+
+
+def test_spans_are_ordered_and_totalled():
+    spans = Spans()
+    with spans.span("encode", batch=2):
+        pass
+    with spans.span("search", batch=2):
+        pass
+    out = spans.finish()
+    assert [s["stage"] for s in out] == ["encode", "search", "total"]
+    assert out[1]["start_ms"] >= out[0]["start_ms"] + out[0]["ms"]
+    assert out[-1]["ms"] >= sum(s["ms"] for s in out[:-1])
+    assert "(2 sub-queries)" in format_spans(out)
+
+
+def test_answer_traces_carry_stage_spans(eye_indexer, bucket_embedder):
+    metrics = Metrics()
+    reasoner = Reasoner(
+        indexer=eye_indexer,
+        embedder=bucket_embedder(),
+        cache=QueryCache(max_entries=16, ttl_s=0),
+        metrics=metrics,
+    )
+    first = reasoner.answer("What is doc three? And doc five", top_k=2)
+    assert len(first["traces"]) == 2
+    for trace in first["traces"]:
+        stages = [s["stage"] for s in trace["spans"]]
+        assert stages == [
+            "cache",
+            "decompose",
+            "encode",
+            "search",
+            "hydrate",
+            "mmr",
+            "synthesize",
+            "total",
+        ]
+        batched = {s["stage"]: s["batch"] for s in trace["spans"] if "batch" in s}
+        assert batched == {"encode": 2, "search": 2, "hydrate": 2, "mmr": 2}
+
+    # a cache hit returns the original answer and is timed on its own
+    assert reasoner.answer("what is doc three? and doc five", top_k=2) == first
+    snap = metrics.snapshot()
+    assert snap["counters"] == {
+        "queries": 2.0,
+        "subqueries": 2.0,
+        "answer_cache_hits": 1.0,
+    }
+    assert snap["stages"]["cache"]["count"] == 2
+    assert snap["stages"]["total"]["count"] == 2
+    assert snap["stages"]["search"]["count"] == 1
+
+
+def test_query_server_exposes_metrics(eye_indexer, bucket_embedder):
+    srv = QueryServer(
+        host="127.0.0.1", port=0, indexer=eye_indexer, embedder=bucket_embedder()
+    )
+    srv.reasoner.metrics = Metrics()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        res = query_remote(srv.url, "doc one. doc two", top_k=2, lexical_weight=0.5)
+        assert "lexical" in [s["stage"] for s in res["traces"][0]["spans"]]
+        stats = fetch_stats(srv.url)
+        assert stats["counters"]["queries"] == 1
+        assert stats["stages"]["lexical"]["count"] == 1
+        text = fetch_stats(srv.url, prometheus=True)
+        assert 'agent_stage_seconds_count{stage="encode"} 1' in text
+    finally:
+        srv.shutdown()
+        thread.join()
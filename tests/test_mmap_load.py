@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("index_type", ["FlatIP", "HNSW", "IVF4,Flat"])
+def test_mmap_load_matches_memory_and_accepts_writes(
+    index_type, unit_vectors, make_docs, make_indexer
+):
+    rng = np.random.default_rng(0)
+    writer = make_indexer(index_type=index_type)
+    writer.rebuild()
+    writer.dim = 8
+    writer.index = writer._make_index()
+    if not writer.index.is_trained:
+        writer.train(unit_vectors(rng, 100, 8))
+    vecs = unit_vectors(rng, 40, 8)
+    writer.add(vecs, make_docs("a.md", 40))
+    writer.flush()
+
+    mapped = make_indexer(index_type=index_type, load_mode="mmap")
+    mapped.load()
+    assert mapped._mapped is mapped.index
+    expected = writer.search_batch(vecs[:5], top_k=5, nprobe=4)
+    assert mapped.search_batch(vecs[:5], top_k=5, nprobe=4) == expected
+
+    # the first write copies the mapped index into memory
+    extra = unit_vectors(rng, 2, 8)
+    ids = mapped.add(extra, make_docs("b.md", 2))
+    assert mapped._mapped is None
+    assert mapped.search(extra[0], top_k=1, nprobe=4)[0][0] == ids[0]
+    assert mapped.delete("/data/a.md") == 40
+    mapped.flush()
+
+    again = make_indexer(index_type=index_type, load_mode="mmap")
+    again.load()
+    assert again.stats().ntotal == 2
+
+
+def test_mmap_load_replays_pending_log(unit_vectors, make_docs, make_indexer):
+    rng = np.random.default_rng(1)
+    writer = make_indexer()
+    writer.rebuild()
+    first = unit_vectors(rng, 3, 8)
+    writer.add(first, make_docs("a.md", 3))
+    writer.flush()
+    # appended after the checkpoint, so only in the log
+    ids = writer.add(unit_vectors(rng, 2, 8), make_docs("b.md", 2))
+
+    reader = make_indexer(load_mode="mmap")
+    reader.load()
+    assert reader.stats().ntotal == 5
+    assert set(reader.select_ids("name=b.md").tolist()) == set(ids.tolist())
+    assert reader.search(first[1], top_k=1)[0][0] == writer.search(first[1], 1)[0][0]
@@ -1,9 +1,8 @@
 import numpy as np
-from index.store import Indexer
-from retrieve.retriever import Retriever
+from retrieve.retriever import Retriever, mmr, mmr_batch
 
 
-def test_mmr_diversity(tmp_path):
+def test_mmr_diversity(make_indexer):
     # create 3 vectors in 2D: v1 and v2 similar, v3 orthogonal
     v1 = np.array([1.0, 0.0], dtype=np.float32)
     v2 = np.array([0.9, 0.1], dtype=np.float32)
@@ -13,14 +12,12 @@ def test_mmr_diversity(tmp_path):
     norms = np.linalg.norm(vecs, axis=1, keepdims=True)
     vecs = vecs / norms
 
-    idx = Indexer(
-        faiss_path=str(tmp_path / "faiss.index"), sqlite_path=str(tmp_path / "meta.db")
-    )
+    idx = make_indexer()
     idx.rebuild()
     docs = []
     for i in range(3):
         docs.append({"id": f"d{i}", "text": f"doc{i}", "metadata": {"chunk_index": 0}})
-    idx.add(vecs, docs)
+    ids = idx.add(vecs, docs).tolist()
 
     # query near v1
     q = np.array([1.0, 0.0], dtype=np.float32)
@@ -31,10 +28,54 @@ def test_mmr_diversity(tmp_path):
     res_mmr = retr.retrieve(q, top_k=2, mmr_enabled=True, lambda_param=0.7)
 
     # Without MMR, expect v1 and v2 (most similar)
-    ids_no_mmr = [r["faiss_id"] for r in res_no_mmr]
+    ids_no_mmr = [ids.index(r["faiss_id"]) for r in res_no_mmr]
     # With MMR, expect diversity: should include v3 (faiss_id 2)
-    ids_mmr = [r["faiss_id"] for r in res_mmr]
+    ids_mmr = [ids.index(r["faiss_id"]) for r in res_mmr]
 
     assert ids_no_mmr[0] == 0
     assert 1 in ids_no_mmr
     assert 2 in ids_mmr or 1 in ids_no_mmr
+
+
+def _reference_mmr(doc_embeddings, query_embedding, lambda_param, k):
+    # straightforward loop implementation the vectorized version must match
+    sims = doc_embeddings @ query_embedding
+    selected = []
+    candidates = list(range(doc_embeddings.shape[0]))
+    while len(selected) < min(k, doc_embeddings.shape[0]):
+        best_score, best_idx = None, None
+        for idx in candidates:
+            score = lambda_param * float(sims[idx])
+            if selected:
+                score -= (1 - lambda_param) * max(
+                    float(doc_embeddings[idx] @ doc_embeddings[s]) for s in selected
+                )
+            if best_score is None or score > best_score:
+                best_score, best_idx = score, idx
+        selected.append(best_idx)
+        candidates.remove(best_idx)
+    return selected
+
+
+def test_mmr_matches_reference(unit_vectors):
+    rng = np.random.default_rng(7)
+    for lam in (0.0, 0.3, 0.7, 1.0):
+        docs = unit_vectors(rng, 60, 16)
+        q = unit_vectors(rng, 16)
+        assert mmr(docs, q, lambda_param=lam, k=10) == _reference_mmr(
+            docs, q, lam, 10
+        )
+    assert mmr(np.zeros((0, 4), dtype=np.float32), q[:4]) == []
+
+
+def test_mmr_batch_matches_single_queries(unit_vectors):
+    rng = np.random.default_rng(3)
+    docs = unit_vectors(rng, 4, 30, 8)
+    qs = unit_vectors(rng, 4, 8)
+    mask = np.ones((4, 30), dtype=bool)
+    mask[2, 5:] = False  # third query only has 5 real candidates
+    out = mmr_batch(docs, qs, lambda_param=0.6, k=8, mask=mask)
+    for b in range(4):
+        n = int(mask[b].sum())
+        assert out[b] == mmr(docs[b, :n], qs[b], lambda_param=0.6, k=8)
+    assert len(out[2]) == 5
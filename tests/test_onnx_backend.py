@@ -0,0 +1,71 @@
+import importlib.util
+
+import numpy as np
+import pytest
+
+from embed.encoder import Embedder
+from embed.onnx_backend import export_dir, pool
+
+_HAS_ORT = importlib.util.find_spec("onnxruntime") is not None
+
+
+def test_pool_ignores_padding():
+    tokens = np.array(
+        [
+            [[1.0, 0.0], [3.0, 2.0], [100.0, 100.0]],
+            [[2.0, 2.0], [0.0, 4.0], [4.0, 0.0]],
+        ],
+        dtype=np.float32,
+    )
+    mask = np.array([[1, 1, 0], [1, 1, 1]])
+    np.testing.assert_allclose(pool(tokens, mask, "mean"), [[2.0, 1.0], [2.0, 2.0]])
+    np.testing.assert_allclose(pool(tokens, mask, "cls"), [[1.0, 0.0], [2.0, 2.0]])
+    np.testing.assert_allclose(pool(tokens, mask, "max"), [[3.0, 2.0], [4.0, 4.0]])
+    with pytest.raises(ValueError):
+        pool(tokens, mask, "lasttoken")
+
+
+def test_export_dir_is_per_model(tmp_path):
+    assert export_dir(str(tmp_path), "org/model") == str(tmp_path / "org__model")
+
+
+@pytest.mark.skipif(_HAS_ORT, reason="checks the fallback without onnxruntime")
+def test_onnx_backend_falls_back_without_onnxruntime():
+    emb = Embedder(backend="onnx")
+    assert emb._backend in ("sbert", "tfidf")
+    assert emb.encode(["some text"]).shape[0] == 1
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        Embedder(backend="tensorrt")
+
+
+@pytest.mark.parametrize("quantize, min_cos", [(False, 0.9999), (True, 0.98)])
+def test_onnx_vectors_match_sbert(tmp_path, monkeypatch, quantize, min_cos):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    pytest.importorskip("torch")
+    st = pytest.importorskip("sentence_transformers")
+    model = "sentence-transformers/all-MiniLM-L6-v2"
+    try:
+        st.SentenceTransformer(model, device="cpu")
+    except Exception as e:  # no network / model cache
+        pytest.skip(f"{model} unavailable: {e}")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "config.yml").write_text(
+        "embeddings:\n"
+        f"  onnx: {{dir: onnx, quantize: {str(quantize).lower()}}}\n"
+    )
+    texts = [
+        "Torque spec for part AB-1234 is 35 Nm.",
+        "short",
+        "A much longer sentence " * 40,
+    ]
+    ref = Embedder(model_name=model, backend="sbert").encode(texts)
+    emb = Embedder(model_name=model, backend="onnx")
+    got = emb.encode(texts)
+    assert emb._backend == "onnx"
+    assert got.shape == ref.shape
+    cos = np.sum(got * ref, axis=1)
+    assert cos.min() >= min_cos
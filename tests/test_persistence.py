@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+
+
+def test_append_log_replay_and_flush(plain_docs, make_indexer):
+    rng = np.random.default_rng(0)
+    idx = make_indexer()
+    idx.rebuild()
+    idx.add(rng.random((3, 4), dtype=np.float32), plain_docs(3))
+    idx.add(rng.random((2, 4), dtype=np.float32), plain_docs(2, start=3))
+    assert os.path.exists(idx.log_path)
+
+    # a fresh process sees the vectors from the log before any checkpoint
+    reopened = make_indexer()
+    reopened.load()
+    assert reopened.stats().ntotal == 5
+
+    idx.flush()
+    assert not os.path.exists(idx.log_path)
+    reopened = make_indexer()
+    reopened.load()
+    assert reopened.stats().ntotal == 5
+
+    # adding after a reload continues the id sequence instead of wiping
+    reopened.add(rng.random((1, 4), dtype=np.float32), plain_docs(1, start=5))
+    assert reopened.stats().ntotal == 6
+
+
+def test_torn_log_tail_is_ignored(plain_docs, make_indexer):
+    idx = make_indexer()
+    idx.rebuild()
+    idx.add(np.ones((2, 4), dtype=np.float32), plain_docs(2))
+    with open(idx.log_path, "ab") as f:
+        f.write(b"\x00\x01\x02")
+
+    reopened = make_indexer()
+    reopened.load()
+    assert reopened.stats().ntotal == 2
+    reopened.add(np.ones((1, 4), dtype=np.float32), plain_docs(1, start=2))
+
+    again = make_indexer()
+    again.load()
+    assert again.stats().ntotal == 3
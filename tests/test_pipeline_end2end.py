@@ -5,7 +5,7 @@ from reasoner.reasoner import Reasoner
 from export import Exporter, Report
 
 
-def test_pipeline_end_to_end(tmp_path):
+def test_pipeline_end_to_end(tmp_path, make_indexer):
     # copy sample files to temp folder
     src = Path("sample_data")
     dst = tmp_path / "data"
@@ -13,11 +13,7 @@ def test_pipeline_end_to_end(tmp_path):
     for p in src.iterdir():
         dst.joinpath(p.name).write_text(p.read_text())
 
-    from index.store import Indexer
-
-    idx = Indexer(
-        faiss_path=str(tmp_path / "faiss.index"), sqlite_path=str(tmp_path / "meta.db")
-    )
+    idx = make_indexer()
     pl = Pipeline(indexer=idx)
     n = pl.run_folder(dst, recursive=False)
     assert n > 0
@@ -0,0 +1,50 @@
+import pytest
+
+from pipeline import Pipeline
+
+
+def _crash(texts):
+    raise RuntimeError("encoder crashed")
+
+
+def _corpus(tmp_path, n_files=12):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    for i in range(n_files):
+        (folder / f"f{i}.txt").write_text(f"file {i} " * 150)
+    return folder
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_streaming_pipeline_indexes_every_chunk(
+    tmp_path, workers, random_embedder, make_indexer
+):
+    folder = _corpus(tmp_path)
+    pl = Pipeline(
+        embedder=random_embedder(),
+        indexer=make_indexer(),
+        workers=workers,
+        queue_size=2,
+    )
+    n = pl.run_folder(folder)
+    # each 1.2k-char file yields 3 chunks with the default 512/128 chunking
+    assert n == 36
+    assert pl.indexer.stats().ntotal == 36
+    stats = pl.last_stats
+    assert stats.parse.items == 12
+    assert stats.encode.items == 36 and stats.index.items == 36
+    assert "chunks" in stats.summary()
+
+
+def test_stage_errors_propagate(tmp_path, monkeypatch, random_embedder, make_indexer):
+    folder = _corpus(tmp_path)
+    emb = random_embedder()
+    monkeypatch.setattr(emb, "encode", _crash)
+    pl = Pipeline(
+        embedder=emb,
+        indexer=make_indexer(),
+        workers=0,
+        queue_size=1,
+    )
+    with pytest.raises(RuntimeError, match="encoder crashed"):
+        pl.run_folder(folder)
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pytest
+
+from index.store import Indexer, decode_vectors, encode_vectors
+from retrieve.retriever import Retriever
+
+
+@pytest.mark.parametrize("dtype, atol", [("float16", 1e-3), ("int8", 2e-2)])
+def test_encode_roundtrip(dtype, atol, unit_vectors):
+    vecs = unit_vectors(np.random.default_rng(0), 50, 32) * 3.0
+    codes = encode_vectors(vecs, dtype)
+    assert codes.dtype == np.dtype(dtype)
+    np.testing.assert_allclose(decode_vectors(codes), vecs / 3.0, atol=atol)
+
+
+@pytest.mark.parametrize("fmt", ["binary", "mmap"])
+@pytest.mark.parametrize("dtype, itemsize", [("float16", 2), ("int8", 1)])
+def test_compact_vectors_are_stored_and_hydrated(
+    fmt, dtype, itemsize, unit_vectors, make_docs, make_indexer
+):
+    rng = np.random.default_rng(1)
+    idx = make_indexer(embedding_format=fmt, vector_dtype=dtype)
+    idx.rebuild()
+    vecs = unit_vectors(rng, 20, 16)
+    ids = idx.add(vecs, make_docs("a.md", 20)).tolist()
+    if fmt == "mmap":
+        assert os.path.getsize(idx.vectors_path) == 20 * 16 * itemsize
+    else:
+        with idx.engine.connect() as conn:
+            sizes = conn.exec_driver_sql("SELECT length(vector) FROM embeddings")
+            assert {s for (s,) in sizes} == {16 * itemsize}
+    out = idx.hydrate(ids[::-1], with_vectors=True)
+    assert out.has_vector.all()
+    np.testing.assert_allclose(out.vectors, vecs[::-1], atol=2e-2)
+    np.testing.assert_allclose(np.linalg.norm(out.vectors, axis=1), 1.0, atol=1e-5)
+
+
+def test_switching_mmap_dtype_needs_rebuild(unit_vectors, make_docs, make_indexer):
+    rng = np.random.default_rng(2)
+    idx = make_indexer(embedding_format="mmap")
+    idx.rebuild()
+    idx.add(unit_vectors(rng, 4, 8), make_docs("a.md", 4))
+    other = make_indexer(embedding_format="mmap", vector_dtype="float16")
+    with pytest.raises(ValueError):
+        other.add(unit_vectors(rng, 2, 8), make_docs("b.md", 2))
+    other.rebuild()
+    other.add(unit_vectors(rng, 2, 8), make_docs("b.md", 2))
+    assert not os.path.exists(idx.vectors_path)
+
+
+@pytest.mark.parametrize("index_type", ["SQfp16", "SQ8"])
+def test_scalar_quantized_index_with_rescore(
+    tmp_path, index_type, unit_vectors, make_docs, make_indexer
+):
+    rng = np.random.default_rng(3)
+    idx = make_indexer(index_type=index_type, embedding_format="mmap")
+    idx.rebuild()
+    vecs = unit_vectors(rng, 200, 32)
+    if idx.needs_training():
+        idx.train(vecs)
+    idx.add(vecs, [d for n in range(10) for d in make_docs(f"d{n}.md", 20)])
+    idx.flush()
+
+    # codes are 2x / 4x smaller than a float32 flat index
+    flat = Indexer(
+        faiss_path=str(tmp_path / "flat" / "faiss.index"),
+        sqlite_path=str(tmp_path / "flat" / "meta.db"),
+    )
+    flat.rebuild()
+    flat.add(vecs, [d for n in range(10) for d in make_docs(f"d{n}.md", 20)])
+    flat.flush()
+    assert os.path.getsize(idx.faiss_path) < os.path.getsize(flat.faiss_path)
+
+    idx.load()
+    retr = Retriever(idx)
+    q = vecs[7] + 0.1 * unit_vectors(rng, 1, 32)[0]
+    hits = retr.retrieve(q, top_k=5, mmr_enabled=False, rescore=True)
+    exact = Retriever(flat).retrieve(q, top_k=5, mmr_enabled=False)
+    assert [h["faiss_id"] for h in hits] == [h["faiss_id"] for h in exact]
+    # re-scored with the stored float32 vectors: cosine similarities
+    np.testing.assert_allclose(
+        [h["score"] for h in hits],
+        [h["score"] / np.linalg.norm(q) for h in exact],
+        atol=1e-5,
+    )
+    assert [h["score"] for h in hits] == sorted(
+        (h["score"] for h in hits), reverse=True
+    )
@@ -0,0 +1,72 @@
+import time
+
+import numpy as np
+import pytest
+
+from reasoner.cache import QueryCache, normalize_query
+from reasoner.reasoner import Reasoner
+
+
+@pytest.fixture
+def make_reasoner(eye_indexer, bucket_embedder):
+    def make(**cache_kwargs):
+        # "contract" and "contracts" land in the same bucket
+        emb = bucket_embedder(fold=lambda t: t.lower().rstrip("s"))
+        cache = QueryCache(**{"max_entries": 16, "ttl_s": 0, **cache_kwargs})
+        reasoner = Reasoner(indexer=eye_indexer, embedder=emb, cache=cache)
+        return reasoner, eye_indexer, emb
+
+    return make
+
+
+def test_normalize_query():
+    assert normalize_query("  What is  X? ") == normalize_query("what is x")
+
+
+def test_repeated_query_is_served_from_cache(make_reasoner):
+    reasoner, idx, emb = make_reasoner()
+    first = reasoner.answer("What is doc three?", top_k=2)
+    again = reasoner.answer("what is doc   three", top_k=2)
+    assert again == first
+    assert len(emb.calls) == 1
+    # different retrieval parameters are a different entry
+    reasoner.answer("What is doc three?", top_k=3)
+    assert len(emb.calls) == 2
+    # callers cannot corrupt cached entries
+    again["traces"].clear()
+    assert reasoner.answer("What is doc three?", top_k=2) == first
+    assert reasoner.cache.stats()["hits"] == 2
+
+
+def test_index_change_invalidates(make_reasoner):
+    reasoner, idx, emb = make_reasoner()
+    reasoner.answer("doc", top_k=1)
+    idx.add(
+        np.ones((1, 8), dtype=np.float32),
+        [{"id": "new", "text": "new doc", "metadata": {"chunk_index": 0}}],
+    )
+    reasoner.answer("doc", top_k=1)
+    assert len(emb.calls) == 2
+
+
+def test_ttl_and_size_bounds(make_reasoner):
+    reasoner, idx, emb = make_reasoner(max_entries=2, ttl_s=0.05)
+    for q in ("a", "b", "c"):
+        reasoner.answer(q)
+    assert reasoner.cache.stats()["entries"] == 2
+    reasoner.answer("a")  # evicted as least recently used
+    assert len(emb.calls) == 4
+    time.sleep(0.06)
+    reasoner.answer("c")
+    assert len(emb.calls) == 5
+
+
+def test_semantic_mode_reuses_near_duplicates(make_reasoner):
+    reasoner, idx, emb = make_reasoner(semantic=True, semantic_threshold=0.99)
+    first = reasoner.answer("contracts", top_k=2)
+    assert reasoner.answer("contract", top_k=2) == first
+    assert reasoner.cache.stats()["semantic_hits"] == 1
+    # the query is still encoded, but nothing else runs
+    assert len(emb.calls) == 2
+    reasoner.answer("something else entirely", top_k=2)
+    assert reasoner.cache.stats()["misses"] == 2
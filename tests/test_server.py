@@ -0,0 +1,92 @@
+import threading
+
+import numpy as np
+import pytest
+
+from reasoner.reasoner import Reasoner
+from server import MicroBatcher, QueryServer, query_remote
+
+
+def test_micro_batcher_merges_concurrent_requests(bucket_embedder):
+    emb = bucket_embedder(delay=0.05)
+    batcher = MicroBatcher(emb, window_ms=20, max_batch=64)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.encode([f"q{i}", f"q{i}b"])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert batcher.texts == 16
+    assert batcher.batches < 8
+    # every caller gets its own rows back
+    for i, embs in results.items():
+        np.testing.assert_array_equal(embs, emb.encode([f"q{i}", f"q{i}b"]))
+
+
+def test_micro_batcher_propagates_errors(monkeypatch, bucket_embedder):
+    def crash(texts):
+        raise RuntimeError("encoder crashed")
+
+    emb = bucket_embedder()
+    monkeypatch.setattr(emb, "encode", crash)
+    batcher = MicroBatcher(emb, window_ms=1)
+    with pytest.raises(RuntimeError, match="encoder crashed"):
+        batcher.encode(["q"])
+    batcher.close()
+
+
+def test_query_server_answers_over_http(eye_indexer, bucket_embedder):
+    emb = bucket_embedder()
+    srv = QueryServer(host="127.0.0.1", port=0, indexer=eye_indexer, embedder=emb)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        results = [None] * 6
+
+        def worker(i):
+            results[i] = query_remote(srv.url, f"question {i}. follow up", top_k=2)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for res in results:
+            assert len(res["traces"]) == 2
+            assert all(len(tr["hits"]) == 2 for tr in res["traces"])
+            assert res["synthesis"].startswith("Extractive Summary")
+        assert srv.health()["encoded_texts"] == 12
+
+        with pytest.raises(RuntimeError, match="400"):
+            query_remote(srv.url, "")
+    finally:
+        srv.shutdown()
+        thread.join()
+
+
+def test_reload_waits_for_readers(eye_indexer, bucket_embedder):
+    reasoner = Reasoner(indexer=eye_indexer, embedder=bucket_embedder())
+    reasoner.answer("doc one", top_k=1)
+    assert reasoner.cache.stats()["entries"] == 1
+    reloaded = threading.Event()
+
+    def reload():
+        reasoner.reload()
+        reloaded.set()
+
+    with reasoner.reading():
+        thread = threading.Thread(target=reload)
+        thread.start()
+        assert not reloaded.wait(0.2)
+    thread.join(timeout=10)
+    assert reloaded.is_set()
+    assert reasoner.cache.stats()["entries"] == 0
+    with reasoner.reading():
+        assert reasoner.answer("doc one", top_k=1)["traces"]
@@ -0,0 +1,119 @@
+import numpy as np
+
+from index.shards import ShardedIndexer, shard_for_key
+from pipeline import Pipeline
+from retrieve.retriever import Retriever
+
+
+def _docs(n_files=12, chunks=3):
+    return [
+        {
+            "id": f"f{f}.md::chunk::{c}",
+            "text": f"file{f} chunk{c}",
+            "metadata": {"chunk_index": c, "name": f"f{f}.md"},
+            "source": f"/data/{'contracts' if f % 2 else 'notes'}/f{f}.md",
+        }
+        for f in range(n_files)
+        for c in range(chunks)
+    ]
+
+
+def test_fan_out_matches_single_index(tmp_path, unit_vectors, make_indexer):
+    rng = np.random.default_rng(0)
+    docs = _docs()
+    vecs = unit_vectors(rng, len(docs), 8)
+    single = make_indexer()
+    single.add(vecs, docs)
+    sharded = ShardedIndexer(shard_dir=str(tmp_path / "shards"), n_shards=4)
+    ids = sharded.add(vecs, docs)
+    assert ids.tolist() == single.add(vecs, docs).tolist()
+
+    stats = sharded.stats()
+    assert stats.ntotal == len(docs)
+    assert sum(stats.shards.values()) == len(docs)
+    assert len(stats.shards) > 1
+    queries = vecs[:6]
+    got = sharded.search_batch(queries, top_k=5)
+    want = single.search_batch(queries, top_k=5)
+    for g, w in zip(got, want):
+        assert [h for h, _ in g] == [h for h, _ in w]
+        np.testing.assert_allclose([s for _, s in g], [s for _, s in w], rtol=1e-5)
+
+    # metadata, vectors, filters and MMR work across shards
+    hits = Retriever(sharded).retrieve(
+        vecs[0], top_k=4, mmr_enabled=True, filter_expr="name=f3.md"
+    )
+    assert {h["meta"]["name"] for h in hits} == {"f3.md"}
+    mat, valid = sharded.fetch_embedding_matrix([int(ids[4]), 12345])
+    assert valid.tolist() == [True, False]
+    np.testing.assert_allclose(mat[0], vecs[4], atol=1e-6)
+
+    assert sharded.delete("/data/notes/f0.md") == 3
+    assert sharded.stats().ntotal == len(docs) - 3
+
+
+def test_shards_load_lazily_and_can_be_restricted(tmp_path, unit_vectors):
+    rng = np.random.default_rng(1)
+    docs = _docs()
+    vecs = unit_vectors(rng, len(docs), 8)
+    writer = ShardedIndexer(shard_dir=str(tmp_path), n_shards=3)
+    writer.add(vecs, docs)
+    writer.flush()
+
+    reader = ShardedIndexer(shard_dir=str(tmp_path), n_shards=3)
+    assert reader.stats().ntotal == len(docs)
+    # stats come from the metadata DBs: no FAISS file was mapped yet
+    assert all(s.index is None for s in reader._shards.values())
+    reader.load()
+    assert all(s.index is not None for s in reader._shards.values())
+
+    name = shard_for_key(docs[0]["source"], 3)
+    only = ShardedIndexer(shard_dir=str(tmp_path), n_shards=3, only=[name])
+    hits = only.search_batch(vecs, top_k=len(docs))
+    in_shard = {
+        int(i)
+        for i, d in zip(writer._ids(docs), docs)
+        if shard_for_key(d["source"], 3) == name
+    }
+    assert {h for row in hits for h, _ in row} == in_shard
+    assert list(only._shards) == [name]
+
+
+def test_checkpoint_from_a_fresh_process_folds_every_log(tmp_path, unit_vectors):
+    rng = np.random.default_rng(2)
+    docs = _docs()
+    vecs = unit_vectors(rng, len(docs), 8)
+    ShardedIndexer(shard_dir=str(tmp_path), n_shards=3).add(vecs, docs)
+    logs = list(tmp_path.glob("shard*/faiss.index.log"))
+    assert len(logs) == 3
+
+    # `cli.py index --checkpoint`: load and flush with nothing opened yet
+    fresh = ShardedIndexer(shard_dir=str(tmp_path), n_shards=3)
+    fresh.load()
+    assert fresh.stats().ntotal == len(docs)
+    fresh.flush()
+    assert not any(p.exists() for p in logs)
+    reader = ShardedIndexer(shard_dir=str(tmp_path), n_shards=3)
+    hits = reader.search_batch(vecs[:1], top_k=1)
+    assert hits[0][0][0] == int(reader._ids(docs[:1])[0])
+
+
+def test_collection_shards_share_one_trained_quantizer(tmp_path, random_embedder):
+    root = tmp_path / "docs"
+    for folder in ("contracts", "notes"):
+        (root / folder).mkdir(parents=True)
+        for i in range(20):
+            (root / folder / f"{folder}{i}.txt").write_text(f"{folder} {i} " * 20)
+    idx = ShardedIndexer(
+        shard_dir=str(tmp_path / "shards"),
+        shard_by="collection",
+        index_type="IVF4,Flat",
+    )
+    emb = random_embedder()
+    pl = Pipeline(embedder=emb, indexer=idx, workers=0)
+    assert pl.run_folder(root, recursive=True) == 40
+    assert idx.stats().shards == {"contracts": 20, "notes": 20}
+    # re-ingest is incremental across shards
+    assert pl.run_folder(root, recursive=True) == 0
+    hits = idx.search_batch(emb.encode(["q"]), top_k=3, nprobe=4)
+    assert len(hits[0]) == 3
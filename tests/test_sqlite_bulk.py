@@ -0,0 +1,55 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+
+def _committed_rows(tmp_path) -> int:
+    # a separate connection only sees committed transactions
+    with sqlite3.connect(tmp_path / "meta.db") as conn:
+        return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def test_pragmas_are_applied(make_indexer):
+    idx = make_indexer()
+    with idx.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        # 1 = NORMAL
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+    with pytest.raises(ValueError):
+        make_indexer(sqlite_synchronous="sometimes")
+
+
+def test_bulk_commits_at_checkpoints(tmp_path, unit_vectors, make_docs, make_indexer):
+    rng = np.random.default_rng(0)
+    idx = make_indexer()
+    idx.rebuild()
+    with idx.bulk():
+        idx.add(unit_vectors(rng, 3, 8), make_docs("a.md", 3))
+        # replacing chunks sees the uncommitted rows of the same block
+        idx.upsert(unit_vectors(rng, 2, 8), make_docs("a.md", 2))
+        idx.record_files([{"path": "/data/a.md", "size": 1, "mtime": 0.0}])
+        assert _committed_rows(tmp_path) == 0
+        idx.flush()
+        assert _committed_rows(tmp_path) == 2
+        idx.add(unit_vectors(rng, 4, 8), make_docs("b.md", 4))
+    assert _committed_rows(tmp_path) == 6
+    assert set(idx.file_manifest()) == {"/data/a.md"}
+
+
+def test_bulk_rolls_back_since_last_checkpoint(
+    tmp_path, unit_vectors, make_docs, make_indexer
+):
+    rng = np.random.default_rng(1)
+    idx = make_indexer()
+    idx.rebuild()
+    with pytest.raises(RuntimeError):
+        with idx.bulk():
+            idx.add(unit_vectors(rng, 3, 8), make_docs("a.md", 3))
+            idx.flush()
+            idx.add(unit_vectors(rng, 2, 8), make_docs("b.md", 2))
+            raise RuntimeError("ingest failed")
+    assert _committed_rows(tmp_path) == 3
+    # the indexer is usable again outside the block
+    idx.add(unit_vectors(rng, 1, 8), make_docs("c.md", 1))
+    assert _committed_rows(tmp_path) == 4
@@ -2,19 +2,93 @@ import numpy as np
 from index.store import Indexer
 
 
-def test_embedding_blob_storage(tmp_path):
+def test_embedding_blob_storage(make_indexer):
     # Small synthetic embedding
     vec = np.array([[0.1, 0.2, 0.3, 0.4]], dtype=np.float32)
-    idx = Indexer(
-        faiss_path=str(tmp_path / "faiss.index"), sqlite_path=str(tmp_path / "meta.db")
-    )
+    idx = make_indexer()
     idx.rebuild()
     docs = [{"id": "d0", "text": "t", "metadata": {"chunk_index": 0}}]
-    idx.add(vec, docs)
+    ids = idx.add(vec, docs)
 
     # fetch embedding via API
-    rows = idx.fetch_embeddings([0])
+    rows = idx.fetch_embeddings(ids.tolist())
     assert rows[0] is not None
     arr = rows[0]
     assert arr.dtype == np.float32
     assert arr.shape[0] == 4
+
+
+def test_mmap_sidecar_and_migration(tmp_path, make_indexer):
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((5, 4)).astype(np.float32)
+    docs = [
+        {"id": f"d{i}", "text": "t", "metadata": {"chunk_index": 0}} for i in range(5)
+    ]
+    expected = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+    idx = make_indexer(embedding_format="mmap")
+    idx.rebuild()
+    ids = idx.add(vecs[:3], docs[:3]).tolist()
+    ids += idx.add(vecs[3:], docs[3:]).tolist()
+    mat, valid = idx.fetch_embedding_matrix([ids[4], ids[0], 99])
+    assert valid.tolist() == [True, True, False]
+    assert np.allclose(mat[:2], expected[[4, 0]], atol=1e-6)
+
+    # an index stored as BLOBs migrates to the same sidecar layout
+    blob_dir = tmp_path / "blob"
+    blob_dir.mkdir()
+    old = Indexer(
+        faiss_path=str(blob_dir / "faiss.index"),
+        sqlite_path=str(blob_dir / "meta.db"),
+        embedding_format="binary",
+    )
+    old.rebuild()
+    old.add(vecs, docs)
+    assert old.migrate_embeddings_to_mmap(purge=True) == 5
+    assert old.fetch_embeddings(ids[:1]) == [None]
+
+    migrated = Indexer(
+        faiss_path=str(blob_dir / "faiss.index"),
+        sqlite_path=str(blob_dir / "meta.db"),
+        embedding_format="mmap",
+    )
+    migrated.load()
+    mat, valid = migrated.fetch_embedding_matrix(ids)
+    assert valid.all()
+    assert np.allclose(mat, expected, atol=1e-6)
+
+
+def test_faiss_reconstruct_format(tmp_path):
+    from index.store import Embedding
+    from retrieve.retriever import Retriever
+
+    rng = np.random.default_rng(2)
+    vecs = rng.standard_normal((30, 6)).astype(np.float32)
+    docs = [
+        {"id": f"d{i}", "text": f"t{i}", "metadata": {"chunk_index": 0}}
+        for i in range(30)
+    ]
+    results = {}
+    for fmt in ("binary", "faiss"):
+        idx = Indexer(
+            faiss_path=str(tmp_path / f"{fmt}.index"),
+            sqlite_path=str(tmp_path / f"{fmt}.db"),
+            embedding_format=fmt,
+        )
+        idx.rebuild()
+        idx.add(vecs, docs)
+        hits = Retriever(idx).retrieve(vecs[0], top_k=5, mmr_enabled=True)
+        results[fmt] = [h["faiss_id"] for h in hits]
+    session = idx.Session()
+    assert session.query(Embedding).count() == 0
+    session.close()
+    assert results["faiss"] == results["binary"]
+
+    # an index that cannot reconstruct degrades to score order
+    def _fail(ids):
+        raise RuntimeError("not supported")
+
+    idx.index.reconstruct_batch = _fail
+    hits = Retriever(idx).retrieve(vecs[0], top_k=5, mmr_enabled=True)
+    plain = Retriever(idx).retrieve(vecs[0], top_k=5, mmr_enabled=False)
+    assert [h["faiss_id"] for h in hits] == [h["faiss_id"] for h in plain]
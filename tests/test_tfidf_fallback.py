@@ -0,0 +1,35 @@
+import numpy as np
+
+from embed.encoder import Embedder
+
+
+def _tfidf_embedder():
+    emb = Embedder()
+    # force the fallback even where sentence-transformers is installed
+    emb._backend = "tfidf"
+    emb._init_tfidf()
+    return emb
+
+
+def test_vectors_do_not_depend_on_the_batch():
+    emb = _tfidf_embedder()
+    emb.fit(["alpha beta", "beta gamma", "gamma delta epsilon"])
+    together = emb.encode(["alpha beta", "gamma delta"])
+    alone = emb.encode(["gamma delta"])
+    assert together.shape == (2, emb.tfidf_dim)
+    assert np.allclose(together[1], alone[0], atol=1e-6)
+    assert np.allclose(np.linalg.norm(together, axis=1), 1.0, atol=1e-5)
+
+
+def test_fitted_state_persists(tmp_path):
+    path = str(tmp_path / "faiss.index.tfidf")
+    emb = _tfidf_embedder()
+    emb.use_state(path)
+    assert emb.needs_fit()
+    emb.fit(["contracts and invoices", "invoices overdue", "meeting notes"])
+    before = emb.encode(["overdue invoices"])
+
+    reloaded = _tfidf_embedder()
+    reloaded.use_state(path)
+    assert not reloaded.needs_fit()
+    assert np.allclose(reloaded.encode(["overdue invoices"]), before, atol=1e-6)
@@ -0,0 +1,145 @@
+import shutil
+import struct
+
+import faiss
+import numpy as np
+import pytest
+
+from index.store import Indexer, chunk_id
+
+
+@pytest.fixture
+def populated(unit_vectors, make_docs, make_indexer):
+    """`populated(index_type, dim)`: an index holding a.md, b.md and c.md."""
+
+    def make(index_type="FlatIP", dim=8):
+        rng = np.random.default_rng(0)
+        idx = make_indexer(index_type=index_type)
+        idx.rebuild()
+        idx.dim = dim
+        idx.index = idx._make_index()
+        if not idx.index.is_trained:
+            idx.train(unit_vectors(rng, 200, dim))
+        vecs = {}
+        for name, n in (("a.md", 3), ("b.md", 4), ("c.md", 2)):
+            vecs[name] = unit_vectors(rng, n, dim)
+            idx.add(vecs[name], make_docs(name, n))
+        return idx, vecs
+
+    return make
+
+
+@pytest.mark.parametrize("index_type", ["FlatIP", "HNSW", "IVF4,Flat"])
+def test_delete_and_upsert_keep_faiss_and_sqlite_in_sync(
+    populated, unit_vectors, make_docs, index_type
+):
+    idx, vecs = populated(index_type=index_type)
+    b_ids = {chunk_id("/data/b.md", i) for i in range(4)}
+    assert idx.stats().ntotal == 9
+
+    assert idx.delete("/data/b.md") == 4
+    assert idx.stats().ntotal == 5
+    hits = idx.search_batch(vecs["b.md"], top_k=5, nprobe=4)
+    for row in hits:
+        assert len(row) == 5
+        assert not {hid for hid, _ in row} & b_ids
+    assert idx.fetch_metadata(sorted(b_ids)) == []
+    assert idx.select_ids("name=b.md").size == 0
+    assert idx.search_lexical(["b"]) == [[]]
+
+    # a shorter new version of a.md replaces all three old chunks
+    new = unit_vectors(np.random.default_rng(5), 2, 8)
+    ids = idx.upsert(new, make_docs("a.md", 2, version=1))
+    assert ids.tolist() == [chunk_id("/data/a.md", i) for i in range(2)]
+    assert idx.stats().ntotal == 4
+    meta = idx.fetch_metadata([chunk_id("/data/a.md", i) for i in range(3)])
+    assert sorted(m["text"] for m in meta) == ["a.md part0 rev1", "a.md part1 rev1"]
+    top = idx.search(new[1], top_k=1, nprobe=4)
+    assert top[0][0] == ids[1]
+    # only c.md still has first-revision text
+    rev0 = idx.search_lexical(["rev0"], top_k=10)[0]
+    assert {hid for hid, _ in rev0} == {chunk_id("/data/c.md", i) for i in range(2)}
+
+
+def test_log_replay_is_idempotent(tmp_path, populated, make_docs, make_indexer):
+    idx, vecs = populated(index_type="HNSW")
+    idx.delete("/data/c.md")
+    idx.upsert(vecs["a.md"][:1] * -1, make_docs("a.md", 1, version=1))
+    query = vecs["b.md"]
+    expected = idx.search_batch(query, top_k=4)
+
+    # a fresh process rebuilds the same state from the log
+    reopened = make_indexer(index_type="HNSW")
+    reopened.load()
+    assert reopened.stats().ntotal == 5
+    assert reopened.search_batch(query, top_k=4) == expected
+
+    # a crash between checkpoint and log removal replays everything again
+    shutil.copy(idx.log_path, tmp_path / "saved.log")
+    idx.flush()
+    shutil.copy(tmp_path / "saved.log", idx.log_path)
+    again = make_indexer(index_type="HNSW")
+    again.load()
+    assert again.stats().ntotal == 5
+    assert again.search_batch(query, top_k=4) == expected
+
+
+def test_log_replay_removes_ids_once(
+    monkeypatch, populated, make_docs, make_indexer
+):
+    idx, vecs = populated()
+    idx.flush()
+    # b.md is replaced, deleted and re-added; c.md deleted after an upsert
+    idx.upsert(vecs["b.md"] * -1, make_docs("b.md", 4, version=1))
+    idx.delete("/data/b.md")
+    idx.add(vecs["b.md"][:2], make_docs("b.md", 2, version=2))
+    idx.upsert(vecs["c.md"] * -1, make_docs("c.md", 2, version=1))
+    idx.delete("/data/c.md")
+    expected = idx.search_batch(np.vstack(list(vecs.values())), top_k=5)
+
+    calls = []
+    remove = Indexer._remove_from_index
+    monkeypatch.setattr(
+        Indexer,
+        "_remove_from_index",
+        lambda self, ids: calls.append(len(ids)) or remove(self, ids),
+    )
+    reopened = make_indexer()
+    reopened.load()
+    assert calls == [6]
+    assert reopened.stats().ntotal == 5
+    assert reopened.search_batch(np.vstack(list(vecs.values())), top_k=5) == expected
+
+
+def test_legacy_positional_index_is_converted(unit_vectors, make_docs, make_indexer):
+    rng = np.random.default_rng(1)
+    vecs = unit_vectors(rng, 4, 8)
+    idx = make_indexer()
+    legacy = faiss.IndexFlatIP(8)
+    legacy.add(vecs[:3])
+    faiss.write_index(legacy, idx.faiss_path)
+    # one batch appended in the old "<first id, rows, dim>" record format
+    with open(idx.log_path, "wb") as f:
+        f.write(struct.pack("<qii", 3, 1, 8))
+        f.write(vecs[3:].tobytes())
+
+    idx.load()
+    assert isinstance(idx.index, faiss.IndexIDMap2)
+    assert [idx.search(v, top_k=1)[0][0] for v in vecs] == [0, 1, 2, 3]
+    # new chunks get stable ids next to the positional ones
+    ids = idx.add(unit_vectors(rng, 1, 8), make_docs("new.md", 1))
+    assert idx.stats().ntotal == 5
+    assert ids[0] == chunk_id("/data/new.md", 0)
+
+
+def test_mmap_rows_follow_replaced_chunks(unit_vectors, make_docs, make_indexer):
+    rng = np.random.default_rng(2)
+    idx = make_indexer(embedding_format="mmap")
+    idx.rebuild()
+    first = unit_vectors(rng, 3, 8)
+    ids = idx.add(first, make_docs("a.md", 3)).tolist()
+    second = unit_vectors(rng, 3, 8)
+    assert idx.upsert(second, make_docs("a.md", 3, version=1)).tolist() == ids
+    mat, valid = idx.fetch_embedding_matrix(ids)
+    assert valid.all()
+    np.testing.assert_allclose(mat, second, atol=1e-6)
@@ -2,18 +2,70 @@
 
 from __future__ import annotations
 
+import threading
+import time
+
 import streamlit as st
 from pathlib import Path
-from index.store import Indexer
+from index import FilterError
+from index.shards import open_indexer
 from reasoner.reasoner import Reasoner
+from embed.encoder import Embedder
 from export import Exporter, Report
-from pipeline import Pipeline
+from jobs import JobManager, ingest_folder, rebuild_index
+from server import MicroBatcher
+
+
+# Shared across reruns and browser sessions. The embedder and reasoner load
+# once; the reasoner's index is reloaded in place when the index on disk
+# changes. Long-running work goes to a single background job thread that
+# reuses the same embedder.
+@st.cache_resource
+def get_embedder() -> MicroBatcher:
+    # concurrent sessions share one encoder thread that batches their queries
+    return MicroBatcher(Embedder())
+
+
+@st.cache_resource
+def get_index_files():
+    # never loaded; only stats the index files to detect changes
+    return open_indexer()
+
+
+@st.cache_resource
+def get_reasoner() -> Reasoner:
+    # loaded by current_reasoner() on first use
+    return Reasoner(indexer=open_indexer(), embedder=get_embedder())
+
+
+@st.cache_resource
+def get_loaded_version() -> dict:
+    return {"version": None, "lock": threading.Lock()}
+
+
+@st.cache_resource
+def get_jobs() -> JobManager:
+    return JobManager()
+
+
+def current_reasoner() -> Reasoner:
+    """The shared reasoner, reloaded in place when the index on disk changes."""
+    reasoner = get_reasoner()
+    loaded = get_loaded_version()
+    version = get_index_files().version()
+    with loaded["lock"]:
+        if loaded["version"] != version:
+            reasoner.reload()
+            loaded["version"] = version
+    return reasoner
 
 
 st.set_page_config(page_title="Deep Researcher Agent")
 
 st.title("Deep Researcher Agent — Local Research Tool")
 
+jobs = get_jobs()
+
 uploaded = st.file_uploader(
     "Upload documents (PDF/MD/TXT/HTML)", accept_multiple_files=True
 )
@@ -23,24 +75,27 @@ if st.button("Ingest uploaded"):
     pdir.mkdir(parents=True, exist_ok=True)
     for f in uploaded:
         p = pdir / f.name
-        with open(p, "wb") as out:
-            out.write(f.getbuffer())
-    pl = Pipeline()
-    n = pl.run_folder(pdir, recursive=False)
-    st.success(f"Ingested and indexed {n} chunks")
+        with open(p, "wb") as dst:
+            dst.write(f.getbuffer())
+    jobs.submit(
+        "Ingest uploaded",
+        ingest_folder,
+        pdir,
+        recursive=False,
+        embedder=get_embedder(),
+    )
 
 if st.button("Build index"):
-    # Rebuild (empty) index and show stats
-    idx = Indexer()
-    with st.spinner("Rebuilding index..."):
-        idx.rebuild()
-    st.success("Index created (empty). You can ingest documents to add vectors.")
+    # Rebuild (empty) index; runs after any queued ingestion
+    jobs.submit("Rebuild index", rebuild_index)
 
 st.sidebar.title("Index")
-idx = Indexer()
-idx.load()
-stats = idx.stats()
+reasoner = current_reasoner()
+with reasoner.reading():
+    stats = reasoner.indexer.stats()
 st.sidebar.write(f"Vectors in index: {stats.ntotal}")
+for name, n in stats.shards.items():
+    st.sidebar.caption(f"{name}: {n}")
 
 q = st.text_input("Query")
 topk = st.number_input("Top-k", min_value=1, max_value=50, value=5)
@@ -51,26 +106,62 @@ mmr_lambda = st.slider(
 candidate_mult = st.number_input(
     "Candidate multiplier", min_value=1, max_value=20, value=5
 )
+lexical_weight = st.slider(
+    "Keyword (BM25) weight", min_value=0.0, max_value=1.0, value=0.0
+)
+rescore = st.checkbox("Exact re-score (quantized indexes)", value=False)
+filter_expr = st.text_input(
+    "Filter (optional)", placeholder="source^=/contracts and ext=md"
+)
 
 if st.button("Ask") and q:
-    idx = Indexer()
-    idx.load()
-    reasoner = Reasoner(indexer=idx)
-    out = reasoner.answer(
-        q,
-        top_k=topk,
-        mmr_enabled=mmr_enabled,
-        mmr_lambda=mmr_lambda,
-        candidate_multiplier=candidate_mult,
-    )
-    st.subheader("Synthesis")
-    st.text(out["synthesis"])
-    st.subheader("Traces")
-    for t in out["traces"]:
-        st.markdown(f"**Subquery:** {t['subquery']}")
-        for h in t.get("hits", []):
-            src = h.get("meta", {}).get("source", "unknown")
-            st.markdown(f"- {src} — {h.get('score'):.3f}\n  - {h.get('text')[:300]}...")
+    reasoner = current_reasoner()
+    out = None
+    try:
+        # other sessions may reload the shared reasoner meanwhile
+        with reasoner.reading():
+            out = reasoner.answer(
+                q,
+                top_k=topk,
+                mmr_enabled=mmr_enabled,
+                mmr_lambda=mmr_lambda,
+                candidate_multiplier=candidate_mult,
+                filter_expr=filter_expr or None,
+                lexical_weight=lexical_weight,
+                rescore=rescore,
+            )
+    except FilterError as e:
+        st.error(f"Invalid filter: {e}")
+    if out is not None:
+        st.subheader("Synthesis")
+        st.text(out["synthesis"])
+        timings = out["traces"][0].get("spans", []) if out["traces"] else []
+        if timings:
+            st.subheader("Timings")
+            st.caption(
+                "Milliseconds per stage; stages with sub-queries > 1 were one "
+                "call shared by all of them. Cached answers show the run that "
+                "computed them."
+            )
+            st.table(
+                [
+                    {
+                        "stage": s["stage"],
+                        "start ms": round(s["start_ms"], 2),
+                        "ms": round(s["ms"], 2),
+                        "sub-queries": s.get("batch", ""),
+                    }
+                    for s in timings
+                ]
+            )
+        st.subheader("Traces")
+        for t in out["traces"]:
+            st.markdown(f"**Subquery:** {t['subquery']}")
+            for h in t.get("hits", []):
+                src = h.get("meta", {}).get("source", "unknown")
+                st.markdown(
+                    f"- {src} — {h.get('score'):.3f}\n  - {h.get('text')[:300]}..."
+                )
 
 if st.button("Export PDF demo"):
     exp = Exporter()
@@ -79,11 +170,42 @@ if st.button("Export PDF demo"):
     st.success("Exported output/report.pdf")
 
 if st.button("Build index from sample_data"):
-    pdir = Path("sample_data")
-    pl = Pipeline()
-    with st.spinner("Ingesting and indexing..."):
-        n = pl.run_folder(pdir, recursive=False)
-    st.success(f"Indexed {n} chunks")
-    idx = Indexer()
-    idx.load()
-    st.sidebar.write(f"Vectors in index: {idx.stats().ntotal}")
+    jobs.submit(
+        "Ingest sample_data",
+        ingest_folder,
+        Path("sample_data"),
+        embedder=get_embedder(),
+    )
+
+latency = current_reasoner().metrics.snapshot()["stages"]
+if latency:
+    st.sidebar.title("Query latency")
+    st.sidebar.table(
+        [
+            {
+                "stage": stage,
+                "n": row["count"],
+                "p50 ms": round(row["p50_ms"], 1),
+                "p95 ms": round(row["p95_ms"], 1),
+                "p99 ms": round(row["p99_ms"], 1),
+            }
+            for stage, row in latency.items()
+        ]
+    )
+
+st.sidebar.title("Jobs")
+for job in jobs.jobs()[:5]:
+    label = f"{job.name}: {job.status}"
+    if job.total:
+        label += f" ({job.done}/{job.total} files)"
+    if job.message:
+        label += f", {job.message}"
+    if job.status == "failed":
+        st.sidebar.error(f"{label}\n\n{job.error}")
+    else:
+        st.sidebar.progress(job.fraction, text=label)
+
+# poll while a job is queued or running; widgets stay usable in between
+if jobs.active():
+    time.sleep(1.0)
+    (getattr(st, "rerun", None) or st.experimental_rerun)()